@@ -0,0 +1,115 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+FindMind-benchmark.py
+Version 1.0.0.0
+
+以本地 FinMind 替身伺服器 (finmind_stub_server.py) 執行
+FindMind-fetch_and_save_stock_data.py 的 main()，量測抓取吞吐量：
+總請求數、每秒請求數、p50/p99 請求延遲與總耗時。
+在臨時工作目錄中執行，不會修改倉庫內的數據文件，也不需要真實的 API token。
+
+python FindMind-benchmark.py --rows 50 --latency 0.05 --workers 8
+"""
+import argparse
+import importlib.util
+import math
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from finmind_stub_server import DATA_PATH, SHEET_PATH, StubConfig, start_stub_server
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+FETCH_SCRIPT = os.path.join(REPO_DIR, "FindMind-fetch_and_save_stock_data.py")
+
+
+def percentile(values, fraction):
+    """回傳已排序列表的百分位數 (最近排名法)"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))
+    return values[index]
+
+
+def prepare_sheet(sheet_file, rows, work_dir):
+    """複製競標名單 (可限制行數)，並回傳其中的股票代碼作為全市場查詢的股票列表"""
+    data = pd.read_csv(sheet_file, encoding="utf-8")
+    if rows > 0:
+        data = data.head(rows)
+    local_sheet = os.path.join(work_dir, "benchmark_sheet.csv")
+    data.to_csv(local_sheet, index=False, encoding="utf-8")
+    universe = [str(stock_id).split(".")[0] for stock_id in data["股票代號"].dropna().unique()]
+    return local_sheet, universe
+
+
+def load_fetch_module():
+    spec = importlib.util.spec_from_file_location("findmind_fetch", FETCH_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FindMind-fetch_and_save_stock_data.py against a local stub server")
+    parser.add_argument("--sheet", default=os.path.join(REPO_DIR, "auction_data.csv"), help="auction sheet CSV to serve")
+    parser.add_argument("--rows", type=int, default=0, help="only use the first N sheet rows (0 = all)")
+    parser.add_argument("--latency", type=float, default=0.02, help="mean stub latency per request in seconds")
+    parser.add_argument("--quota-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 402")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+    parser.add_argument("--replay-dir", help="response cache directory with recorded responses")
+    parser.add_argument("--workers", type=int, default=1, help="FINDMIND_MAX_WORKERS")
+    parser.add_argument("--backend", default="threads", choices=["threads", "asyncio"], help="FINDMIND_BACKEND")
+    parser.add_argument("--work-dir", help="directory for the output files (default: a new temporary directory)")
+    args = parser.parse_args()
+
+    work_dir = os.path.abspath(args.work_dir or tempfile.mkdtemp(prefix="findmind-benchmark-"))
+    os.makedirs(work_dir, exist_ok=True)
+    sheet_file, universe = prepare_sheet(args.sheet, args.rows, work_dir)
+
+    config = StubConfig(args.latency, args.quota_rate, args.error_rate,
+                        os.path.abspath(args.replay_dir) if args.replay_dir else None, sheet_file, universe)
+    server = start_stub_server(config)
+    host, port = server.server_address[:2]
+
+    # 基準測試環境：不限流、不使用快取、縮短重試等待；已設定的環境變數優先
+    os.environ.update({
+        "FINDMIND_API_URL": f"http://{host}:{port}{DATA_PATH}",
+        "FINDMIND_SHEET_URL": f"http://{host}:{port}{SHEET_PATH}",
+        "FINDMIND_GMAIL_TOKEN": "benchmark",
+        "FINDMIND_MAX_WORKERS": str(args.workers),
+        "FINDMIND_BACKEND": args.backend,
+        "FINDMIND_MANIFEST": os.path.join(work_dir, "fetch_manifest.sqlite"),
+        "FINDMIND_CACHE": "0",
+    })
+    for name, value in (("FINDMIND_RATE_PER_HOUR", "0"), ("FINDMIND_BACKOFF_BASE", "0.05"),
+                        ("FINDMIND_BACKOFF_MAX", "1"), ("FINDMIND_QUOTA_COOLDOWN", "1")):
+        os.environ.setdefault(name, value)
+
+    sys.path.insert(0, REPO_DIR)
+    fetch = load_fetch_module()
+    os.chdir(work_dir)
+    print(f"Running main() against {os.environ['FINDMIND_API_URL']} in {work_dir}")
+    started = time.perf_counter()
+    fetch.main()
+    wall_time = time.perf_counter() - started
+    server.shutdown()
+
+    latencies = sorted(fetch.get_client().get_latencies())
+    print("===== FinMind fetch benchmark =====")
+    print(f"Sheet rows:      {args.rows or 'all'} ({len(universe)} stocks)")
+    print(f"Backend:         {args.backend}, workers {args.workers}")
+    print(f"Stub settings:   latency {args.latency}s, quota rate {args.quota_rate}, error rate {args.error_rate}")
+    print(f"API requests:    {len(latencies)} (stub served {config.request_count})")
+    print(f"Wall time:       {wall_time:.2f}s")
+    print(f"Requests/sec:    {len(latencies) / wall_time if wall_time > 0 else 0:.1f}")
+    print(f"Latency p50:     {percentile(latencies, 0.50) * 1000:.1f} ms")
+    print(f"Latency p99:     {percentile(latencies, 0.99) * 1000:.1f} ms")
+    print(f"Output files in: {work_dir}")
+
+
+if __name__ == "__main__":
+    main()
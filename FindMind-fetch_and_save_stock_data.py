@@ -2,16 +2,32 @@
 # -*- coding: UTF-8 -*-
 """
 FindMind-fetch_and_save_stock_data.py
-Version 1.0.1.2
+Version 1.0.1.31
 根據 指南 version 1.0.1 生成
 
 從 FinMind API 獲取台灣股票數據並保存為 CSV 文件
 """
 import pandas as pd
 import requests
+import asyncio
 import csv
+import hashlib
+import json
 import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from dotenv import load_dotenv
+from finmind_client import AsyncFinMindClient, get_client, is_aiohttp_available
+from dataset_registry import MARKET_INDEX_HEADER, MARKET_INDEX_MARKETS, MARKET_INDEX_SPEC, get_dataset, get_datasets
+from fetch_manifest import PayloadHasher, get_manifest, parse_data_file_name
+from columnar_store import get_columnar_path, get_columnar_summary, is_columnar_enabled, is_columnar_only, write_columnar
+from local_store import get_store
+from trading_calendar import get_trading_calendar
 from datetime import datetime, timedelta
 
 # Force UTF-8 encoding for Python in Windows
@@ -20,64 +36,263 @@ os.environ["PYTHONIOENCODING"] = "utf-8"
 # Load secret .env file
 load_dotenv()
 
-def is_file_complete_with_end_date(output_file, end_date):
-    """檢查文件是否已存在並包含結束日期的數據"""
-    if not os.path.exists(output_file):
-        return False
-    
+def read_csv_tail_line(output_file, chunk_size=4096):
+    """只讀取文件結尾的區塊，回傳最後一個非空行 (已去除換行) 與換行符"""
+    with open(output_file, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        offset = max(0, size - chunk_size)
+        f.seek(offset)
+        tail = f.read()
+    newline = "\r\n" if tail.endswith(b"\r\n") else "\n"
+    lines = [line for line in tail.splitlines() if line.strip()]
+    # 區塊不是從文件開頭讀取時，第一行可能不完整，至少保留兩行才可信
+    if not lines or (offset > 0 and len(lines) < 2):
+        return None, newline
+    return lines[-1].decode("utf-8", errors="replace"), newline
+
+def read_csv_header(output_file):
+    """只讀取文件的標題行"""
+    with open(output_file, "r", newline="", encoding="utf-8-sig") as f:
+        return next(csv.reader(f), None)
+
+def get_stored_file(output_file):
+    """實際保存數據的文件：FINDMIND_COLUMNAR=only 時為對應的 Parquet 文件，否則為 CSV 文件本身"""
+    if is_columnar_only():
+        columnar_file = get_columnar_path(output_file)
+        if columnar_file:
+            return columnar_file
+    return output_file
+
+def get_last_stored_date(output_file, header=None):
+    """
+    取得文件中最後一筆數據的日期，只讀取標題行與文件結尾
+
+    Parameters:
+    - output_file: CSV 文件路徑
+    - header: 預期的標題行，不符時回傳 None；未提供時只要求第一欄為「日期」
+
+    Returns:
+        str: 最後一筆數據的日期 (YYYY-MM-DD)，無法判斷時為 None
+    """
+    stored_file = get_stored_file(output_file)
+    if not os.path.exists(stored_file):
+        return None
     try:
-        # 讀取 CSV 文件
-        df = pd.read_csv(output_file, encoding="utf-8")
-        
-        # 檢查是否為空文件或不包含日期列
-        if df.empty or "日期" not in df.columns:
-            return False
-        
-        # 檢查是否包含結束日期數據
-        if end_date in df["日期"].values:
-            print(f"文件 {output_file} 已包含結束日期 {end_date} 的數據，跳過 API 請求")
-            return True
-        
-        return False
+        if stored_file != output_file:
+            row_count, columns, last_date = get_columnar_summary(stored_file)
+            if header is not None and columns != header:
+                return None
+            return last_date if row_count else None
+        stored_header = read_csv_header(output_file)
+        if header is not None and stored_header != header:
+            return None
+        if header is None and (not stored_header or stored_header[0] != "日期"):
+            return None
+        last_line, _ = read_csv_tail_line(output_file)
+        if not last_line:
+            return None
+        last_date = last_line.split(",", 1)[0].strip()
+        if re.match(r"^\d{4}-\d{2}-\d{2}$", last_date):
+            return last_date
+        return None
     except Exception as e:
-        print(f"檢查文件時發生錯誤: {e}")
+        print(f"讀取文件結尾時發生錯誤: {e}")
+        return None
+
+def has_csv_data_rows(output_file, required_columns):
+    """只讀取標題行與文件結尾，檢查文件包含必要欄位且至少有一行數據"""
+    stored_file = get_stored_file(output_file)
+    if stored_file != output_file:
+        summary = get_columnar_summary(stored_file)
+        return bool(summary) and summary[0] > 0 and all(column in summary[1] for column in required_columns)
+    header = read_csv_header(output_file)
+    if not header or any(column not in header for column in required_columns):
         return False
+    last_line, _ = read_csv_tail_line(output_file)
+    return bool(last_line) and next(csv.reader([last_line])) != header
 
-def fetch_and_save_TWSE_TPEX(api_token, start_date, end_date, output_file):
+def record_fetch(dataset, stock_id, output_file, records=None, last_data_date=None, row_count=None,
+                 error=None, start_date=None, end_date=None, http_status=None, payload_hash=None):
     """
-    獲取並保存台灣證券交易所(TWSE)和證券櫃檯買賣中心(TPEX)的指數數據
-    
-    Parameters:
-    - api_token: FinMind API 令牌
-    - start_date: 開始日期 (格式: YYYY-MM-DD)
-    - end_date: 結束日期 (格式: YYYY-MM-DD)
-    - output_file: 輸出 CSV 文件路徑
+    將抓取結果寫入 manifest，紀錄鍵的期間預設取自輸出文件名
+
+    manifest 無法使用時只印出錯誤，不影響抓取流程。
     """
-    # 確保輸出文件路徑有效
-    if not output_file:
-        print("錯誤：輸出文件路徑無效")
+    manifest = get_manifest()
+    if manifest is None:
         return
-        
-    # 確保目錄存在
-    directory = os.path.dirname(output_file)
-    if directory:  # 只有當目錄非空時才創建
-        os.makedirs(directory, exist_ok=True)
+    if start_date is None or end_date is None:
+        parsed = parse_data_file_name(os.path.basename(output_file))
+        if not parsed:
+            return
+        start_date, end_date = parsed[1], parsed[2]
+    if http_status is None:
+        response = getattr(error, "response", None)
+        http_status = response.status_code if response is not None else get_client().get_last_status()
+    try:
+        manifest.record(dataset, stock_id, start_date, end_date, output_file=output_file, records=records,
+                        last_data_date=last_data_date, row_count=row_count, http_status=http_status,
+                        payload_hash=payload_hash)
+    except sqlite3.Error as e:
+        print(f"寫入 manifest 時發生錯誤: {e}")
+
+def get_recorded_row_count(dataset, stock_id, output_file):
+    """從 manifest 取得文件目前的數據行數，未知時為 None"""
+    manifest = get_manifest()
+    parsed = parse_data_file_name(os.path.basename(output_file))
+    if manifest is None or not parsed:
+        return None
+    entry = manifest.lookup(dataset, stock_id, parsed[1], parsed[2])
+    return entry["row_count"] if entry else None
+
+def is_file_complete_with_end_date(output_file, end_date):
+    """檢查文件是否已存在並包含結束日期的數據 (只讀取標題行與文件結尾，數據依日期排序)"""
+    if not os.path.exists(get_stored_file(output_file)):
+        return False
     
-    # 檢查文件是否已經包含結束日期
-    if is_file_complete_with_end_date(output_file, end_date):
-        return
+    # 檢查是否為空文件或不包含日期列
+    last_date = get_last_stored_date(output_file)
+    if not last_date:
+        return False
+    
+    # 檢查是否包含結束日期數據
+    if last_date >= end_date:
+        print(f"文件 {output_file} 已包含結束日期 {end_date} 的數據，跳過 API 請求")
+        return True
+    
+    return False
+
+@contextmanager
+def open_atomic(output_file, newline=""):
+    """
+    以暫存文件寫入，成功後再以 os.replace 取代目標文件；
+    寫入過程中發生錯誤或程序中斷時，不會留下寫到一半的文件
+    """
+    temp_file = f"{output_file}.tmp"
+    try:
+        with open(temp_file, "w", newline=newline, encoding="utf-8") as f:
+            yield f
+        os.replace(temp_file, output_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+def remove_stale_temp_files(directories):
+    """刪除上次執行中斷時留下的暫存文件"""
+    removed = 0
+    for directory in directories:
+        if not os.path.isdir(directory):
+            continue
+        for file_name in os.listdir(directory):
+            if file_name.endswith(".tmp"):
+                os.remove(os.path.join(directory, file_name))
+                removed += 1
+    if removed:
+        print(f"Removed {removed} stale temporary files from an interrupted run")
+
+def append_csv_frame(output_file, frame):
+    """以複製至暫存文件後再取代的方式，原子性地在 CSV 文件結尾附加 DataFrame 的數據行"""
+    _, newline = read_csv_tail_line(output_file)
+    temp_file = f"{output_file}.tmp"
+    try:
+        shutil.copyfile(output_file, temp_file)
+        with open(temp_file, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(newline.encode("utf-8"))
+        with open(temp_file, "a", newline="", encoding="utf-8") as csvfile:
+            frame.to_csv(csvfile, index=False, header=False, lineterminator=newline)
+        os.replace(temp_file, output_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+def is_streaming_enabled():
+    """從環境變數 FINDMIND_STREAMING 判斷大型回應是否邊接收邊寫入，預設停用"""
+    return os.getenv("FINDMIND_STREAMING", "0") == "1"
+
+def write_streamed_csv(output_file, records, header, to_row):
+    """
+    邊接收邊寫入 CSV：第一筆紀錄到達時才建立文件 (經由暫存文件原子性寫入)，
+    不在記憶體中保留整個回應
+
+    Returns:
+        tuple: (寫入行數, 最後數據日期, 回應數據的雜湊)
+    """
+    hasher = PayloadHasher()
+    row_count = 0
+    last_date = None
+    with ExitStack() as stack:
+        writer = None
+        for record in records:
+            if writer is None:
+                writer = csv.writer(stack.enter_context(open_atomic(output_file)))
+                writer.writerow(header)
+            writer.writerow(to_row(record))
+            hasher.update(record)
+            row_count += 1
+            date = str(record.get("date"))
+            if last_date is None or date > last_date:
+                last_date = date
+    return row_count, last_date, hasher.hexdigest()
+
+def is_incremental_enabled():
+    """FINDMIND_INCREMENTAL=0 時停用增量更新，改為重新下載整個期間"""
+    return os.getenv("FINDMIND_INCREMENTAL", "1") != "0"
+
+def get_incremental_start(output_file, header, start_date, end_date, report=True):
+    """
+    決定請求的開始日期：文件已有部分數據時只請求缺少的尾段 (report 為 False 時不列印訊息)
+
+    Returns:
+        tuple: (請求開始日期, 文件最後日期或 None)
+    """
+    if not is_incremental_enabled():
+        return start_date, None
+    last_date = get_last_stored_date(output_file, header)
+    if not last_date or last_date < start_date or last_date >= end_date:
+        return start_date, None
+    next_date = (datetime.strptime(last_date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    if report:
+        print(f"文件 {output_file} 已有數據至 {last_date}，只請求 {next_date} 至 {end_date}")
+    return next_date, last_date
 
+# TWSE/TPEX 指數欄位 (收盤指數、開盤價、最高價、最低價、漲跌點數、漲跌幅)，取自數據集登錄表
+MARKET_INDEX_KEYS = MARKET_INDEX_SPEC.header
+
+# 全市場共用的指數數據庫，每次執行只針對缺少的日期範圍請求 API
+MARKET_INDEX_FILE = f"{MARKET_INDEX_SPEC.directory}/market_index.csv"
+market_index = {}
+
+def index_market_records(records):
+    """按日期建立字典，方便後續合併"""
+    return {
+        record['date']: {title: record.get(field) for field, title in MARKET_INDEX_SPEC.columns}
+        for record in records
+    }
+
+def fetch_market_index_records(api_token, start_date, end_date):
+    """
+    從 API 獲取 TWSE (TAIEX) 和 TPEX (TPEx) 指數數據
+
+    Returns:
+        dict: 日期 -> 12 個指數欄位值的列表，無數據時為空字典
+    """
     # 市場對應的數據集和索引識別符
     markets = {
-        "TWSE": {"dataset": "TaiwanStockPrice", "data_id": "TAIEX"},
-        "TPEX": {"dataset": "TaiwanStockPrice", "data_id": "TPEx"}
+        market_name: {"dataset": "TaiwanStockPrice", "data_id": data_id}
+        for market_name, data_id in MARKET_INDEX_MARKETS.items()
     }
 
     # 存儲每個市場的數據
     market_data = {}
 
     for market_name, market_info in markets.items():
-        url = "https://api.finmindtrade.com/api/v4/data"
         params = {
             "dataset": market_info["dataset"],
             "data_id": market_info["data_id"],
@@ -87,32 +302,26 @@ def fetch_and_save_TWSE_TPEX(api_token, start_date, end_date, output_file):
         }
 
         try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
+            if is_streaming_enabled():
+                # 串流模式：紀錄直接併入日期字典，不保留完整的紀錄列表
+                response = get_client().stream_data(params)
+                market_data[market_name] = index_market_records(response)
+                msg = response.msg
+            else:
+                data = get_client().get_data(params)
+                msg = data.get("msg")
+                market_data[market_name] = index_market_records(data.get("data", []) if msg == "success" else [])
 
-            if data.get("msg") != "success":
-                print(f"Error for {market_name}: {data.get('msg', 'Unknown error')}")
+            if msg != "success":
+                print(f"Error for {market_name}: {msg or 'Unknown error'}")
+                del market_data[market_name]
                 continue
 
-            records = data.get("data", [])
-            if not records:
+            if not market_data[market_name]:
                 print(f"No data returned for {market_name}.")
+                del market_data[market_name]
                 continue
 
-            # 按日期建立字典，方便後續合併
-            market_data[market_name] = {
-                record['date']: {
-                    '收盤指數': record.get('close'),
-                    '開盤價': record.get('open'),
-                    '最高價': record.get('max'),
-                    '最低價': record.get('min'),
-                    '漲跌點數': record.get('spread'),
-                    '漲跌幅': record.get('spread_ratio')
-                }
-                for record in records
-            }
-
         except requests.RequestException as e:
             print(f"HTTP Request error for {market_name}: {e}")
             continue
@@ -123,35 +332,155 @@ def fetch_and_save_TWSE_TPEX(api_token, start_date, end_date, output_file):
     # 如果沒有任何數據，則返回
     if not market_data:
         print("No data retrieved for either TWSE or TPEX.")
-        return
+        return {}
 
-    # 找出所有日期的聯合集
+    # 找出所有日期的聯合集，如果該日期沒有數據則填充 None
     all_dates = sorted(set.union(*[set(market.keys()) for market in market_data.values()]))
+    return {
+        date: [market_data.get(market, {}).get(date, {}).get(key, None)
+               for market in MARKET_INDEX_MARKETS for key in MARKET_INDEX_KEYS]
+        for date in all_dates
+    }
 
-    # 寫入 CSV 文件
-    with open(output_file, "w", newline="", encoding="utf-8") as csvfile:
+def write_market_index_csv(output_file, rows_by_date):
+    """將指數數據依日期排序寫入 CSV 文件"""
+    with open_atomic(output_file) as csvfile:
         writer = csv.writer(csvfile)
+        writer.writerow(MARKET_INDEX_HEADER)
+        for date in sorted(rows_by_date):
+            writer.writerow([date] + list(rows_by_date[date]))
+
+def load_market_index(index_file=MARKET_INDEX_FILE):
+    """讀取指數數據庫至記憶體 (日期 -> 欄位值)"""
+    market_index.clear()
+    if not os.path.exists(index_file):
+        return market_index
+    try:
+        with open(index_file, "r", newline="", encoding="utf-8") as csvfile:
+            reader = csv.reader(csvfile)
+            header = next(reader, None)
+            if header != MARKET_INDEX_HEADER:
+                print(f"指數數據庫 {index_file} 格式不正確，將重新建立")
+                return market_index
+            for row in reader:
+                if row:
+                    market_index[row[0]] = row[1:]
+    except Exception as e:
+        print(f"讀取指數數據庫時發生錯誤: {e}")
+        market_index.clear()
+    return market_index
+
+def update_market_index(api_token, start_date, end_date, index_file=MARKET_INDEX_FILE):
+    """
+    以所有競標期間的聯集更新指數數據庫，只請求庫中尚未涵蓋的頭尾日期範圍
+
+    頭尾日期先以交易日曆 (trading_calendar.py) 對齊到最近的交易日再與庫中的日期比較：
+    開始日期是週末或假日時，該段範圍沒有指數數據，不應在每次執行都重新請求。
+
+    Parameters:
+    - api_token: FinMind API 令牌
+    - start_date: 所有期間中最早的開始日期 (格式: YYYY-MM-DD)
+    - end_date: 所有期間中最晚的結束日期 (格式: YYYY-MM-DD)
+    - index_file: 指數數據庫 CSV 文件路徑
+    """
+    load_market_index(index_file)
+
+    missing_ranges = []
+    if not market_index:
+        missing_ranges.append((start_date, end_date))
+    else:
+        stored_first = min(market_index)
+        stored_last = max(market_index)
+        calendar = get_trading_calendar(first_year=int(start_date[:4]), last_year=int(end_date[:4]))
+        first_session = str(calendar.offset(start_date, 0, roll="forward"))
+        last_session = str(calendar.offset(end_date, 0, roll="backward"))
+        if first_session < stored_first:
+            day_before = (datetime.strptime(stored_first, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+            missing_ranges.append((start_date, day_before))
+        if last_session > stored_last:
+            day_after = (datetime.strptime(stored_last, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+            missing_ranges.append((day_after, end_date))
+
+    if not missing_ranges:
+        print(f"指數數據庫已涵蓋 {start_date} 至 {end_date}，跳過 API 請求")
+        return market_index
+
+    updated = False
+    for range_start, range_end in missing_ranges:
+        print(f"Updating market index for {range_start} to {range_end}")
+        rows_by_date = fetch_market_index_records(api_token, range_start, range_end)
+        record_fetch("TWSE_TPEX", "TAIEX/TPEx", index_file, records=rows_by_date,
+                     last_data_date=max(rows_by_date) if rows_by_date else None, row_count=len(rows_by_date),
+                     start_date=range_start, end_date=range_end)
+        for date, values in rows_by_date.items():
+            market_index[date] = values
+            updated = True
+        store = get_store()
+        if store is not None and rows_by_date:
+            try:
+                store.upsert_market_index(rows_by_date)
+            except sqlite3.Error as e:
+                print(f"寫入本地數據庫 {store.path} 時發生錯誤: {e}")
+
+    if updated:
+        directory = os.path.dirname(index_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        write_market_index_csv(index_file, market_index)
+        print(f"Market index updated in {index_file} ({len(market_index)} dates)")
+    return market_index
+
+def get_market_index_window(start_date, end_date):
+    """從記憶體中的指數數據庫取出指定期間的數據 (日期 -> 欄位值)"""
+    return {date: values for date, values in market_index.items() if start_date <= date <= end_date}
+
+def is_per_stock_market_index_enabled():
+    """FINDMIND_TWSE_TPEX_PER_STOCK=1 時才為每個競標期間另存一份指數文件"""
+    return os.getenv("FINDMIND_TWSE_TPEX_PER_STOCK", "0") == "1"
+
+def fetch_and_save_TWSE_TPEX(api_token, start_date, end_date, output_file):
+    """
+    獲取並保存台灣證券交易所(TWSE)和證券櫃檯買賣中心(TPEX)的指數數據
+    
+    若指數數據庫已載入，直接從庫中切出該期間，不再請求 API。
+    
+    Parameters:
+    - api_token: FinMind API 令牌
+    - start_date: 開始日期 (格式: YYYY-MM-DD)
+    - end_date: 結束日期 (格式: YYYY-MM-DD)
+    - output_file: 輸出 CSV 文件路徑
+    """
+    # 確保輸出文件路徑有效
+    if not output_file:
+        print("錯誤：輸出文件路徑無效")
+        return
         
-        # 寫入標題行
-        writer.writerow([
-            "日期", 
-            "TWSE收盤指數", "TWSE開盤價", "TWSE最高價", "TWSE最低價", "TWSE漲跌點數", "TWSE漲跌幅",
-            "TPEX收盤指數", "TPEX開盤價", "TPEX最高價", "TPEX最低價", "TPEX漲跌點數", "TPEX漲跌幅"
-        ])
-        
-        # 寫入數據
-        for date in all_dates:
-            row = [date]
-            
-            # 添加 TWSE 數據，如果該日期沒有數據則填充 None
-            for key in ['收盤指數', '開盤價', '最高價', '最低價', '漲跌點數', '漲跌幅']:
-                row.append(market_data.get('TWSE', {}).get(date, {}).get(key, None))
-            
-            # 添加 TPEX 數據，如果該日期沒有數據則填充 None
-            for key in ['收盤指數', '開盤價', '最高價', '最低價', '漲跌點數', '漲跌幅']:
-                row.append(market_data.get('TPEX', {}).get(date, {}).get(key, None))
-            
-            writer.writerow(row)
+    # 確保目錄存在
+    directory = os.path.dirname(output_file)
+    if directory:  # 只有當目錄非空時才創建
+        os.makedirs(directory, exist_ok=True)
+    
+    # 檢查文件是否已經包含結束日期
+    if is_file_complete_with_end_date(output_file, end_date):
+        return
+
+    if market_index:
+        rows_by_date = get_market_index_window(start_date, end_date)
+    else:
+        rows_by_date = fetch_market_index_records(api_token, start_date, end_date)
+
+    # 如果沒有任何數據，則返回
+    if not rows_by_date:
+        return
+
+    # 寫入 CSV 文件
+    write_market_index_csv(output_file, rows_by_date)
+    store = get_store()
+    if store is not None:
+        try:
+            store.record_window(output_file)
+        except sqlite3.Error as e:
+            print(f"寫入本地數據庫 {store.path} 時發生錯誤: {e}")
 
     print(f"Data successfully written to {output_file}")
 
@@ -187,342 +516,507 @@ def is_date_within_two_months(check_date, reference_date=None):
         print(f"Invalid date format: {check_date}")
         return False
 
-def fetch_and_save_stock_financialstatements(api_token, stock_id, start_date, end_date, output_file):
-    """獲取並保存財務報表數據"""
-    # 確保輸出文件路徑有效
-    if not output_file:
-        print("錯誤：輸出文件路徑無效")
+def is_window_closed(end_date, reference_date=None):
+    """
+    期間是否已結束超過兩個月 (結束日期早於參考日期 60 天以前)
+
+    與 is_date_within_two_months 不同，結束日期在兩個月後的未來期間不算已結束。
+    """
+    try:
+        end = datetime.strptime(end_date, "%Y-%m-%d")
+        reference = datetime.now() if reference_date is None else datetime.strptime(reference_date, "%Y-%m-%d")
+    except ValueError:
+        print(f"Invalid date format: {end_date}")
+        return False
+    return end < reference - timedelta(days=60)
+
+def records_to_frame(spec, records):
+    """
+    將 API 紀錄一次轉為依登錄表欄位排列的 DataFrame
+
+    只保留登錄的欄位 (紀錄中缺少的欄位為空值)，依 spec.dtypes 轉換型別
+    (轉換失敗時保留原值)，再把欄位名稱換成 CSV 標題。
+    """
+    frame = pd.DataFrame.from_records(records, columns=spec.fields)
+    for field, dtype in spec.dtypes.items():
+        try:
+            frame[field] = pd.to_numeric(frame[field]).astype(dtype)
+        except (TypeError, ValueError):
+            pass
+    frame.columns = spec.header
+    return frame
+
+def write_csv_frame(output_file, frame):
+    """原子性地將整個 DataFrame 寫入 CSV 文件 (與 csv.writer 相同的 \\r\\n 換行)"""
+    with open_atomic(output_file) as csvfile:
+        frame.to_csv(csvfile, index=False, lineterminator="\r\n")
+
+def save_dataset_frame(spec, output_file, frame, append=False):
+    """
+    保存數據集的 DataFrame：FINDMIND_COLUMNAR=only 時只寫入 Parquet，
+    =1 時同時寫入 CSV 與 Parquet，否則只寫入 CSV；
+    設定 FINDMIND_STORE 時另外 upsert 至本地整合數據庫
+
+    Parameters:
+    - spec: 數據集描述 (DatasetSpec)
+    - output_file: CSV 輸出文件路徑
+    - frame: records_to_frame 產生的 DataFrame
+    - append: 附加在既有數據之後
+    """
+    if not is_columnar_only():
+        if append:
+            append_csv_frame(output_file, frame)
+        else:
+            write_csv_frame(output_file, frame)
+    store = get_store()
+    if store is not None:
+        try:
+            store.upsert_frame(spec, frame)
+            store.record_window(output_file, frame, append=append)
+        except sqlite3.Error as e:
+            print(f"寫入本地數據庫 {store.path} 時發生錯誤: {e}")
+    if not is_columnar_enabled():
         return
-        
+    columnar_file = get_columnar_path(output_file)
+    try:
+        if append and not is_columnar_only() and columnar_file and not os.path.exists(columnar_file):
+            # 啟用列式存儲前已存在的 CSV 文件：以附加後的完整 CSV 建立 Parquet 文件
+            stored = pd.read_csv(output_file, encoding="utf-8", dtype=str)
+            stored.columns = spec.fields
+            frame, append = records_to_frame(spec, stored.to_dict("records")), False
+        write_columnar(spec, output_file, frame, append=append)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"寫入列式存儲 {columnar_file} 時發生錯誤: {e}")
+
+def is_recent_window_file_fresh(spec, stock_id, end_date, output_file):
+    """recent_window 策略：文件有數據且開標日期不在今兩個月內時，不需要重新請求"""
+    if not end_date:
+        return False
+    required_columns = [title for field, title in spec.columns if field in ("stock_id", "date")]
+    if not os.path.exists(get_stored_file(output_file)):
+        return False
+    try:
+        # 檢查文件是否為空或不包含必要列 (只讀取標題行與文件結尾)
+        if not has_csv_data_rows(output_file, required_columns):
+            print(f"文件 {output_file} 為空或格式不正確，將重新獲取數據")
+        elif not is_date_within_two_months(end_date):
+            print(f"文件 {output_file} 已包含股票代碼 {stock_id} 的數據，且開標日期非在今兩個月範圍內，跳過 API 請求")
+            return True
+    except Exception as e:
+        print(f"檢查{spec.label}文件時發生錯誤: {e}")
+    return False
+
+def is_dataset_file_fresh(spec, stock_id, end_date, output_file):
+    """依數據集的新鮮度策略 (spec.freshness) 檢查文件是否已是最新，只讀取標題行與文件結尾"""
+    if spec.freshness == "end_date":
+        return is_file_complete_with_end_date(output_file, end_date)
+    return is_recent_window_file_fresh(spec, stock_id, end_date, output_file)
+
+def save_streamed_dataset(spec, params, stock_id, output_file):
+    """以串流方式請求數據集並逐筆寫入文件"""
+    response = get_client().stream_data(params)
+    row_count, last_date, payload_hash = write_streamed_csv(output_file, response, spec.header, spec.to_row)
+    if response.msg != "success":
+        print(f"Error: {response.msg or 'Unknown error'}")
+        record_fetch(spec.name, stock_id, output_file)
+        return False
+    if not row_count:
+        print(f"No data returned for the given parameters on {spec.label}.")
+        record_fetch(spec.name, stock_id, output_file, payload_hash=payload_hash)
+        return False
+    print(f"Data successfully written to {output_file}")
+    record_fetch(spec.name, stock_id, output_file, payload_hash=payload_hash, last_data_date=last_date,
+                 row_count=row_count)
+    return True
+
+# 全表快照 (例如 TaiwanStockInfo)：每次執行每個數據集最多請求一次，並在 TTL 內重複使用磁碟快取
+dataset_snapshots = {}
+dataset_snapshots_lock = threading.Lock()
+
+def is_snapshot_enabled():
+    """FINDMIND_STOCK_INFO_SNAPSHOT=0 時改回逐股請求"""
+    return os.getenv("FINDMIND_STOCK_INFO_SNAPSHOT", "1") != "0"
+
+def index_snapshot_records(records):
+    """將全表數據依股票代碼分組，保留原始順序"""
+    indexed = {}
+    for record in records:
+        indexed.setdefault(str(record.get("stock_id")), []).append(record)
+    return indexed
+
+def get_dataset_snapshot(spec, api_token):
+    """
+    取得依股票代碼索引的全表快照
+
+    快照文件 (spec.snapshot_file) 在 FINDMIND_STOCK_INFO_TTL 秒 (預設 86400) 內直接使用，
+    否則請求一次全表 (不帶 data_id)。請求失敗時退回過期的快照。
+
+    Returns:
+        dict: 股票代碼 -> 數據列表；停用或無法取得時為 None
+    """
+    if not is_snapshot_enabled():
+        return None
+    snapshot_file = spec.snapshot_file
+    with dataset_snapshots_lock:
+        if spec.name in dataset_snapshots:
+            return dataset_snapshots[spec.name] or None
+
+        try:
+            ttl = float(os.getenv("FINDMIND_STOCK_INFO_TTL", "86400"))
+        except ValueError:
+            ttl = 86400
+        cached_records = None
+        if os.path.exists(snapshot_file):
+            try:
+                with open(snapshot_file, "r", encoding="utf-8") as f:
+                    cached_records = json.load(f)
+                if time.time() - os.path.getmtime(snapshot_file) < ttl:
+                    print(f"Using {spec.name} snapshot {snapshot_file} ({len(cached_records)} records)")
+                    dataset_snapshots[spec.name] = index_snapshot_records(cached_records)
+                    return dataset_snapshots[spec.name]
+            except (OSError, ValueError) as e:
+                print(f"讀取 {spec.name} 快照時發生錯誤: {e}")
+                cached_records = None
+
+        params = {
+            "dataset": spec.name,
+            "token": api_token
+        }
+        records = None
+        try:
+            data = get_client().get_data(params)
+            if data.get("msg") == "success" and data.get("data"):
+                records = data["data"]
+            else:
+                print(f"{spec.name} snapshot error: {data.get('msg', 'Unknown error')}")
+        except (requests.RequestException, ValueError) as e:
+            print(f"{spec.name} snapshot request error: {e}")
+
+        if records is None:
+            if cached_records is None:
+                # 記錄失敗，之後的呼叫直接改用逐股請求
+                dataset_snapshots[spec.name] = {}
+                return None
+            print(f"Falling back to the expired {spec.name} snapshot")
+            records = cached_records
+        else:
+            directory = os.path.dirname(snapshot_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_file = f"{snapshot_file}.tmp"
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(records, f, ensure_ascii=False)
+            os.replace(temp_file, snapshot_file)
+            print(f"Saved {spec.name} snapshot to {snapshot_file} ({len(records)} records)")
+
+        dataset_snapshots[spec.name] = index_snapshot_records(records)
+        return dataset_snapshots[spec.name]
+
+def get_dataset_request(spec, api_token, stock_id, start_date, end_date, output_file, report=True):
+    """
+    fetch_and_save_dataset 的前半段：依新鮮度策略檢查文件，並決定請求參數
+    (incremental 的數據集只請求缺少的尾段；report 為 False 時不列印訊息)
+
+    Returns:
+        tuple: (請求參數, 文件最後日期或 None)；文件已是最新時為 None
+    """
     # 確保目錄存在
     directory = os.path.dirname(output_file)
     if directory:  # 只有當目錄非空時才創建
         os.makedirs(directory, exist_ok=True)
-    
-    # 檢查文件是否已存在
-    if os.path.exists(output_file):
-        # 如果提供了結束日期，檢查是否在有效期內
-        if end_date:
-            # 讀取現有文件
-            try:
-                df = pd.read_csv(output_file, encoding="utf-8")
-                
-                # 檢查文件是否為空或不包含必要列
-                if df.empty or "股票代碼" not in df.columns or "日期" not in df.columns:
-                    print(f"文件 {output_file} 為空或格式不正確，將重新獲取數據")
-                else:
-                    # 檢查日期範圍
-                    if not is_date_within_two_months(end_date):
-                        print(f"文件 {output_file} 已包含股票代碼 {stock_id} 的數據，且開標日期非在今兩個月範圍內，跳過 API 請求")
-                        return True
-            
-            except Exception as e:
-                print(f"檢查financial文件時發生錯誤: {e}")
-
-    url = "https://api.finmindtrade.com/api/v4/data"
-    params = {
-        "dataset": "TaiwanStockFinancialStatements",
-        "data_id": stock_id,
-        "start_date": start_date,
-        "end_date": end_date,
-        "token": api_token
-    }
-    try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
 
-        if data.get("msg") != "success":
-            print(f"Error: {data.get('msg', 'Unknown error')}")
-            return
+    # 依新鮮度策略檢查文件是否已是最新
+    if is_dataset_file_fresh(spec, stock_id, end_date, output_file):
+        return None
 
-        records = data.get("data", [])
-        if not records:
-            print("No data returned for the given parameters on financialstatements.")
-            return
+    fetch_start, last_date = start_date, None
+    if spec.incremental:
+        fetch_start, last_date = get_incremental_start(output_file, spec.header, start_date, end_date, report=report)
+    return spec.build_params(api_token, stock_id, fetch_start, end_date), last_date
 
-        with open(output_file, "w", newline="", encoding="utf-8") as csvfile:
-            writer = csv.writer(csvfile)
-       
-            writer.writerow(["日期", "股票代碼", "類型", "值", "名稱"])
-            for record in records:
-                writer.writerow([
-                    record.get("date"), record.get("stock_id"), record.get("type"),
-                    record.get("value"), record.get("origin_name")
-                ])
-        print(f"Data successfully written to {output_file}")
-    except requests.RequestException as e:
-        print(f"HTTP Request error: {e}")
-    except ValueError as e:
-        print(f"Error processing response: {e}")
+def save_dataset_response(spec, stock_id, output_file, data, last_date, http_status=None):
+    """
+    fetch_and_save_dataset 的後半段：檢查 API 回應，寫入或附加文件並記錄 manifest
 
-def fetch_and_save_stock_company_profile(api_token, stock_id, output_file, end_date=None):
+    Parameters:
+    - data: API 回應 ({"msg": ..., "data": [...]})
+    - last_date: 增量更新時文件的最後日期，只保留之後的紀錄
+    - http_status: 回應的 HTTP 狀態碼，None 時取目前線程最後一次請求的狀態碼
+
+    Returns:
+        bool: 成功寫入時為 True
     """
-    獲取並保存公司基本資料
-    
+    if data.get("msg") != "success":
+        print(f"Error: {data.get('msg', 'Unknown error')}")
+        record_fetch(spec.name, stock_id, output_file, http_status=http_status)
+        return False
+
+    records = data.get("data", [])
+    if last_date:
+        records = [record for record in records if str(record.get("date")) > last_date]
+    if not records:
+        print(f"No data returned for the given parameters on {spec.label}.")
+        record_fetch(spec.name, stock_id, output_file, records=records, last_data_date=last_date,
+                     http_status=http_status)
+        return False
+
+    frame = records_to_frame(spec, records)
+    last_data_date = max(str(record.get("date")) for record in records)
+    if last_date:
+        previous_count = get_recorded_row_count(spec.name, stock_id, output_file)
+        save_dataset_frame(spec, output_file, frame, append=True)
+        print(f"Appended {len(frame)} rows to {output_file}")
+        record_fetch(spec.name, stock_id, output_file, records=records, last_data_date=last_data_date,
+                     row_count=previous_count + len(frame) if previous_count is not None else None,
+                     http_status=http_status)
+        return True
+
+    save_dataset_frame(spec, output_file, frame)
+    print(f"Data successfully written to {output_file}")
+    record_fetch(spec.name, stock_id, output_file, records=records, last_data_date=last_data_date,
+                 row_count=len(frame), http_status=http_status)
+    return True
+
+def fetch_and_save_dataset(spec, api_token, stock_id, start_date, end_date, output_file):
+    """
+    依數據集登錄表 (dataset_registry.py) 獲取並保存單一股票單一期間的數據
+
+    依 spec.freshness 判斷文件是否需要更新；incremental 的數據集只附加缺少的尾段，
+    有 snapshot_file 的數據集從全表快照切出，其餘經由 request_dataset 請求
+    (共用連線池、限流、快取與合併範圍)。
+
     Parameters:
+    - spec: 數據集描述 (DatasetSpec)
     - api_token: FinMind API 令牌
     - stock_id: 股票代碼
+    - start_date: 開始日期 (格式: YYYY-MM-DD)
+    - end_date: 結束日期 (格式: YYYY-MM-DD)
     - output_file: 輸出 CSV 文件路徑
-    - end_date: 結束日期 (可選，用於日期範圍檢查)
+
+    Returns:
+        bool: 文件已是最新或已成功寫入時為 True
     """
     # 確保輸出文件路徑有效
     if not output_file:
         print("錯誤：輸出文件路徑無效")
         return False
-        
-    # 確保目錄存在
-    directory = os.path.dirname(output_file)
-    if directory:  # 只有當目錄非空時才創建
-        os.makedirs(directory, exist_ok=True)
-    
-    # 檢查文件是否已存在
-    if os.path.exists(output_file):
-        # 如果提供了結束日期，檢查是否在有效期內
-        if end_date:
-            # 讀取現有文件
-            try:
-                df = pd.read_csv(output_file, encoding="utf-8")
-                
-                # 檢查文件是否為空或不包含必要列
-                if df.empty or "股票代碼" not in df.columns or "日期" not in df.columns:
-                    print(f"文件 {output_file} 為空或格式不正確，將重新獲取數據")
-                else:
-                    # 檢查日期範圍
-                    if not is_date_within_two_months(end_date):
-                        print(f"文件 {output_file} 已包含股票代碼 {stock_id} 的數據，且開標日期非在今兩個月範圍內，跳過 API 請求")
-                        return True
-            
-            except Exception as e:
-                print(f"檢查公司概況文件時發生錯誤: {e}")
-    
-    # 發送 API 請求獲取公司基本資料
-    url = "https://api.finmindtrade.com/api/v4/data"
-    params = {
-        "dataset": "TaiwanStockInfo",
-        "data_id": stock_id,
-        "token": api_token
-    }
-    
-    try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
 
-        if data.get("msg") != "success":
-            print(f"Error: {data.get('msg', 'Unknown error')}")
-            return False
+    request = get_dataset_request(spec, api_token, stock_id, start_date, end_date, output_file)
+    if request is None:
+        return True
+    params, last_date = request
+    try:
+        # 優先從全表快照取出，快照無法使用時才逐股請求
+        snapshot = get_dataset_snapshot(spec, api_token) if spec.snapshot_file else None
+        http_status = None
+        if snapshot is not None:
+            data = {"msg": "success", "data": snapshot.get(str(stock_id), [])}
+            http_status = 200
+        else:
+            # 列式存儲與本地數據庫需要完整的 DataFrame，啟用時不串流寫入
+            if (spec.streaming and is_streaming_enabled() and not is_columnar_enabled() and get_store() is None
+                    and find_coalesced_range(params) is None):
+                return save_streamed_dataset(spec, params, stock_id, output_file)
 
-        records = data.get("data", [])
-        if not records:
-            print("No data returned for the given parameters on company_profile.")
-            return False
+            data = request_dataset(params)
 
-        # 寫入 CSV 文件
-        with open(output_file, "w", newline="", encoding="utf-8") as csvfile:
-            writer = csv.writer(csvfile)
-       
-            writer.writerow(["行業類別", "股票代碼", "股票名稱", "類型", "日期"])
-            for record in records:
-                writer.writerow([
-                    record.get("industry_category"), record.get("stock_id"), record.get("stock_name"),
-                    record.get("type"), record.get("date")
-                ])
-        
-        print(f"Data successfully written to {output_file}")
-        return True
-    
+        return save_dataset_response(spec, stock_id, output_file, data, last_date, http_status)
     except requests.RequestException as e:
         print(f"HTTP Request error: {e}")
+        record_fetch(spec.name, stock_id, output_file, error=e)
         return False
     except ValueError as e:
         print(f"Error processing response: {e}")
+        record_fetch(spec.name, stock_id, output_file, error=e)
         return False
 
-def fetch_and_save_stock_dividend(api_token, stock_id, start_date, end_date, output_file):
-    """獲取並保存股息數據"""
-    # 確保輸出文件路徑有效
-    if not output_file:
-        print("錯誤：輸出文件路徑無效")
-        return
-        
-    # 確保目錄存在
-    directory = os.path.dirname(output_file)
-    if directory:  # 只有當目錄非空時才創建
-        os.makedirs(directory, exist_ok=True)
-    
-    # 檢查文件是否已存在
-    if os.path.exists(output_file):
-        # 如果提供了結束日期，檢查是否在有效期內
-        if end_date:
-            # 讀取現有文件
-            try:
-                df = pd.read_csv(output_file, encoding="utf-8")
-                
-                # 檢查文件是否為空或不包含必要列
-                if df.empty or "股票代碼" not in df.columns or "日期" not in df.columns:
-                    print(f"文件 {output_file} 為空或格式不正確，將重新獲取數據")
-                else:
-                    # 檢查日期範圍
-                    if not is_date_within_two_months(end_date):
-                        print(f"文件 {output_file} 已包含股票代碼 {stock_id} 的數據，且開標日期非在今兩個月範圍內，跳過 API 請求")
-                        return True
-            
-            except Exception as e:
-                print(f"檢查Dividend文件時發生錯誤: {e}")
-
-    url = "https://api.finmindtrade.com/api/v4/data"
-    params = {
-        "dataset": "TaiwanStockDividend",
-        "data_id": stock_id,
-        "start_date": start_date,
-        "end_date": end_date,
-        "token": api_token
-    }
+async def fetch_and_save_dataset_async(http, executor, spec, api_token, stock_id, start_date, end_date, output_file):
+    """
+    fetch_and_save_dataset 的 asyncio 版本：請求在事件循環上經由 AsyncFinMindClient 進行，
+    只有文件檢查與寫入交由線程池執行 (不串流寫入)
+    """
+    loop = asyncio.get_running_loop()
+    request = await loop.run_in_executor(executor, get_dataset_request, spec, api_token, stock_id, start_date,
+                                         end_date, output_file)
+    if request is None:
+        return True
+    params, last_date = request
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-
-        if data.get("msg") != "success":
-            print(f"Error: {data.get('msg', 'Unknown error')}")
-            return
-
-        records = data.get("data", [])
-        if not records:
-            print("No data returned for the given parameters on dividend.")
-            return
-
-        with open(output_file, "w", newline="", encoding="utf-8") as csvfile:
-            writer = csv.writer(csvfile)
-       
-            
-            writer.writerow(["日期", "股票代碼", "年", "股票收益分配", "股票法定盈餘","股票除息交易日","員工股票股利額","員工股票股利總額","員工股票紅利佔總股本比例","員工股票股利比例","現金盈餘分配","現金法定盈餘","現金除息交易日","現金股利支付日","員工現金紅利總額","現金資本增加總數","現金增加認購利率","現金增加認購價","董事、監事報酬","參與分配股份總數","公告日期","公告時間"])
-            for record in records:
-                writer.writerow([
-                    record.get("date"), record.get("stock_id"), record.get("year"),
-                    record.get("StockEarningsDistribution"), record.get("StockStatutorySurplus"),record.get("StockExDividendTradingDate"),record.get("TotalEmployeeStockDividend"),
-                    record.get("TotalEmployeeStockDividendAmount"),record.get("RatioOfEmployeeStockDividendOfTotal"),record.get("RatioOfEmployeeStockDividend"),record.get("CashEarningsDistribution"),
-                    record.get("CashStatutorySurplus"),record.get("CashExDividendTradingDate"), record.get("CashDividendPaymentDate"),record.get("TotalEmployeeCashDividend"),
-                    record.get("TotalNumberOfCashCapitalIncrease"),record.get("CashIncreaseSubscriptionRate"), record.get("CashIncreaseSubscriptionpRrice"),record.get("RemunerationOfDirectorsAndSupervisors"),
-                    record.get("ParticipateDistributionOfTotalShares"),record.get("AnnouncementDate"), record.get("AnnouncementTime")
-                ])
-        print(f"Data successfully written to {output_file}")
+        # 全表快照每次執行最多請求一次，沿用同步版本
+        snapshot = (await loop.run_in_executor(executor, get_dataset_snapshot, spec, api_token)
+                    if spec.snapshot_file else None)
+        if snapshot is not None:
+            data, http_status = {"msg": "success", "data": snapshot.get(str(stock_id), [])}, 200
+        else:
+            data, http_status = await request_dataset_async(http, params)
+        return await loop.run_in_executor(executor, save_dataset_response, spec, stock_id, output_file, data,
+                                          last_date, http_status)
     except requests.RequestException as e:
         print(f"HTTP Request error: {e}")
+        record_fetch(spec.name, stock_id, output_file, error=e)
+        return False
     except ValueError as e:
         print(f"Error processing response: {e}")
+        record_fetch(spec.name, stock_id, output_file, error=e)
+        return False
+
+def is_bulk_price_enabled():
+    """FINDMIND_BULK_PRICE=1 時以全市場單日查詢更新股價文件"""
+    return os.getenv("FINDMIND_BULK_PRICE", "0") == "1"
+
+def get_bulk_trading_dates(last_date, end_date, today=None):
+    """列出 last_date 之後至 min(end_date, 今天) 的平日 (假日由 API 回傳空數據處理)"""
+    if today is None:
+        today = datetime.now().strftime("%Y-%m-%d")
+    current = datetime.strptime(last_date, "%Y-%m-%d") + timedelta(days=1)
+    last = datetime.strptime(min(end_date, today), "%Y-%m-%d")
+    dates = []
+    while current <= last:
+        if current.weekday() < 5:
+            dates.append(current.strftime("%Y-%m-%d"))
+        current += timedelta(days=1)
+    return dates
+
+def fetch_and_save_stock_data_bulk(api_token, windows, max_days=None):
+    """
+    以全市場單日 TaiwanStockPrice 查詢 (不帶 data_id) 更新所有未完成的股價文件
+
+    每個新交易日只發出一次請求，再把各股票的數據分送到需要該日期的文件。
+    缺少天數超過 max_days 的文件交由逐股請求處理。
 
-def fetch_and_save_stock_PER_PBR(api_token, stock_id, start_date, end_date, output_file):
-    """獲取並保存本益比/淨值比數據"""
-    # 確保輸出文件路徑有效
-    if not output_file:
-        print("錯誤：輸出文件路徑無效")
-        return
-        
-    # 確保目錄存在
-    directory = os.path.dirname(output_file)
-    if directory:  # 只有當目錄非空時才創建
-        os.makedirs(directory, exist_ok=True)
-    
-    # 檢查文件是否已經包含結束日期
-    if is_file_complete_with_end_date(output_file, end_date):
-        return
+    Parameters:
+    - api_token: FinMind API 令牌
+    - windows: (stock_id, start_date, end_date) 的列表
+    - max_days: 單一文件最多以全市場查詢補齊的交易日數，預設為 FINDMIND_BULK_MAX_DAYS
 
-    url = "https://api.finmindtrade.com/api/v4/data"
-    params = {
-        "dataset": "TaiwanStockPER",
-        "data_id": stock_id,
-        "start_date": start_date,
-        "end_date": end_date,
-        "token": api_token
-    }
-    try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
+    Returns:
+        set: 已由全市場查詢處理完畢、不需再逐股請求的輸出文件
+    """
+    if max_days is None:
+        try:
+            max_days = int(os.getenv("FINDMIND_BULK_MAX_DAYS", "5"))
+        except ValueError:
+            max_days = 5
+    spec = get_dataset("TaiwanStockPrice")
 
-        if data.get("msg") != "success":
-            print(f"Error: {data.get('msg', 'Unknown error')}")
-            return
+    # 日期 -> 需要該日期的文件；文件 -> (股票代碼, 最後日期, 需要的日期)
+    files_by_date = {}
+    pending = {}
+    for stock_id, start_date, end_date in windows:
+        output_file = spec.output_file(stock_id, start_date, end_date)
+        if output_file in pending:
+            continue
+        last_date = get_last_stored_date(output_file, spec.header)
+        if not last_date or last_date >= end_date:
+            continue
+        dates = get_bulk_trading_dates(last_date, end_date)
+        if len(dates) > max_days:
+            continue
+        pending[output_file] = (stock_id, last_date, dates)
+        for date in dates:
+            files_by_date.setdefault(date, []).append(output_file)
 
-        records = data.get("data", [])
-        if not records:
-            print("No data returned for the given parameters on PER_PBR.")
-            return
+    if not pending:
+        return set()
 
-        with open(output_file, "w", newline="", encoding="utf-8") as csvfile:
-            writer = csv.writer(csvfile)
-       
-            writer.writerow(["日期", "股票代碼", "股息殖利率", "PER", "PBR"])
+    print(f"Bulk price mode: {len(pending)} files need {len(files_by_date)} trading dates")
+    records_by_file = {output_file: [] for output_file in pending}
+    failed_files = set()
+    # 全市場查詢有回傳數據的日期 (其餘為休市日)
+    trading_dates = set()
+    for date in sorted(files_by_date):
+        params = {
+            "dataset": spec.name,
+            "start_date": date,
+            "end_date": date,
+            "token": api_token
+        }
+        # 只保留需要的股票，串流模式下其餘紀錄解析後即丟棄
+        needed = {str(pending[output_file][0]) for output_file in files_by_date[date]}
+        try:
+            if is_streaming_enabled():
+                response = get_client().stream_data(params)
+                records = response
+            else:
+                data = get_client().get_data(params)
+                records = data.get("data", [])
+            records_by_stock = {}
+            returned = 0
             for record in records:
-                writer.writerow([
-                    record.get("date"), record.get("stock_id"), record.get("dividend_yield"),
-                    record.get("PER"), record.get("PBR")
-                ])
-        print(f"Data successfully written to {output_file}")
-    except requests.RequestException as e:
-        print(f"HTTP Request error: {e}")
-    except ValueError as e:
-        print(f"Error processing response: {e}")
+                returned += 1
+                if str(record.get("stock_id")) in needed:
+                    records_by_stock[str(record.get("stock_id"))] = record
+            msg = response.msg if is_streaming_enabled() else data.get("msg")
+            if msg != "success":
+                print(f"Bulk price error for {date}: {msg or 'Unknown error'}")
+                failed_files.update(files_by_date[date])
+                continue
+        except (requests.RequestException, ValueError) as e:
+            print(f"Bulk price request error for {date}: {e}")
+            failed_files.update(files_by_date[date])
+            continue
 
-def fetch_and_save_stock_data(api_token, stock_id, start_date, end_date, output_file):
-    """獲取並保存股價數據"""
-    # 確保輸出文件路徑有效
-    if not output_file:
-        print("錯誤：輸出文件路徑無效")
-        return
-        
-    # 確保目錄存在
-    directory = os.path.dirname(output_file)
-    if directory:  # 只有當目錄非空時才創建
-        os.makedirs(directory, exist_ok=True)
-    
-    # 檢查文件是否已經包含結束日期
-    if is_file_complete_with_end_date(output_file, end_date):
-        return
+        if returned:
+            trading_dates.add(date)
+        print(f"Bulk price {date}: {len(records_by_stock)} of {len(needed)} needed stocks returned")
+        for output_file in files_by_date[date]:
+            record = records_by_stock.get(str(pending[output_file][0]))
+            if record:
+                records_by_file[output_file].append(record)
 
-    url = "https://api.finmindtrade.com/api/v4/data"
-    params = {
-        "dataset": "TaiwanStockPrice",
-        "data_id": stock_id,
-        "start_date": start_date,
-        "end_date": end_date,
-        "token": api_token
-    }
+    handled = set()
+    for output_file, (stock_id, last_date, dates) in pending.items():
+        if output_file in failed_files:
+            continue
+        records = records_by_file[output_file]
+        with get_file_lock(output_file):
+            if records:
+                previous_count = get_recorded_row_count(spec.name, stock_id, output_file)
+                save_dataset_frame(spec, output_file, records_to_frame(spec, records), append=True)
+                print(f"Appended {len(records)} rows to {output_file}")
+                record_fetch(spec.name, stock_id, output_file, records=records,
+                             last_data_date=str(records[-1].get("date")),
+                             row_count=previous_count + len(records) if previous_count is not None else None)
+                handled.add(output_file)
+            elif not trading_dates.intersection(dates):
+                # 需要的日期全市場都沒有數據 (休市日)，文件已是最新
+                handled.add(output_file)
+            else:
+                # 全市場查詢中沒有此股票的數據 (例如暫停交易或回應缺漏)，改由逐股請求確認
+                print(f"Bulk price returned no rows for {output_file}, falling back to a per-stock request")
+    return handled
+
+# 上次下載競標名單時的 ETag / Last-Modified 與內容雜湊
+SHEET_STATE_FILE = ".auction_sheet_state.json"
+
+def load_sheet_state(state_file=SHEET_STATE_FILE):
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
+        with open(state_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-        if data.get("msg") != "success":
-            print(f"Error: {data.get('msg', 'Unknown error')}")
-            return
+def download_google_sheet(url, output_file, state_file=SHEET_STATE_FILE):
+    """
+    從 Google Sheets 下載數據
 
-        records = data.get("data", [])
-        if not records:
-            print("No data returned for the given parameters.")
-            return
+    以 If-None-Match / If-Modified-Since 發出條件請求；伺服器回傳 304，
+    或下載內容的雜湊與本地文件相同時，不覆寫本地文件。
 
-        with open(output_file, "w", newline="", encoding="utf-8") as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(["日期", "股票代碼", "成交量", "成交金額", "開盤價", "最高價", "最低價", "收盤價", "漲跌幅", "交易筆數"])
-            for record in records:
-                writer.writerow([
-                    record.get("date"), record.get("stock_id"), record.get("Trading_Volume"),
-                    record.get("Trading_money"), record.get("open"), record.get("max"),
-                    record.get("min"), record.get("close"), record.get("spread"),
-                    record.get("Trading_turnover")
-                ])
-        print(f"Data successfully written to {output_file}")
-    except requests.RequestException as e:
-        print(f"HTTP Request error: {e}")
-    except ValueError as e:
-        print(f"Error processing response: {e}")
+    Returns:
+        bool: 本地文件內容是否有變更
+    """
+    state = load_sheet_state(state_file) if os.path.exists(output_file) else {}
+    headers = {}
+    if state.get("etag"):
+        headers["If-None-Match"] = state["etag"]
+    if state.get("last_modified"):
+        headers["If-Modified-Since"] = state["last_modified"]
 
-def download_google_sheet(url, output_file):
-    """從 Google Sheets 下載數據"""
-    response = requests.get(url)
+    response = requests.get(url, headers=headers)
+    if response.status_code == 304:
+        print(f"Google Sheet not modified, keeping {output_file}")
+        return False
     response.raise_for_status()
 
     # Decode raw content explicitly as UTF-8
@@ -530,11 +1024,31 @@ def download_google_sheet(url, output_file):
     #print("Raw Response Sample (First 500 Chars):")
     #print(raw_text[:500])
 
-    with open(output_file, 'w', encoding='utf-8') as f:
+    content_hash = hashlib.sha256(response.content).hexdigest()
+    new_state = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "sha256": content_hash,
+    }
+    try:
+        with open(state_file, "w", encoding="utf-8") as f:
+            json.dump(new_state, f)
+    except OSError as e:
+        print(f"Error saving sheet state: {e}")
+
+    if os.path.exists(output_file):
+        with open(output_file, "rb") as f:
+            local_hash = hashlib.sha256(f.read()).hexdigest()
+        if local_hash == content_hash:
+            print(f"Google Sheet content unchanged, keeping {output_file}")
+            return False
+
+    with open_atomic(output_file) as f:
         f.write(raw_text)
     print(f"Downloaded Google Sheet to {output_file}")
 
     validate_saved_file(output_file)
+    return True
 
 def validate_saved_file(file_path):
     """驗證保存的文件"""
@@ -545,6 +1059,14 @@ def validate_saved_file(file_path):
     except Exception as e:
         print(f"Error reading saved file: {e}")
 
+def read_text_file(file_path):
+    """讀取文本文件 (保留換行符)，不存在時回傳 None"""
+    try:
+        with open(file_path, "r", encoding="utf-8", newline="") as f:
+            return f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+
 def validate_and_process_csv(file_path):
     """驗證和處理 CSV 文件"""
     try:
@@ -553,13 +1075,663 @@ def validate_and_process_csv(file_path):
         #print("First 5 rows:")
         #print(data.head())
 
-        data.to_csv("cleaned_auction_data.csv", index=False, encoding="utf-8")
-        print("Saved cleaned data to 'cleaned_auction_data.csv'.")
+        # 內容相同時不重寫，保留文件時間戳
+        cleaned_text = data.to_csv(index=False)
+        if read_text_file("cleaned_auction_data.csv") == cleaned_text:
+            print("'cleaned_auction_data.csv' is unchanged.")
+        else:
+            with open_atomic("cleaned_auction_data.csv") as f:
+                f.write(cleaned_text)
+            print("Saved cleaned data to 'cleaned_auction_data.csv'.")
         return data
     except Exception as e:
         print(f"Error reading or processing CSV file: {e}")
         return None
 
+# (dataset, data_id) -> 合併後的 [(start_date, end_date)]
+coalesced_ranges = {}
+# (dataset, data_id, start_date, end_date) -> 合併範圍的數據 (請求失敗時為 None)
+coalesced_results = {}
+coalesced_lock = threading.Lock()
+coalesced_range_locks = {}
+# asyncio 後端：合併範圍 -> 請求該範圍的任務
+coalesced_tasks = {}
+
+def is_coalesce_enabled():
+    """FINDMIND_COALESCE=0 時停用合併請求，每個期間各自請求"""
+    return os.getenv("FINDMIND_COALESCE", "1") != "0"
+
+def get_coalesced_datasets():
+    """依日期範圍請求、可合併的數據集"""
+    return [spec.name for spec in get_datasets() if spec.is_date_ranged]
+
+def merge_date_ranges(ranges):
+    """合併重疊或相鄰 (相差一天) 的日期範圍，日期格式為 YYYY-MM-DD"""
+    merged = []
+    for start_date, end_date in sorted(ranges):
+        if merged:
+            previous_end = datetime.strptime(merged[-1][1], "%Y-%m-%d")
+            if datetime.strptime(start_date, "%Y-%m-%d") <= previous_end + timedelta(days=1):
+                merged[-1][1] = max(merged[-1][1], end_date)
+                continue
+        merged.append([start_date, end_date])
+    return [tuple(date_range) for date_range in merged]
+
+def plan_coalesced_ranges(windows):
+    """
+    依股票分組競標期間，合併重疊或相鄰的期間
+
+    Parameters:
+    - windows: (stock_id, start_date, end_date) 的列表
+
+    Returns:
+        dict: 股票代碼 (字串) -> (不重複的期間列表, 合併後的範圍列表)
+    """
+    windows_by_stock = {}
+    for stock_id, start_date, end_date in windows:
+        stock_windows = windows_by_stock.setdefault(str(stock_id), [])
+        if (start_date, end_date) not in stock_windows:
+            stock_windows.append((start_date, end_date))
+    return {
+        stock_id: (stock_windows, merge_date_ranges(stock_windows))
+        for stock_id, stock_windows in windows_by_stock.items()
+    }
+
+def report_fetch_plan(windows):
+    """
+    列印合併前後的 API 請求數 (上限，未計入已完整文件的略過)
+
+    Returns:
+        tuple: (逐期間請求數, 合併後請求數)
+    """
+    plan = plan_coalesced_ranges(windows)
+    specs = get_datasets()
+    datasets = len(get_coalesced_datasets())
+    # 逐期間：每列所有數據集各一次 + TWSE/TPEX 兩個指數
+    naive_calls = len(windows) * (len(specs) + 2)
+    # 合併後：每個合併範圍的日期範圍數據集 + 每個全表快照一次 (其餘不帶日期的數據集逐列) + 兩個指數各一次
+    undated_calls = sum(1 if spec.snapshot_file else len(windows) for spec in specs if not spec.is_date_ranged)
+    planned_calls = sum(len(merged) for _, merged in plan.values()) * datasets + undated_calls + 2
+    print(f"Fetch plan: {len(windows)} rows, {len(plan)} stocks, "
+          f"{sum(len(merged) for _, merged in plan.values())} merged ranges")
+    for stock_id, (stock_windows, merged) in sorted(plan.items()):
+        if len(stock_windows) > len(merged):
+            print(f"  {stock_id}: {len(stock_windows)} windows -> {len(merged)} ranges {merged}")
+    print(f"Naive API calls: {naive_calls}, planned API calls: {planned_calls}")
+    return naive_calls, planned_calls
+
+def get_pending_range(spec, stock_id, start_date, end_date):
+    """
+    期間實際需要請求的日期範圍 (只讀取文件結尾)：已包含結束日期的文件為 None，
+    增量更新的數據集從文件最後日期的隔天開始，與 fetch_and_save_dataset 的請求範圍相同
+    """
+    output_file = spec.output_file(stock_id, start_date, end_date)
+    if spec.freshness == "end_date":
+        last_date = get_last_stored_date(output_file, spec.header)
+        if last_date and last_date >= end_date:
+            return None
+    if spec.incremental:
+        start_date, _ = get_incremental_start(output_file, spec.header, start_date, end_date, report=False)
+    return start_date, end_date
+
+def register_coalesced_ranges(windows):
+    """
+    登記多個期間合併後的請求範圍，只有實際被合併的範圍會被登記；
+    每個數據集以各文件實際需要的範圍 (增量更新時只有缺少的尾段) 合併，不請求已有的數據
+    """
+    coalesced_ranges.clear()
+    coalesced_results.clear()
+    plan = plan_coalesced_ranges(windows)
+    for spec in get_datasets():
+        if not spec.is_date_ranged:
+            continue
+        for stock_id, (stock_windows, _) in plan.items():
+            pending = [date_range for date_range in (get_pending_range(spec, stock_id, start_date, end_date)
+                                                     for start_date, end_date in stock_windows) if date_range]
+            shared = [
+                date_range for date_range in merge_date_ranges(pending)
+                if sum(1 for start_date, end_date in pending
+                       if date_range[0] <= start_date and end_date <= date_range[1]) > 1
+            ]
+            if shared:
+                coalesced_ranges[(spec.name, stock_id)] = shared
+
+def find_coalesced_range(params):
+    """回傳涵蓋請求期間的已登記合併範圍，沒有時為 None"""
+    key = (params.get("dataset"), str(params.get("data_id")))
+    for range_start, range_end in coalesced_ranges.get(key, []):
+        if range_start <= params.get("start_date") and params.get("end_date") <= range_end:
+            return range_start, range_end
+    return None
+
+def request_dataset(params):
+    """
+    發送數據集請求；若請求期間落在已登記的合併範圍內，
+    整個範圍只請求一次，再切出該期間的數據
+    """
+    dataset = params.get("dataset")
+    data_id = str(params.get("data_id"))
+    start_date = params.get("start_date")
+    end_date = params.get("end_date")
+    merged_range = find_coalesced_range(params)
+    if merged_range is None:
+        return get_client().get_data(params)
+
+    key = (dataset, data_id) + merged_range
+    with coalesced_lock:
+        range_lock = coalesced_range_locks.setdefault(key, threading.Lock())
+    with range_lock:
+        if key not in coalesced_results:
+            merged_params = dict(params, start_date=merged_range[0], end_date=merged_range[1])
+            print(f"Requesting merged range {dataset} {data_id} {merged_range[0]} to {merged_range[1]}")
+            try:
+                data = get_client().get_data(merged_params)
+                coalesced_results[key] = data.get("data", []) if data.get("msg") == "success" else None
+            except (requests.RequestException, ValueError) as e:
+                print(f"Merged range request error: {e}")
+                coalesced_results[key] = None
+        records = coalesced_results[key]
+
+    if records is None:
+        # 合併請求失敗時改為單獨請求該期間
+        return get_client().get_data(params)
+    return {
+        "msg": "success",
+        "status": 200,
+        "data": [record for record in records if start_date <= str(record.get("date")) <= end_date]
+    }
+
+async def fetch_merged_range_async(http, params, key):
+    """以 AsyncFinMindClient 請求整個合併範圍，失敗時結果為 None"""
+    dataset, data_id, range_start, range_end = key
+    print(f"Requesting merged range {dataset} {data_id} {range_start} to {range_end}")
+    try:
+        data, _ = await http.fetch(dict(params, start_date=range_start, end_date=range_end))
+        coalesced_results[key] = data.get("data", []) if data.get("msg") == "success" else None
+    except (requests.RequestException, ValueError) as e:
+        print(f"Merged range request error: {e}")
+        coalesced_results[key] = None
+    return coalesced_results[key]
+
+async def request_dataset_async(http, params):
+    """
+    request_dataset 的 asyncio 版本：同一合併範圍的協程共用一個請求任務
+
+    Returns:
+        tuple: (API 回應, HTTP 狀態碼)
+    """
+    merged_range = find_coalesced_range(params)
+    if merged_range is None:
+        return await http.fetch(params)
+
+    key = (params.get("dataset"), str(params.get("data_id"))) + merged_range
+    if key not in coalesced_tasks:
+        coalesced_tasks[key] = asyncio.ensure_future(fetch_merged_range_async(http, params, key))
+    records = await coalesced_tasks[key]
+
+    if records is None:
+        # 合併請求失敗時改為單獨請求該期間
+        return await http.fetch(params)
+    start_date, end_date = params.get("start_date"), params.get("end_date")
+    return {
+        "msg": "success",
+        "status": 200,
+        "data": [record for record in records if start_date <= str(record.get("date")) <= end_date]
+    }, 200
+
+# 每個輸出文件一把鎖，確保並行模式下同一文件不會被同時寫入
+file_locks = {}
+file_locks_guard = threading.Lock()
+
+def get_file_lock(output_file):
+    """取得輸出文件對應的鎖"""
+    with file_locks_guard:
+        if output_file not in file_locks:
+            file_locks[output_file] = threading.Lock()
+        return file_locks[output_file]
+
+def get_max_workers():
+    """從環境變數 FINDMIND_MAX_WORKERS 讀取並行數量，預設為 1 (逐行處理)"""
+    try:
+        return max(1, int(os.getenv("FINDMIND_MAX_WORKERS", "1")))
+    except ValueError:
+        print("Invalid FINDMIND_MAX_WORKERS value, falling back to serial processing")
+        return 1
+
+# 已由全市場單日查詢處理的股價文件，逐股任務會略過
+bulk_price_files = set()
+
+def build_row_jobs(api_token, stock_id, start_date, end_date):
+    """
+    建立單一競標列的數據集抓取任務
+
+    Returns:
+        list: 每個任務為 (輸出文件, 函數, 參數) 的 tuple，順序與逐行處理相同
+    """
+    jobs = []
+    # 每個登錄的數據集一個任務 (股價、股息、本益比/淨值比、公司基本資料、財務報表...)
+    for spec in get_datasets():
+        output_file = spec.output_file(stock_id, start_date, end_date)
+        # 已由全市場單日查詢處理的股價文件
+        if output_file in bulk_price_files:
+            continue
+        jobs.append((output_file, fetch_and_save_dataset, (spec, api_token, stock_id, start_date, end_date, output_file)))
+    # TWSE/TPEX 指數由 update_market_index 統一維護，僅在需要時另存每個期間的副本
+    if is_per_stock_market_index_enabled():
+        twse_tpex_file = MARKET_INDEX_SPEC.output_file(stock_id, start_date, end_date)
+        jobs.append((twse_tpex_file, fetch_and_save_TWSE_TPEX, (api_token, start_date, end_date, twse_tpex_file)))
+    return jobs
+
+# 抓取進度檢查點：第一行為本次競標期間的簽章，其後每行為一個已完成的輸出文件
+CHECKPOINT_FILE = ".fetch_checkpoint.jsonl"
+checkpoint_lock = threading.Lock()
+checkpoint_done = set()
+checkpoint_state = {"file": None}
+
+def is_resume_enabled():
+    """從環境變數 FINDMIND_RESUME 判斷是否從上次中斷的檢查點繼續，預設啟用"""
+    return os.getenv("FINDMIND_RESUME", "1") == "1"
+
+def get_windows_signature(windows):
+    """以所有競標期間計算簽章，期間列表改變時不沿用舊的檢查點"""
+    payload = json.dumps(sorted(f"{stock_id}|{start}|{end}" for stock_id, start, end in windows))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def start_checkpoint(windows, checkpoint_file=CHECKPOINT_FILE):
+    """
+    開始記錄檢查點；簽章相同的舊檢查點中已完成的任務會被略過
+
+    Returns:
+        int: 從檢查點恢復的已完成任務數
+    """
+    signature = get_windows_signature(windows)
+    checkpoint_done.clear()
+    if is_resume_enabled() and os.path.exists(checkpoint_file):
+        try:
+            with open(checkpoint_file, "r", encoding="utf-8") as f:
+                header = json.loads(f.readline() or "{}")
+                if header.get("signature") == signature:
+                    for line in f:
+                        # 最後一行可能在中斷時只寫了一半
+                        try:
+                            checkpoint_done.add(json.loads(line)["output_file"])
+                        except (ValueError, KeyError):
+                            break
+        except (OSError, ValueError) as e:
+            print(f"讀取檢查點 {checkpoint_file} 時發生錯誤: {e}")
+            checkpoint_done.clear()
+
+    checkpoint_state["file"] = checkpoint_file
+    with open_atomic(checkpoint_file, newline="\n") as f:
+        f.write(json.dumps({"signature": signature, "started_at": datetime.now().isoformat(timespec="seconds")}) + "\n")
+        for output_file in sorted(checkpoint_done):
+            f.write(json.dumps({"output_file": output_file}, ensure_ascii=False) + "\n")
+    if checkpoint_done:
+        print(f"Resuming from checkpoint: {len(checkpoint_done)} completed jobs will be skipped")
+    return len(checkpoint_done)
+
+def record_checkpoint(output_file):
+    """記錄已完成且期間已結束 (is_window_closed) 的任務 (開放或未來期間的任務每次都需要重新檢查)"""
+    checkpoint_file = checkpoint_state["file"]
+    if checkpoint_file is None or not os.path.exists(get_stored_file(output_file)):
+        return
+    parsed = parse_data_file_name(os.path.basename(output_file))
+    if parsed is None or not is_window_closed(parsed[2]):
+        return
+    with checkpoint_lock:
+        if output_file in checkpoint_done:
+            return
+        checkpoint_done.add(output_file)
+        with open(checkpoint_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"output_file": output_file}, ensure_ascii=False) + "\n")
+
+def finish_checkpoint():
+    """所有任務完成後刪除檢查點"""
+    checkpoint_file = checkpoint_state["file"]
+    checkpoint_state["file"] = None
+    checkpoint_done.clear()
+    if checkpoint_file and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+
+def run_fetch_job(job):
+    """執行單一抓取任務，持有輸出文件的鎖以確保寫入安全；完成後記錄檢查點"""
+    output_file, func, args = job
+    if output_file in checkpoint_done:
+        print(f"Checkpoint: {output_file} already completed, skipping")
+        return None
+    with get_file_lock(output_file):
+        result = func(*args)
+    record_checkpoint(output_file)
+    return result
+
+def process_auction_row(api_token, stock_id, start_date, end_date):
+    """逐一執行單一競標列的所有抓取任務"""
+    for job in build_row_jobs(api_token, stock_id, start_date, end_date):
+        run_fetch_job(job)
+
+def process_rows_concurrently(api_token, rows, max_workers):
+    """
+    以有界線程池並行處理所有競標列的抓取任務
+
+    Parameters:
+    - api_token: FinMind API 令牌
+    - rows: (stock_id, start_date, end_date) 的列表
+    - max_workers: 最大並行線程數
+    """
+    jobs = []
+    for stock_id, start_date, end_date in rows:
+        for job in build_row_jobs(api_token, stock_id, start_date, end_date):
+            jobs.append((stock_id, job))
+
+    print(f"Dispatching {len(jobs)} fetch jobs for {len(rows)} rows with {max_workers} workers")
+    completed = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run_fetch_job, job): stock_id for stock_id, job in jobs}
+        for future in as_completed(futures):
+            stock_id = futures[future]
+            completed += 1
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error processing stock {stock_id}: {e}")
+            print(f"-----Completed job {completed} of {len(jobs)}-----")
+
+def is_priority_enabled():
+    """從環境變數 FINDMIND_PRIORITY 判斷是否依價值排序任務並套用預算，預設停用"""
+    return os.getenv("FINDMIND_PRIORITY", "0") == "1"
+
+def get_fetch_budget():
+    """
+    讀取本次執行的預算
+
+    Returns:
+        tuple: (API 請求數上限, 秒數上限)，0 表示不限制
+    """
+    try:
+        max_calls = max(0, int(os.getenv("FINDMIND_BUDGET_CALLS", "0")))
+        max_seconds = max(0.0, float(os.getenv("FINDMIND_BUDGET_SECONDS", "0")))
+    except ValueError:
+        print("Invalid FINDMIND_BUDGET_* value, running without a budget")
+        return 0, 0.0
+    return max_calls, max_seconds
+
+def score_fetch_job(end_date, job):
+    """
+    評估單一任務的價值與預期 API 請求數
+
+    - 開放程度：結束日期在今兩個月內 (is_date_within_two_months) 的期間仍在更新
+    - 陳舊程度：文件不存在，或 end_date 策略的文件距結束日期缺少的天數
+    - 預期成本：可由本地文件判斷會略過的任務，以及由已載入的全表快照或回應快取提供的任務不消耗 API 請求
+
+    Returns:
+        tuple: (分數, 預期請求數, 數據集名稱)
+    """
+    output_file, func, args = job
+    # 權重取自數據集登錄表
+    spec = args[0] if func is fetch_and_save_dataset else MARKET_INDEX_SPEC
+    dataset, weight = spec.name, spec.weight
+    is_open = is_date_within_two_months(end_date)
+
+    if not os.path.exists(get_stored_file(output_file)):
+        staleness = 1.0
+    elif spec.freshness == "end_date":
+        last_date = get_last_stored_date(output_file)
+        if last_date is not None and last_date >= end_date:
+            staleness = 0.0
+        elif last_date is None:
+            staleness = 1.0
+        else:
+            missing_days = (datetime.strptime(end_date, "%Y-%m-%d") - datetime.strptime(last_date, "%Y-%m-%d")).days
+            staleness = min(1.0, 0.1 + missing_days / 30.0)
+    else:
+        # 既有文件只在開放期間內才會重新抓取
+        staleness = 0.5 if is_open else 0.0
+
+    expected_calls = 1 if staleness > 0 else 0
+    if expected_calls and func is fetch_and_save_dataset:
+        if spec.snapshot_file and dataset_snapshots.get(spec.name):
+            expected_calls = 0
+        else:
+            request = get_dataset_request(*args, report=False)
+            client = get_client()
+            if request is None or (client.cache is not None and client.cache.contains(request[0])):
+                expected_calls = 0
+    score = weight * staleness * (2.0 if is_open else 1.0)
+    return score, expected_calls, dataset
+
+def run_prioritized_jobs(api_token, rows, max_workers, calls_before=0, started=None):
+    """
+    依價值由高到低執行所有競標列的抓取任務，並在預算內停止分派
+
+    Parameters:
+    - api_token: FinMind API 令牌
+    - rows: (stock_id, start_date, end_date) 的列表
+    - max_workers: 最大並行線程數
+    - calls_before: 本次執行開始時的 API 請求數，預算包含排程前 (市場指數、全市場查詢等) 已用的請求
+    - started: 本次執行開始的 time.monotonic()，None 時從排程開始計時
+
+    Returns:
+        list: 因預算不足延後到下次執行的 (stock_id, 數據集, 輸出文件)
+    """
+    max_calls, max_seconds = get_fetch_budget()
+    client = get_client()
+    if started is None:
+        started = time.monotonic()
+
+    row_jobs = [(stock_id, end_date, job) for stock_id, start_date, end_date in rows
+                for job in build_row_jobs(api_token, stock_id, start_date, end_date)]
+    # 先載入全表快照 (每個數據集一次請求)，之後從快照切出的任務不消耗請求
+    if is_snapshot_enabled():
+        snapshot_specs = {job[2][0].name: job[2][0] for _, _, job in row_jobs
+                          if job[1] is fetch_and_save_dataset and job[2][0].snapshot_file}
+        for spec in snapshot_specs.values():
+            if not max_calls or len(client.get_latencies()) - calls_before < max_calls:
+                get_dataset_snapshot(spec, api_token)
+
+    scored = []
+    for stock_id, end_date, job in row_jobs:
+        score, expected_calls, dataset = score_fetch_job(end_date, job)
+        scored.append((score, expected_calls, dataset, stock_id, job))
+    # 分數高者優先；同分時先執行不消耗請求的任務，其餘保持原順序
+    scored.sort(key=lambda item: (-item[0], item[1]))
+
+    budget_text = f"{max_calls or 'unlimited'} API calls, {max_seconds or 'unlimited'} seconds"
+    print(f"Scheduling {len(scored)} fetch jobs for {len(rows)} rows by priority ({budget_text})")
+
+    deferred = []
+    completed = 0
+    # 已分派但尚未完成的任務預期請求數，避免並行時超出預算
+    reserved_calls = 0
+
+    def over_budget(expected_calls):
+        if max_seconds and time.monotonic() - started >= max_seconds:
+            return True
+        used = len(client.get_latencies()) - calls_before
+        return bool(max_calls) and expected_calls > 0 and used + reserved_calls + expected_calls > max_calls
+
+    def collect(done_futures):
+        nonlocal completed, reserved_calls
+        for future in done_futures:
+            done_stock_id, done_calls = futures.pop(future)
+            reserved_calls -= done_calls
+            completed += 1
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error processing stock {done_stock_id}: {e}")
+            print(f"-----Completed job {completed} of {len(scored)}-----")
+
+    futures = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for score, expected_calls, dataset, stock_id, job in scored:
+            # 控制在途任務數，讓預算檢查反映已完成任務的實際請求數
+            if len(futures) >= max_workers:
+                collect(wait(futures, return_when=FIRST_COMPLETED).done)
+            if over_budget(expected_calls):
+                deferred.append((stock_id, dataset, job[0]))
+                continue
+            reserved_calls += expected_calls
+            futures[executor.submit(run_fetch_job, job)] = (stock_id, expected_calls)
+        collect(wait(futures).done)
+
+    used_calls = len(client.get_latencies()) - calls_before
+    print(f"Priority run used {used_calls} API calls in {time.monotonic() - started:.1f}s")
+    report_deferred_jobs(deferred)
+    return deferred
+
+def report_deferred_jobs(deferred):
+    """輸出延後到下次執行的任務"""
+    if not deferred:
+        print("No fetch jobs were deferred.")
+        return
+    by_dataset = {}
+    for _, dataset, _ in deferred:
+        by_dataset[dataset] = by_dataset.get(dataset, 0) + 1
+    summary = ", ".join(f"{dataset}: {count}" for dataset, count in sorted(by_dataset.items()))
+    print(f"Deferred {len(deferred)} fetch jobs to the next run ({summary})")
+    for stock_id, dataset, output_file in deferred:
+        print(f"  deferred {dataset} {stock_id} -> {output_file}")
+
+def get_fetch_backend():
+    """從環境變數 FINDMIND_BACKEND 讀取抓取後端：threads (預設) 或 asyncio"""
+    backend = os.getenv("FINDMIND_BACKEND", "threads").strip().lower()
+    if backend not in ("threads", "asyncio"):
+        print(f"Invalid FINDMIND_BACKEND value {backend!r}, using threads")
+        return "threads"
+    return backend
+
+class IntervalLimiter:
+    """
+    asyncio 任務啟動限流：每個時間區間最多啟動 limit 個任務
+
+    Parameters:
+    - limit: 每個區間允許啟動的任務數，0 表示不限制
+    - interval: 區間秒數
+    """
+
+    def __init__(self, limit, interval):
+        self.limit = limit
+        self.interval = interval
+        self.started = []
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.limit <= 0:
+            return
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                self.started = [t for t in self.started if now - t < self.interval]
+                if len(self.started) < self.limit:
+                    self.started.append(now)
+                    return
+                await asyncio.sleep(self.interval - (now - self.started[0]))
+
+async def run_fetch_job_async(job, http, executor, locks):
+    """
+    run_fetch_job 的 asyncio 版本：數據集任務的請求在事件循環上進行，
+    其他任務 (例如 TWSE/TPEX 副本) 整個交由線程池執行
+    """
+    output_file, func, args = job
+    if output_file in checkpoint_done:
+        print(f"Checkpoint: {output_file} already completed, skipping")
+        return None
+    loop = asyncio.get_running_loop()
+    # 同一文件的任務依序執行 (事件循環上不能持有線程鎖等待)
+    async with locks.setdefault(output_file, asyncio.Lock()):
+        if func is fetch_and_save_dataset and http is not None:
+            result = await fetch_and_save_dataset_async(http, executor, *args)
+        else:
+            result = await loop.run_in_executor(executor, func, *args)
+    await loop.run_in_executor(executor, record_checkpoint, output_file)
+    return result
+
+async def run_fetch_jobs_async(jobs, concurrency, limiter):
+    """
+    將每個抓取任務排程為協程，全域信號量限制同時進行的任務數
+
+    aiohttp 可用時請求經由 AsyncFinMindClient 在事件循環上進行，連線池大小與並行數相同，
+    線程池只負責文件的檢查與寫入；否則整個任務交由大小為並行數的線程池執行
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    coalesced_tasks.clear()
+    locks = {}
+    completed = 0
+
+    async def run_job(stock_id, job, http, executor):
+        nonlocal completed
+        async with semaphore:
+            await limiter.acquire()
+            try:
+                await run_fetch_job_async(job, http, executor, locks)
+            except Exception as e:
+                print(f"Error processing stock {stock_id}: {e}")
+            completed += 1
+            print(f"-----Completed job {completed} of {len(jobs)}-----")
+
+    async def run_all(http, executor):
+        await asyncio.gather(*(run_job(stock_id, job, http, executor) for stock_id, job in jobs))
+
+    if is_aiohttp_available():
+        executor = ThreadPoolExecutor()
+        try:
+            async with AsyncFinMindClient(get_client(), concurrency) as http:
+                await run_all(http, executor)
+        finally:
+            executor.shutdown(wait=True)
+    else:
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        try:
+            await run_all(None, executor)
+        finally:
+            executor.shutdown(wait=True)
+
+def process_rows_async(api_token, rows):
+    """
+    以 asyncio 後端處理所有競標列的抓取任務
+
+    - FINDMIND_ASYNC_CONCURRENCY: 同時進行的任務數上限，預設 32
+    - FINDMIND_ASYNC_JOBS_PER_INTERVAL / FINDMIND_ASYNC_INTERVAL: 每個區間 (秒) 最多啟動的任務數，預設不限制
+    """
+    try:
+        concurrency = max(1, int(os.getenv("FINDMIND_ASYNC_CONCURRENCY", "32")))
+        limit = max(0, int(os.getenv("FINDMIND_ASYNC_JOBS_PER_INTERVAL", "0")))
+        interval = float(os.getenv("FINDMIND_ASYNC_INTERVAL", "1"))
+    except ValueError:
+        print("Invalid FINDMIND_ASYNC_* value, using defaults")
+        concurrency, limit, interval = 32, 0, 1.0
+
+    jobs = []
+    for stock_id, start_date, end_date in rows:
+        for job in build_row_jobs(api_token, stock_id, start_date, end_date):
+            jobs.append((stock_id, job))
+
+    print(f"Scheduling {len(jobs)} fetch jobs for {len(rows)} rows on asyncio with concurrency {concurrency}")
+    asyncio.run(run_fetch_jobs_async(jobs, concurrency, IntervalLimiter(limit, interval)))
+
+def get_auction_windows(data):
+    """列出所有有效競標列的 (股票代碼, 開始日期, 結束日期)，日期格式為 YYYY-MM-DD"""
+    windows = []
+    for _, row in data.iterrows():
+        stock_id = row.get("股票代號")
+        if pd.isna(stock_id):
+            continue
+        try:
+            start_date = datetime.strptime(row.get("DateStart"), "%Y/%m/%d").strftime("%Y-%m-%d")
+            end_date = datetime.strptime(row.get("DateEnd"), "%Y/%m/%d").strftime("%Y-%m-%d")
+        except (TypeError, ValueError):
+            continue
+        windows.append((stock_id, start_date, end_date))
+    return windows
+
+def get_auction_date_range(data):
+    """計算所有有效競標期間的最早開始日期與最晚結束日期 (格式: YYYY-MM-DD)"""
+    windows = get_auction_windows(data)
+    if not windows:
+        return None, None
+    return min(window[1] for window in windows), max(window[2] for window in windows)
+
 def main():
     """主函數，程序入口點"""
     api_token = os.getenv("FINDMIND_GMAIL_TOKEN")
@@ -569,16 +1741,31 @@ def main():
 
     print("API Token loaded successfully.")
 
-    sheet_url = "https://docs.google.com/spreadsheets/d/e/2PACX-1vSINLlSv4NcCszvA5XOPsuYCxZEk9_tBnhgLvyDkcG73QgFObITFtaZRQ492wlS53NPBlQi0AfPHMVh/pub?gid=1407177187&single=true&output=csv"
+    # 抓取預算 (FINDMIND_BUDGET_*) 從執行開始計算
+    calls_at_start, started_at = len(get_client().get_latencies()), time.monotonic()
+
+    sheet_url = os.getenv("FINDMIND_SHEET_URL", "https://docs.google.com/spreadsheets/d/e/2PACX-1vSINLlSv4NcCszvA5XOPsuYCxZEk9_tBnhgLvyDkcG73QgFObITFtaZRQ492wlS53NPBlQi0AfPHMVh/pub?gid=1407177187&single=true&output=csv")
     csv_file = "auction_data.csv"
 
     # 創建必要的目錄
-    os.makedirs("stockdata", exist_ok=True)
-    os.makedirs("PER_PBR", exist_ok=True)
-    os.makedirs("company-profile", exist_ok=True)
-    os.makedirs("dividend", exist_ok=True)
-    os.makedirs("financial", exist_ok=True)
-    os.makedirs("TWSE_TPEX", exist_ok=True)
+    output_directories = [spec.directory for spec in get_datasets()] + [MARKET_INDEX_SPEC.directory]
+    for directory in output_directories:
+        os.makedirs(directory, exist_ok=True)
+    remove_stale_temp_files(output_directories)
+
+    # 為 manifest 中尚未記錄的既有文件補上紀錄
+    manifest = get_manifest()
+    if manifest is not None:
+        added = manifest.sync_with_directories()
+        if added:
+            print(f"Registered {added} existing files in the fetch manifest")
+
+    # 將尚未匯入的既有文件匯入本地整合數據庫
+    store = get_store()
+    if store is not None:
+        imported = store.import_files()
+        if imported:
+            print(f"Imported {imported} existing files into the local store {store.path}")
 
     download_google_sheet(sheet_url, csv_file)
     data = validate_and_process_csv(csv_file)
@@ -596,6 +1783,35 @@ def main():
     else:
         print(f"Processing only the first {max_rows} rows from the CSV file")
     
+    windows = get_auction_windows(data.head(max_rows))
+    if os.getenv("FINDMIND_DRY_RUN", "0") == "1":
+        report_fetch_plan(windows)
+        print("Dry run: no API requests were made.")
+        return
+
+    # 從上次中斷的檢查點繼續
+    start_checkpoint(windows)
+
+    # 同一股票重疊或相鄰的期間合併為一次請求
+    if is_coalesce_enabled():
+        report_fetch_plan(windows)
+
+    # TWSE 和 TPEX 數據：所有股票共用，以所有期間的聯集每次執行只更新一次
+    union_start, union_end = get_auction_date_range(data.head(max_rows))
+    if union_start:
+        update_market_index(api_token, union_start, union_end)
+
+    # 股價數據：每個新交易日一次全市場查詢，分送至所有未完成的文件
+    if is_bulk_price_enabled():
+        bulk_price_files.update(fetch_and_save_stock_data_bulk(api_token, windows))
+
+    # 全市場查詢更新文件後才登記合併範圍，合併範圍從各文件缺少的尾段開始
+    if is_coalesce_enabled():
+        register_coalesced_ranges(windows)
+
+    max_workers = get_max_workers()
+    backend = get_fetch_backend()
+    pending_rows = []
     row_count = 0
     
     for index, row in data.iterrows():
@@ -615,29 +1831,11 @@ def main():
                 
                 print(f"Processing stock {stock_id} for period {start_date} to {end_date}")
                 
-                # 股價數據 (直接保存在根目錄)
-                file_name = f"stockdata/[{stock_id}] {start_date}-{end_date}.csv"
-                fetch_and_save_stock_data(api_token, stock_id, start_date, end_date, file_name)
-
-                # 股息數據
-                file_name = f"dividend/[{stock_id}] {start_date}-{end_date}-dividend.csv"
-                fetch_and_save_stock_dividend(api_token, stock_id, start_date, end_date, file_name)
-                
-                # 本益比/淨值比數據
-                file_name = f"PER_PBR/[{stock_id}] {start_date}-{end_date}-PER_PBR.csv"
-                fetch_and_save_stock_PER_PBR(api_token, stock_id, start_date, end_date, file_name)
-                
-                # 公司基本資料
-                file_name = f"company-profile/[{stock_id}] {start_date}-{end_date}-company-profile.csv"
-                fetch_and_save_stock_company_profile(api_token, stock_id, file_name, end_date)
-                                
-                # 財務報表數據
-                file_name = f"financial/[{stock_id}] {start_date}-{end_date}-financial.csv"
-                fetch_and_save_stock_financialstatements(api_token, stock_id, start_date, end_date, file_name)
-
-                # TWSE 和 TPEX 數據
-                file_name = f"TWSE_TPEX/[{stock_id}] {start_date}-{end_date}-TWSE_TPEX.csv"
-                fetch_and_save_TWSE_TPEX(api_token, start_date, end_date, file_name)
+                if max_workers > 1 or backend == "asyncio" or is_priority_enabled():
+                    # 並行模式：先收集，稍後統一分派
+                    pending_rows.append((stock_id, start_date, end_date))
+                else:
+                    process_auction_row(api_token, stock_id, start_date, end_date)
                 
                 # 增加已處理行計數
                 row_count += 1
@@ -657,6 +1855,23 @@ def main():
             # 跳過的行也計入處理的行數
             row_count += 1
 
+    if pending_rows and is_priority_enabled():
+        run_prioritized_jobs(api_token, pending_rows, max_workers, calls_at_start, started_at)
+    elif pending_rows and backend == "asyncio":
+        process_rows_async(api_token, pending_rows)
+    elif pending_rows:
+        process_rows_concurrently(api_token, pending_rows, max_workers)
+
+    finish_checkpoint()
+
+    # manifest 以排序後的文字文件提交，下次執行 (例如全新的 CI 工作目錄) 從中重建數據庫
+    if manifest is not None:
+        try:
+            print(f"Exported {manifest.export()} manifest entries to {manifest.export_path}")
+        except (OSError, sqlite3.Error) as e:
+            print(f"匯出 manifest 時發生錯誤: {e}")
+
+    get_client().close()
     print("Processing completed.")
 
 if __name__ == "__main__":
@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 """
 FindMind-read_PER_PBR.py
-Version 1.0.6.0
+Version 1.0.8.0
 
 This script reads PER_PBR CSV files for companies listed in a source CSV,
 calculates average values for key metrics, and outputs the results to a CSV file.
@@ -22,13 +22,15 @@ import numpy as np
 import stat
 import tempfile
 import shutil
+from columnar_store import read_data_file
+from file_index import get_file_index
 
 # Set stdout encoding to UTF-8 to handle Chinese characters
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
 sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
 # Constants
-VERSION = "1.0.6.0"
+VERSION = "1.0.8.0"
 COMPANY_LIST_URL = "https://raw.githubusercontent.com/wenchiehlee/Selenium-Actions.Auction/refs/heads/main/%E7%AB%B6%E6%A8%99%E5%85%AC%E5%8F%B8(%E5%88%9D%E4%B8%8A%E5%B8%82%E6%AB%83)%E5%90%8D%E5%96%AE.csv"
 OUTPUT_DIR = "auction_data_processed"  # Output directory as specified in requirements
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, "Features-Company.csv")  # Output file as specified in requirements
@@ -100,15 +102,9 @@ def process_per_pbr_files(company_code):
         tuple: (dividend_yield_avg, per_avg, pbr_avg) or (None, None, None) if error.
     """
     try:
-        # Look for files with exact format including brackets
-        all_files = os.listdir(PER_PBR_DIR) if os.path.exists(PER_PBR_DIR) else []
-        files = []
-        
-        # Find files that match the pattern [company_code]* in the directory listing
-        pattern = f"[{company_code}]"
-        for file in all_files:
-            if pattern in file and file.endswith("-PER_PBR.csv"):
-                files.append(os.path.join(PER_PBR_DIR, file))
+        # Look up the company's files in the shared directory index (including columnar-only outputs)
+        index = get_file_index(PER_PBR_DIR, suffix="-PER_PBR.csv")
+        files = [path for _, _, path in index.get(str(company_code), [])]
         
         if not files:
             print(f"No PER_PBR files found for company {company_code}")
@@ -124,7 +120,7 @@ def process_per_pbr_files(company_code):
         # Process each file
         for file_path in files:
             try:
-                df = pd.read_csv(file_path, encoding='utf-8')
+                df = read_data_file(file_path)
                 
                 # Ensure the required columns exist
                 required_columns = ["股息殖利率", "PER", "PBR"]
@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 """
 FindMind-read_company-profile.py
-Version 1.0.6.0
+Version 1.0.8.0
 
 This script reads company-profile CSV files for companies listed in a source CSV,
 extracts the latest industry category and type information, and outputs the results 
@@ -23,13 +23,15 @@ import stat
 import tempfile
 import shutil
 from datetime import datetime
+from columnar_store import read_data_file
+from file_index import get_file_index
 
 # Set stdout encoding to UTF-8 to handle Chinese characters
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
 sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
 # Constants
-VERSION = "1.0.6.0"
+VERSION = "1.0.8.0"
 COMPANY_LIST_URL = "https://raw.githubusercontent.com/wenchiehlee/Selenium-Actions.Auction/refs/heads/main/%E7%AB%B6%E6%A8%99%E5%85%AC%E5%8F%B8(%E5%88%9D%E4%B8%8A%E5%B8%82%E6%AB%83)%E5%90%8D%E5%96%AE.csv"
 OUTPUT_DIR = "auction_data_processed"  # Output directory as specified in requirements
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, "Features-Company.csv")  # Output file as specified in requirements
@@ -101,15 +103,9 @@ def process_company_profile_files(company_code):
         tuple: (industry_category, company_type) or (None, None) if error.
     """
     try:
-        # Look for files with exact format including brackets
-        all_files = os.listdir(COMPANY_PROFILE_DIR) if os.path.exists(COMPANY_PROFILE_DIR) else []
-        files = []
-        
-        # Find files that match the original expected pattern
-        pattern = f"[{company_code}]"
-        for file in all_files:
-            if pattern in file and file.endswith("-company-profile.csv"):
-                files.append(os.path.join(COMPANY_PROFILE_DIR, file))
+        # Look up the company's files in the shared directory index (including columnar-only outputs)
+        index = get_file_index(COMPANY_PROFILE_DIR, suffix="-company-profile.csv")
+        files = [path for _, _, path in index.get(str(company_code), [])]
         
         if not files:
             print(f"No company-profile files found for company {company_code}")
@@ -127,7 +123,7 @@ def process_company_profile_files(company_code):
         # Process each file
         for file_path in files:
             try:
-                df = pd.read_csv(file_path, encoding='utf-8')
+                df = read_data_file(file_path)
                 
                 # Ensure the required columns exist
                 required_columns = ["日期", "行業類別", "類型"]
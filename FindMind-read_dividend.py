@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 """
 FindMind-read_dividend.py
-Version 1.0.6.0
+Version 1.0.8.0
 
 This script reads dividend CSV files for companies listed in a source CSV,
 extracts the most recent dividend information, calculates the per-share dividend amount,
@@ -24,13 +24,15 @@ import tempfile
 import shutil
 from datetime import datetime
 import re
+from columnar_store import read_data_file
+from file_index import get_file_index
 
 # Set stdout encoding to UTF-8 to handle Chinese characters
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
 sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
 # Constants
-VERSION = "1.0.6.0"
+VERSION = "1.0.8.0"
 COMPANY_LIST_URL = "https://raw.githubusercontent.com/wenchiehlee/Selenium-Actions.Auction/refs/heads/main/%E7%AB%B6%E6%A8%99%E5%85%AC%E5%8F%B8(%E5%88%9D%E4%B8%8A%E5%B8%82%E6%AB%83)%E5%90%8D%E5%96%AE.csv"
 OUTPUT_DIR = "auction_data_processed"  # Output directory as specified in requirements
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, "Features-Company.csv")  # Output file as specified in requirements
@@ -101,15 +103,9 @@ def find_dividend_files(company_code):
         list: List of file paths for the company's dividend files.
     """
     try:
-        # Look for files with the pattern in the directory listing
-        all_files = os.listdir(DIVIDEND_DIR) if os.path.exists(DIVIDEND_DIR) else []
-        files = []
-        
-        # Find files that match the pattern [company_code]* in the directory listing
-        pattern = f"[{company_code}]"
-        for file in all_files:
-            if pattern in file and file.endswith("-dividend.csv"):
-                files.append(os.path.join(DIVIDEND_DIR, file))
+        # Look up the company's files in the shared directory index (including columnar-only outputs)
+        index = get_file_index(DIVIDEND_DIR, suffix="-dividend.csv")
+        files = [path for _, _, path in index.get(str(company_code), [])]
         
         if not files:
             print(f"No dividend files found for company {company_code}")
@@ -156,7 +152,7 @@ def process_dividend_files(company_code):
         # Process each file, starting with the newest
         for file_path in files:
             try:
-                df = pd.read_csv(file_path, encoding='utf-8')
+                df = read_data_file(file_path)
                 
                 # Ensure the required columns exist
                 required_columns = ["日期", "股票收益分配", "現金盈餘分配"]
@@ -1,9 +1,10 @@
 import os
+import numpy as np
 import pandas as pd
 import re
-from workalendar.asia import Taiwan  # 使用 workalendar 計算台灣的工作日
-import csv
-from datetime import timedelta
+from columnar_store import read_data_file
+from file_index import get_file_index  # 股票代號 -> 股價文件的索引，目錄只列出與解析一次
+from trading_calendar import get_trading_calendar  # 合併 workalendar 國定假日與 holidays.csv 的交易日曆
 
 # 創建輸出資料夾名稱
 output_dir = "auction_data_processed"
@@ -41,149 +42,254 @@ for col in date_columns_raw:
 print(date_columns,"<<AAAAAAAAAAAAAAA")
 
 
-# 獲取所有文件列表
-all_files = [f for f in os.listdir('stockdata') if f.endswith('.csv')]
-
-# 初始化台灣工作日計算
-cal = Taiwan()
-
-# 讀取 holidays.csv，並處理格式
-holidays_path = "holidays.csv"
-if os.path.exists(holidays_path):
-    try:
-        holidays_list = []
-        with open(holidays_path, "r", encoding="utf-8") as file:
-            reader = csv.reader(file)
-            for row in reader:
-                date_part = row[0].strip() if len(row) > 0 else None
-                if date_part:
-                    holidays_list.append(date_part)
-
-        holidays = pd.DataFrame(holidays_list, columns=["日期"])
-        holidays["日期"] = holidays["日期"].str.extract(r"(\d{4}-\d{2}-\d{2})", expand=False)
-        holidays["日期"] = pd.to_datetime(holidays["日期"], errors="coerce").dt.date
-        holidays_set = set(holidays["日期"].dropna())
-
-        print(f"成功讀取 holidays.csv，共 {len(holidays_set)} 個假日")
-    except Exception as e:
-        print(f"讀取 holidays.csv 時發生錯誤: {e}")
-        holidays_set = set()
-else:
-    print("找不到 holidays.csv，將不考慮假日")
-    holidays_set = set()
-
-
-# 2. 定義函數以獲取收盤價，並根據偏移量調整
-def get_closing_price(security_id, base_date, offset=0):
+# 股票代號 -> [(開始日期, 結束日期, 文件路徑)] (包含只存在於列式存儲的股價數據)，查詢時不需要再掃描所有文件
+price_files = get_file_index('stockdata')
+
+# 文件名 -> 股價索引 (依日期排序的收盤價、日期範圍、資料總數)，每個文件只讀取與解析一次；
+# 讀取失敗時保存例外，之後的查詢重新拋出，與每次讀取時的行為相同
+price_history = {}
+
+
+def load_price_history(file_name):
     """
-    根據證券代號和日期獲取收盤價，並根據偏移量調整日期（非索引位置）。
+    讀取股價文件並建立依日期排序的收盤價表，結果保存在 price_history 中
     """
-    for file_name in all_files:
-        if file_name.startswith(f"[{security_id}]") and file_name.endswith(".csv"):
-            try:
-                # Update file path to use stockdata directory
-                full_path = os.path.join('stockdata', file_name)
-                price_data = pd.read_csv(full_path, encoding='utf-8')
-                price_data['日期'] = pd.to_datetime(price_data['日期'], errors='coerce').dt.date
-                price_data = price_data.sort_values(by='日期').reset_index(drop=True)
-
-                # Convert base_date to datetime object
-                base_date_dt = pd.to_datetime(base_date, errors='coerce')
-                if pd.isna(base_date_dt):
-                    print(f"無效日期格式: base_date={base_date}, offset={offset}")
-                    return ""
-                
-                # Calculate the target date by adding offset days to base_date
-                from datetime import timedelta
-                base_date = base_date_dt.date()
-                target_date = base_date + timedelta(days=offset)
-                
-                # CHANGED: Added holiday check in addition to weekend check
-                is_weekend = target_date.weekday() >= 5
-                is_holiday = target_date in holidays_set  # NEW
-                is_non_trading_day = is_weekend or is_holiday  # NEW
-                
-                # Look for the target date in the data
-                target_data = price_data[price_data['日期'] == target_date]
-                
-                if not target_data.empty:
-                    # Target date found
-                    return target_data.iloc[0]['收盤價']
-                else:
-                    # CHANGED: Only print if it's a regular trading day (not weekend or holiday)
-                    if not is_non_trading_day:  # CHANGED from "if not is_weekend:"
-
-                        # Check if this date should exist (is it within the file's date range?)
-                        min_date = price_data['日期'].min()
-                        max_date = price_data['日期'].max()
-                        if min_date <= target_date <= max_date:
-                            print(f"  🈳範圍內，但沒有數據: target_date={target_date} (base_date={base_date}, offset={offset}), 檔案={file_name} 注意: 此日期在檔案日期範圍內 ({min_date} 至 {max_date})，但沒有數據 (可能是非預期的休市日)")
-                        else:
-                            print(f"  🚀未來日期: target_date={target_date} (base_date={base_date}, offset={offset}), 檔案={file_name} 注意: 未來日期，無法獲取數據")
-                    # NEW: Optional debugging for weekend/holiday identification
-                    elif is_weekend:
-                        # Optional: You can uncomment if you want weekend prints
-                        print(f"  🛌週末非交易日: target_date={target_date} (base_date={base_date}, offset={offset})")
-                        pass
-                    elif is_holiday:
-                        # Optional: You can uncomment if you want holiday prints
-                        print(f"  🧨假日非交易日: target_date={target_date} (base_date={base_date}, offset={offset})")
-                        pass
-                    return ""
-                
-            except (KeyError, FileNotFoundError, pd.errors.EmptyDataError) as e:
-                print(f"處理檔案時出錯: {file_name}, 錯誤: {e}")
-                continue
-    
-    # CHANGED: Updated the check for non-trading days at end of function
-    from datetime import timedelta
-    target_date = base_date + timedelta(days=offset)
+    if file_name not in price_history:
+        try:
+            # Update file path to use stockdata directory
+            full_path = os.path.join('stockdata', file_name)
+            price_data = read_data_file(full_path)
+            total_rows = price_data.shape[0]
+            price_data['日期'] = pd.to_datetime(price_data['日期'], errors='coerce').dt.normalize()
+            price_data = price_data.sort_values(by='日期', kind='stable').reset_index(drop=True)
+            prices = None
+            if '收盤價' in price_data.columns:
+                # 同一日期有多筆數據時使用第一筆
+                prices = price_data.loc[price_data['日期'].notna() & ~price_data['日期'].duplicated(), ['日期', '收盤價']]
+            price_history[file_name] = {
+                'prices': prices,
+                'min_date': price_data['日期'].min().date() if price_data['日期'].notna().any() else None,
+                'max_date': price_data['日期'].max().date() if price_data['日期'].notna().any() else None,
+                'total_rows': total_rows,
+            }
+        except (KeyError, FileNotFoundError, pd.errors.EmptyDataError) as e:
+            price_history[file_name] = e
+    history = price_history[file_name]
+    if isinstance(history, Exception):
+        raise history
+    return history
+
+
+def get_security_prices(security_id):
+    """
+    取得證券的股價索引：依序使用第一個能成功讀取且有收盤價的股價文件
+
+    Returns:
+        tuple: (文件名, 股價索引)；沒有可用的文件時為 (None, None)
+    """
+    for _, _, file_path in price_files.get(str(security_id), []):
+        file_name = os.path.basename(file_path)
+        try:
+            history = load_price_history(file_name)
+            if history['prices'] is None:
+                raise KeyError('收盤價')
+            return file_name, history
+        except (KeyError, FileNotFoundError, pd.errors.EmptyDataError) as e:
+            print(f"處理檔案時出錯: {file_name}, 錯誤: {e}")
+            continue
+    return None, None
+
+
+# 初始化台灣股市交易日曆 (國定假日與 holidays.csv 只合併一次，並保存於快取文件)
+cal = get_trading_calendar("holidays.csv")
+
+# 偏移量的單位：calendar (日曆日，預設) 或 trading (交易日)
+OFFSET_MODES = ("calendar", "trading")
+# 目標日期沒有收盤價時的處理：none (留空，預設)、previous (前一個有數據的交易日)、next (下一個有數據的交易日)
+OFFSET_FALLBACKS = ("none", "previous", "next")
+
+
+def get_env_choice(name, choices):
+    """讀取環境變數，值不在 choices 中時使用第一個 (預設) 選項"""
+    value = os.getenv(name, choices[0]).strip().lower()
+    if value not in choices:
+        print(f"無效的 {name} 設定: {value}，使用 {choices[0]}")
+        return choices[0]
+    return value
+
+
+offset_mode = get_env_choice("FINDMIND_OFFSET_MODE", OFFSET_MODES)
+offset_fallback = get_env_choice("FINDMIND_OFFSET_FALLBACK", OFFSET_FALLBACKS)
+if (offset_mode, offset_fallback) != (OFFSET_MODES[0], OFFSET_FALLBACKS[0]):
+    print(f"偏移量單位: {offset_mode}，缺少收盤價時: {offset_fallback}")
+
+
+def compute_target_dates(base_dates, offsets):
+    """
+    以陣列運算計算所有儲存格的目標日期
+
+    calendar 模式為基礎日期加上 N 個日曆日；trading 模式為基礎日期加上 N 個交易日，
+    基礎日期不是交易日時，正偏移從前一個交易日起算、負偏移從下一個交易日起算
+    (例如週六的 +1 為下週一，-1 為週五)，偏移 0 依 offset_fallback 取前一個或下一個交易日。
+    """
+    if offset_mode == "calendar":
+        return base_dates + pd.to_timedelta(offsets, unit='D')
+    targets = base_dates.copy()
+    valid = base_dates.notna().to_numpy()
+    if not valid.any():
+        return targets
+    days = base_dates[valid].to_numpy().astype('datetime64[D]')
+    steps = offsets[valid].to_numpy()
+    zero_roll = {'previous': 'backward', 'next': 'forward'}.get(offset_fallback)
+    shifted = np.where(steps > 0, cal.offset(days, steps, roll='backward'),
+                       np.where(steps < 0, cal.offset(days, steps, roll='forward'),
+                                cal.offset(days, 0, roll=zero_roll) if zero_roll else days))
+    targets[valid] = shifted.astype(targets.dtype)
+    return targets
+
+
+def fill_from_nearest_session(cells, values, found, security_prices):
+    """
+    目標日期沒有收盤價時，以二分搜尋在證券依日期排序的收盤價表中找出前一個或下一個有數據的交易日
+
+    只補齊落在股價文件日期範圍內的儲存格 (未來日期仍留空)；values 與 found 直接更新
+
+    Returns:
+        int: 補齊的儲存格數
+    """
+    filled = 0
+    pending = cells['base_date'].notna().to_numpy() & ~found & cells['target_date'].notna().to_numpy()
+    for key, group in cells[pending].groupby('security_key'):
+        _, history = security_prices[key]
+        if history is None or history['prices'].empty:
+            continue
+        dates = history['prices']['日期'].to_numpy()
+        # 與合併結果相同以浮點數寫出 (有缺值的左合併會把整數收盤價轉為浮點數)
+        closes = history['prices']['收盤價'].astype(float).to_numpy(dtype=object)
+        targets = group['target_date'].to_numpy().astype(dates.dtype)
+        if offset_fallback == "previous":
+            positions = np.searchsorted(dates, targets, side='right') - 1
+        else:
+            positions = np.searchsorted(dates, targets, side='left')
+        in_range = (targets >= dates[0]) & (targets <= dates[-1])
+        values[group.index[in_range]] = closes[positions[in_range]]
+        found[group.index[in_range]] = True
+        filled += int(in_range.sum())
+    return filled
+
+
+# 2. 以單次合併解析所有日期欄位的收盤價，並根據偏移量調整日期（非索引位置）
+def report_unresolved_price(security_id, file_name, history, base_date, target_date, offset):
+    """
+    印出查無收盤價的原因 (非交易日、範圍內缺數據、未來日期或無股價文件)
+    """
+    # CHANGED: Added holiday check in addition to weekend check
     is_weekend = target_date.weekday() >= 5
-    is_holiday = target_date in holidays_set  # NEW
+    is_holiday = bool(cal.is_holiday(target_date))  # NEW
     is_non_trading_day = is_weekend or is_holiday  # NEW
-    
-    if not is_non_trading_day:  # CHANGED from "if target_date.weekday() < 5:"
-        print(f"無資料: security_id={security_id}, target_date={target_date} (base_date={base_date}, offset={offset})")
-    return ""
+
+    if file_name is None:
+        if not is_non_trading_day:
+            print(f"無資料: security_id={security_id}, target_date={target_date} (base_date={base_date}, offset={offset})")
+    # CHANGED: Only print if it's a regular trading day (not weekend or holiday)
+    elif not is_non_trading_day:  # CHANGED from "if not is_weekend:"
+        # Check if this date should exist (is it within the file's date range?)
+        min_date = history['min_date']
+        max_date = history['max_date']
+        if min_date is not None and min_date <= target_date <= max_date:
+            print(f"  🈳範圍內，但沒有數據: target_date={target_date} (base_date={base_date}, offset={offset}), 檔案={file_name} 注意: 此日期在檔案日期範圍內 ({min_date} 至 {max_date})，但沒有數據 (可能是非預期的休市日)")
+        else:
+            print(f"  🚀未來日期: target_date={target_date} (base_date={base_date}, offset={offset}), 檔案={file_name} 注意: 未來日期，無法獲取數據")
+    # NEW: Optional debugging for weekend/holiday identification
+    elif is_weekend:
+        print(f"  🛌週末非交易日: target_date={target_date} (base_date={base_date}, offset={offset})")
+    elif is_holiday:
+        print(f"  🧨假日非交易日: target_date={target_date} (base_date={base_date}, offset={offset})")
+
+
+def resolve_closing_prices(auction_data, date_columns):
+    """
+    將競標數據展開為 (列, 欄位, 證券代號, 目標日期) 的長表，以陣列運算計算所有目標日期，
+    再與所有證券的收盤價表做一次合併
+
+    Returns:
+        DataFrame: 與 auction_data 相同索引、欄位為 date_columns 的收盤價；
+                   基礎日期為空時為 "無資料"，查無收盤價時為空字串
+    """
+    column_map = pd.DataFrame(
+        [(col, info['base'], info['offset'], position) for position, (col, info) in enumerate(date_columns.items())],
+        columns=['column', 'base', 'offset', 'position'])
+    base_columns = list(dict.fromkeys(column_map['base']))
+    long_data = auction_data[['股票代號'] + base_columns].copy()
+    long_data.columns = ['security_id'] + base_columns
+    long_data['row'] = range(len(auction_data))
+    long_data = long_data.melt(id_vars=['row', 'security_id'], var_name='base', value_name='base_date')
+    cells = column_map.merge(long_data, on='base', how='left')
+    cells = cells.sort_values(['row', 'position'], kind='stable').reset_index(drop=True)
+    cells['security_key'] = cells['security_id'].astype(str)
+
+    # 每個不同的日期字串只解析一次 (逐值解析，允許不同的日期格式)
+    has_base = cells['base_date'].notna()
+    parsed_dates = {value: pd.to_datetime(value, errors='coerce') for value in cells.loc[has_base, 'base_date'].unique()}
+    base_dates = pd.to_datetime(cells['base_date'].map(parsed_dates))
+    cells['target_date'] = compute_target_dates(base_dates, cells['offset'])
+
+    # 所有需要的證券的收盤價表
+    security_prices = {key: get_security_prices(key) for key in cells.loc[has_base, 'security_key'].unique()}
+    price_tables = [history['prices'].assign(security_key=key)
+                    for key, (_, history) in security_prices.items() if history is not None]
+    price_table = (pd.concat(price_tables, ignore_index=True) if price_tables
+                   else pd.DataFrame({'日期': pd.Series(dtype='datetime64[ns]'), '收盤價': [], 'security_key': []}))
+    price_table['日期'] = price_table['日期'].astype(cells['target_date'].dtype)
+    merged = cells.merge(price_table, how='left', left_on=['security_key', 'target_date'],
+                         right_on=['security_key', '日期'], indicator=True)
+
+    found = (merged['_merge'] == 'both').to_numpy().copy()
+    values = pd.Series("", index=merged.index, dtype=object)
+    values[~has_base.to_numpy()] = "無資料"
+    values[found] = merged.loc[found, '收盤價'].astype(object)
+    if offset_fallback != "none":
+        filled = fill_from_nearest_session(cells, values, found, security_prices)
+        print(f"以{'前' if offset_fallback == 'previous' else '後'}一個有數據的交易日補齊 {filled} 個儲存格")
+
+    # 查無收盤價的儲存格依原本的順序印出原因
+    for cell in cells.loc[has_base.to_numpy() & ~found].itertuples(index=False):
+        file_name, history = security_prices[cell.security_key]
+        if pd.isna(cell.target_date):
+            print(f"無效日期格式: base_date={cell.base_date}, offset={cell.offset}")
+            continue
+        report_unresolved_price(cell.security_id, file_name, history, parsed_dates[cell.base_date].date(),
+                                cell.target_date.date(), cell.offset)
+
+    cells['value'] = values
+    resolved = cells.pivot(index='row', columns='column', values='value')
+    resolved.index = auction_data.index
+    return resolved[list(date_columns)]
 
 # 3. 計算資料總數與總工作天數
 def get_security_stats(security_id):
     """
     計算資料總數與總工作天數
     """
-    for file_name in all_files:
-        if file_name.startswith(f"[{security_id}]") and file_name.endswith(".csv"):
-            try:
-                # Update file path to use stockdata directory
-                full_path = os.path.join('stockdata', file_name)
-                price_data = pd.read_csv(full_path, encoding='utf-8')
-
-                total_rows = price_data.shape[0]
-                price_data['日期'] = pd.to_datetime(price_data['日期'], errors='coerce').dt.date
-
-                match = re.search(r"\[(\d+)\] (\d{4}-\d{2}-\d{2})-(\d{4}-\d{2}-\d{2})", file_name)
-                if match:
-                    start_date = pd.to_datetime(match.group(2), errors='coerce').date()
-                    end_date = pd.to_datetime(match.group(3), errors='coerce').date()
-
-                    if start_date and end_date:
-                        working_days = 0
-                        current_date = start_date
-                        while current_date <= end_date:
-                            if not cal.is_holiday(current_date) and current_date not in holidays_set and cal.is_working_day(current_date):
-                                working_days += 1
-                            current_date += timedelta(days=1)
-
-                        print(f"股票代號: {security_id}, 資料總數: {total_rows}/總工作天數: {working_days}")
-                        return total_rows, working_days
-                    else:
-                        return total_rows, "無資料"
-                else:
-                    return total_rows, "無資料"
-
-            except (FileNotFoundError, pd.errors.EmptyDataError) as e:
-                print(f"讀取證券檔案錯誤: {e}")
-                return "無資料", "無資料"
+    for start, end, file_path in price_files.get(str(security_id), []):
+        try:
+            total_rows = load_price_history(os.path.basename(file_path))['total_rows']
+
+            # 文件索引已解析文件名中的日期範圍
+            start_date = pd.to_datetime(start, errors='coerce').date()
+            end_date = pd.to_datetime(end, errors='coerce').date()
+
+            if start_date and end_date:
+                working_days = int(cal.count_trading_days(start_date, end_date))
+
+                print(f"股票代號: {security_id}, 資料總數: {total_rows}/總工作天數: {working_days}")
+                return total_rows, working_days
+            else:
+                return total_rows, "無資料"
+
+        except (FileNotFoundError, pd.errors.EmptyDataError) as e:
+            print(f"讀取證券檔案錯誤: {e}")
+            return "無資料", "無資料"
     return "無資料", "無資料"
 
 
@@ -191,26 +297,15 @@ def get_security_stats(security_id):
 auction_data.insert(auction_data.columns.get_loc("DateEnd") + 1, "資料總數", "無資料")
 auction_data.insert(auction_data.columns.get_loc("資料總數") + 1, "總工作天數", "無資料")
 
-for index, row in auction_data.iterrows():
-    security_id = row["股票代號"]
-
-    # 更新日期欄位，根據偏移量調整收盤價查詢
-    for col, info in date_columns.items():
-        base_col = info['base']
-        offset = info['offset']
-
-        if base_col in auction_data.columns and pd.notna(row[base_col]):
-            closing_price = get_closing_price(security_id, row[base_col], offset)
-            auction_data.at[index, col] = closing_price
-        else:
-            auction_data.at[index, col] = "無資料"
-
+# 更新日期欄位，根據偏移量調整收盤價查詢 (整個表格一次解析)
+resolved_prices = resolve_closing_prices(auction_data, date_columns)
+for col in date_columns:
+    auction_data[col] = resolved_prices[col]
 
-    
-    # 獲取資料總數和總工作天數
-    total_rows, working_days = get_security_stats(security_id)
-    auction_data.at[index, "資料總數"] = total_rows
-    auction_data.at[index, "總工作天數"] = working_days
+# 獲取資料總數和總工作天數 (每個證券只計算一次)
+security_stats = {str(security_id): get_security_stats(security_id) for security_id in auction_data["股票代號"].unique()}
+auction_data["資料總數"] = [security_stats[str(security_id)][0] for security_id in auction_data["股票代號"]]
+auction_data["總工作天數"] = [security_stats[str(security_id)][1] for security_id in auction_data["股票代號"]]
 
 # 5. 儲存更新的資料至新的檔案中
 output_path = os.path.join(output_dir, "updated_cleaned_auction_data.csv")
@@ -0,0 +1,219 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+columnar_store.py
+
+抓取結果的列式存儲：每個 CSV 輸出另存一份有型別、zstd 壓縮的 Parquet 文件，
+依數據集與股票代碼分區 (columnar/{dataset}/stock_id={id}/{start}-{end}.parquet)，
+讀取腳本可直接掃描整個數據集，日期與數值欄位不需要重新推斷型別。
+
+FINDMIND_COLUMNAR=1 時同時寫入 CSV 與 Parquet，=only 時只寫入 Parquet；
+需要 pyarrow，未安裝時印出一次警告並維持只寫入 CSV。
+讀取腳本以 list_data_files / read_data_file 取代 os.listdir / pd.read_csv，
+Parquet 文件存在時優先讀取；兩者都不存在時改從本地整合數據庫 (local_store.py) 讀取。
+"""
+import os
+import re
+import threading
+
+import pandas as pd
+
+from dataset_registry import get_datasets
+from fetch_manifest import match_data_file
+
+DEFAULT_COLUMNAR_DIR = "columnar"
+COLUMNAR_MODES = ("0", "1", "only")
+COLUMNAR_FILE_PATTERN = re.compile(r"^(\d{4}-\d{2}-\d{2})-(\d{4}-\d{2}-\d{2})\.parquet$")
+
+_pyarrow_available = None
+_pyarrow_lock = threading.Lock()
+
+
+def is_pyarrow_available():
+    """檢查 pyarrow 是否可用，不可用時只警告一次"""
+    global _pyarrow_available
+    with _pyarrow_lock:
+        if _pyarrow_available is None:
+            try:
+                import pyarrow  # noqa: F401
+                _pyarrow_available = True
+            except ImportError:
+                print("pyarrow is not installed, the columnar store is disabled")
+                _pyarrow_available = False
+        return _pyarrow_available
+
+
+def get_columnar_mode():
+    """從環境變數 FINDMIND_COLUMNAR 讀取列式存儲模式：0 (預設)、1 或 only"""
+    mode = os.getenv("FINDMIND_COLUMNAR", "0").strip().lower()
+    if mode not in COLUMNAR_MODES:
+        print(f"Invalid FINDMIND_COLUMNAR value {mode!r}, columnar store disabled")
+        return "0"
+    if mode != "0" and not is_pyarrow_available():
+        return "0"
+    return mode
+
+
+def is_columnar_enabled():
+    return get_columnar_mode() != "0"
+
+
+def is_columnar_only():
+    return get_columnar_mode() == "only"
+
+
+def get_columnar_dir():
+    return os.getenv("FINDMIND_COLUMNAR_DIR", DEFAULT_COLUMNAR_DIR)
+
+
+def get_columnar_path(output_file):
+    """
+    CSV 輸出文件對應的 Parquet 文件路徑
+
+    Returns:
+        str: Parquet 文件路徑；不是登錄數據集的輸出文件時為 None
+    """
+    matched = match_data_file(output_file)
+    if not matched:
+        return None
+    spec, stock_id, start_date, end_date = matched
+    return os.path.join(get_columnar_dir(), spec.name, f"stock_id={stock_id}", f"{start_date}-{end_date}.parquet")
+
+
+def to_columnar_frame(spec, frame):
+    """
+    依登錄表決定每個欄位的型別：日期欄位為 datetime64，dtypes 中的欄位保留
+    records_to_frame 轉換的數值型別，其餘為字串，讓同一數據集的所有文件有一致的 schema
+    """
+    frame = frame.copy()
+    for field, title in spec.columns:
+        if field == "date":
+            frame[title] = pd.to_datetime(frame[title], errors="coerce")
+        elif field not in spec.dtypes:
+            frame[title] = frame[title].astype("string")
+    return frame
+
+
+def write_columnar(spec, output_file, frame, append=False):
+    """
+    寫入 CSV 輸出文件對應的 Parquet 文件 (暫存文件寫入後再以 os.replace 取代)
+
+    Parameters:
+    - spec: 數據集描述 (DatasetSpec)
+    - output_file: CSV 輸出文件路徑，用於決定 Parquet 文件路徑
+    - frame: records_to_frame 產生的 DataFrame (欄位為 CSV 標題)
+    - append: 附加在既有 Parquet 文件的數據之後
+
+    Returns:
+        str: 寫入的 Parquet 文件路徑；無法對應時為 None
+    """
+    columnar_file = get_columnar_path(output_file)
+    if columnar_file is None:
+        return None
+    frame = to_columnar_frame(spec, frame)
+    if append and os.path.exists(columnar_file):
+        frame = pd.concat([pd.read_parquet(columnar_file), frame], ignore_index=True)
+    os.makedirs(os.path.dirname(columnar_file), exist_ok=True)
+    # 以 "." 開頭的暫存文件不會被數據集掃描讀取
+    temp_file = os.path.join(os.path.dirname(columnar_file), f".{os.path.basename(columnar_file)}.tmp")
+    try:
+        frame.to_parquet(temp_file, index=False, compression="zstd")
+        os.replace(temp_file, columnar_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    return columnar_file
+
+
+def get_columnar_summary(columnar_file, date_column="日期"):
+    """
+    讀取 Parquet 文件的行數、欄位與最後日期 (只讀取日期欄位)
+
+    Returns:
+        tuple: (行數, 欄位列表, 最後日期 YYYY-MM-DD 或 None)；文件不存在時為 None
+    """
+    if not columnar_file or not os.path.exists(columnar_file):
+        return None
+    import pyarrow.parquet as pq
+    parquet_file = pq.ParquetFile(columnar_file)
+    columns = parquet_file.schema_arrow.names
+    last_date = None
+    if date_column in columns and parquet_file.metadata.num_rows:
+        dates = pd.to_datetime(parquet_file.read(columns=[date_column]).column(0).to_pandas(), errors="coerce")
+        if dates.notna().any():
+            last_date = dates.max().strftime("%Y-%m-%d")
+    return parquet_file.metadata.num_rows, columns, last_date
+
+
+def list_data_files(directory):
+    """
+    列出目錄中的數據文件名 (與 os.listdir 相同，只含文件名)
+
+    除了既有的 CSV 文件，也包含只存在於列式存儲或本地整合數據庫的輸出 (以對應的 CSV 文件名表示)，
+    讓 FINDMIND_COLUMNAR=only 或只保留數據庫時讀取腳本仍能依文件名尋找數據。
+    """
+    file_names = set(os.listdir(directory)) if os.path.isdir(directory) else set()
+    name = os.path.basename(os.path.normpath(directory))
+    # 延遲匯入：local_store 匯入本模組
+    from local_store import get_store
+    store = get_store(create=False)
+    if store is not None:
+        for spec in get_datasets():
+            if spec.directory == name:
+                file_names.update(os.path.basename(window["output_file"]) for window in store.windows(spec.name))
+    if not os.path.isdir(get_columnar_dir()) or not is_pyarrow_available():
+        return sorted(file_names)
+    for spec in get_datasets():
+        if spec.directory != name:
+            continue
+        dataset_dir = os.path.join(get_columnar_dir(), spec.name)
+        if not os.path.isdir(dataset_dir):
+            continue
+        for partition in os.listdir(dataset_dir):
+            if not partition.startswith("stock_id="):
+                continue
+            stock_id = partition[len("stock_id="):]
+            for file_name in os.listdir(os.path.join(dataset_dir, partition)):
+                match = COLUMNAR_FILE_PATTERN.match(file_name)
+                if match:
+                    file_names.add(os.path.basename(spec.output_file(stock_id, match.group(1), match.group(2))))
+    return sorted(file_names)
+
+
+def read_data_file(file_path, **read_csv_kwargs):
+    """
+    讀取數據文件：對應的 Parquet 文件存在時優先讀取，否則以 pd.read_csv 讀取 CSV；
+    CSV 文件不存在時從本地整合數據庫讀取
+    """
+    columnar_file = get_columnar_path(file_path)
+    if columnar_file and os.path.exists(columnar_file) and is_pyarrow_available():
+        return pd.read_parquet(columnar_file)
+    if not os.path.exists(file_path):
+        from local_store import get_store
+        store = get_store(create=False)
+        frame = store.read_window(file_path) if store is not None else None
+        if frame is not None:
+            return frame
+    read_csv_kwargs.setdefault("encoding", "utf-8")
+    return pd.read_csv(file_path, **read_csv_kwargs)
+
+
+def read_dataset(dataset, stock_id=None):
+    """
+    以單次列式掃描讀取整個數據集 (或單一股票的分區)
+
+    Returns:
+        DataFrame: 包含分區欄位 stock_id；沒有數據時為 None
+    """
+    if not is_pyarrow_available():
+        return None
+    dataset_dir = os.path.join(get_columnar_dir(), dataset)
+    if stock_id is not None:
+        dataset_dir = os.path.join(dataset_dir, f"stock_id={stock_id}")
+    if not os.path.isdir(dataset_dir):
+        return None
+    frame = pd.read_parquet(dataset_dir)
+    # 分區欄位的型別由目錄名稱推斷，統一為字串
+    frame["stock_id"] = str(stock_id) if stock_id is not None else frame["stock_id"].astype(str)
+    return frame
@@ -0,0 +1,212 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+dataset_registry.py
+
+FinMind 數據集登錄表：每個數據集以宣告方式描述請求參數、API 欄位與
+CSV 標題的對應、欄位型別、新鮮度策略與輸出路徑樣板。
+抓取程式以同一個通用函數處理所有登錄的數據集，新增數據集只需新增一筆登錄，
+或在 FINDMIND_DATASETS 指定的 JSON 文件中描述，不需要新增程式碼。
+
+JSON 文件為數據集描述的列表，鍵與 DatasetSpec 的參數相同，例如:
+
+[{"name": "TaiwanStockMarginPurchaseShortSale", "directory": "margin", "file_suffix": "-margin.csv",
+  "columns": [["date", "日期"], ["stock_id", "股票代碼"], ["MarginPurchaseTodayBalance", "融資今日餘額"]],
+  "dtypes": {"MarginPurchaseTodayBalance": "Int64"}, "freshness": "end_date", "label": "margin"}]
+"""
+import json
+import os
+import threading
+
+# 新鮮度策略
+# - end_date: 文件最後一行的日期達到結束日期即為完整，可只請求缺少的尾段
+# - recent_window: 文件有數據且結束日期不在今兩個月內即不再請求
+FRESHNESS_POLICIES = ("end_date", "recent_window")
+
+DEFAULT_PATH_TEMPLATE = "{directory}/[{stock_id}] {start_date}-{end_date}{file_suffix}"
+
+
+class DatasetSpec:
+    """
+    單一數據集的描述
+
+    Parameters:
+    - name: FinMind 數據集名稱 (也是 manifest 與快取使用的數據集鍵)
+    - directory: 輸出目錄
+    - file_suffix: 輸出文件名後綴 (接在 "[id] start-end" 之後)
+    - columns: (API 欄位, CSV 標題) 的列表，依輸出順序排列
+    - dtypes: API 欄位 -> pandas 數值型別，寫入前轉換；轉換失敗時保留原值，未列出的欄位視為字串
+    - key: 一筆數據的唯一鍵 (API 欄位)，本地數據庫以此為主鍵進行 upsert
+    - freshness: 新鮮度策略，見 FRESHNESS_POLICIES
+    - params: 請求時帶入的參數，可為 data_id、start_date、end_date
+    - incremental: 文件已有部分數據時只請求並附加缺少的尾段 (需 freshness 為 end_date)
+    - streaming: FINDMIND_STREAMING=1 時邊接收邊寫入
+    - snapshot_file: 設定時改為請求一次全表快照並依股票代碼切出 (不帶 data_id)
+    - cache_ttl: 回應快取中開放期間的預設存活秒數
+    - weight: 優先排程的權重 (越高越重要)
+    - label: 訊息中使用的簡稱
+    - path_template: 輸出路徑樣板
+    """
+
+    def __init__(self, name, directory, file_suffix, columns, dtypes=None, key=("stock_id", "date"),
+                 freshness="recent_window", params=("data_id", "start_date", "end_date"), incremental=False,
+                 streaming=False, snapshot_file=None, cache_ttl=3600, weight=1.0, label=None,
+                 path_template=DEFAULT_PATH_TEMPLATE):
+        if freshness not in FRESHNESS_POLICIES:
+            raise ValueError(f"Unknown freshness policy {freshness!r} for dataset {name}")
+        if incremental and freshness != "end_date":
+            raise ValueError(f"Dataset {name}: incremental fetching requires the end_date freshness policy")
+        self.name = name
+        self.directory = directory
+        self.file_suffix = file_suffix
+        self.columns = [tuple(column) for column in columns]
+        self.dtypes = dict(dtypes or {})
+        self.key = tuple(key)
+        self.freshness = freshness
+        self.params = tuple(params)
+        self.incremental = incremental
+        self.streaming = streaming
+        self.snapshot_file = snapshot_file
+        self.cache_ttl = cache_ttl
+        self.weight = weight
+        self.label = label or name
+        self.path_template = path_template
+
+    @property
+    def fields(self):
+        return [field for field, _ in self.columns]
+
+    @property
+    def header(self):
+        return [title for _, title in self.columns]
+
+    @property
+    def is_date_ranged(self):
+        """請求是否帶有日期範圍 (可合併重疊期間)"""
+        return "start_date" in self.params
+
+    def output_file(self, stock_id, start_date, end_date):
+        return self.path_template.format(directory=self.directory, stock_id=stock_id, start_date=start_date,
+                                         end_date=end_date, file_suffix=self.file_suffix)
+
+    def build_params(self, api_token, stock_id, start_date, end_date):
+        values = {"data_id": stock_id, "start_date": start_date, "end_date": end_date}
+        params = {"dataset": self.name}
+        params.update((key, values[key]) for key in self.params)
+        params["token"] = api_token
+        return params
+
+    def to_row(self, record):
+        """將單筆 API 紀錄轉為 CSV 數據行 (串流寫入時使用)"""
+        return [record.get(field) for field in self.fields]
+
+
+# 依抓取順序排列的內建數據集
+DATASETS = [
+    DatasetSpec(
+        "TaiwanStockPrice", "stockdata", ".csv",
+        [("date", "日期"), ("stock_id", "股票代碼"), ("Trading_Volume", "成交量"), ("Trading_money", "成交金額"),
+         ("open", "開盤價"), ("max", "最高價"), ("min", "最低價"), ("close", "收盤價"), ("spread", "漲跌幅"),
+         ("Trading_turnover", "交易筆數")],
+        dtypes={"Trading_Volume": "Int64", "Trading_money": "Int64", "Trading_turnover": "Int64",
+                "open": "float64", "max": "float64", "min": "float64", "close": "float64", "spread": "float64"},
+        freshness="end_date", incremental=True, cache_ttl=3600, weight=3.0, label="stock price"),
+    DatasetSpec(
+        "TaiwanStockDividend", "dividend", "-dividend.csv",
+        [("date", "日期"), ("stock_id", "股票代碼"), ("year", "年"),
+         ("StockEarningsDistribution", "股票收益分配"), ("StockStatutorySurplus", "股票法定盈餘"),
+         ("StockExDividendTradingDate", "股票除息交易日"), ("TotalEmployeeStockDividend", "員工股票股利額"),
+         ("TotalEmployeeStockDividendAmount", "員工股票股利總額"),
+         ("RatioOfEmployeeStockDividendOfTotal", "員工股票紅利佔總股本比例"),
+         ("RatioOfEmployeeStockDividend", "員工股票股利比例"), ("CashEarningsDistribution", "現金盈餘分配"),
+         ("CashStatutorySurplus", "現金法定盈餘"), ("CashExDividendTradingDate", "現金除息交易日"),
+         ("CashDividendPaymentDate", "現金股利支付日"), ("TotalEmployeeCashDividend", "員工現金紅利總額"),
+         ("TotalNumberOfCashCapitalIncrease", "現金資本增加總數"),
+         ("CashIncreaseSubscriptionRate", "現金增加認購利率"), ("CashIncreaseSubscriptionpRrice", "現金增加認購價"),
+         ("RemunerationOfDirectorsAndSupervisors", "董事、監事報酬"),
+         ("ParticipateDistributionOfTotalShares", "參與分配股份總數"), ("AnnouncementDate", "公告日期"),
+         ("AnnouncementTime", "公告時間")],
+        dtypes={field: "float64" for field in (
+            "StockEarningsDistribution", "StockStatutorySurplus", "TotalEmployeeStockDividend",
+            "TotalEmployeeStockDividendAmount", "RatioOfEmployeeStockDividendOfTotal", "RatioOfEmployeeStockDividend",
+            "CashEarningsDistribution", "CashStatutorySurplus", "TotalEmployeeCashDividend",
+            "TotalNumberOfCashCapitalIncrease", "CashIncreaseSubscriptionRate", "CashIncreaseSubscriptionpRrice",
+            "RemunerationOfDirectorsAndSupervisors", "ParticipateDistributionOfTotalShares")},
+        key=("stock_id", "date", "year"), cache_ttl=86400, weight=1.0, label="dividend"),
+    DatasetSpec(
+        "TaiwanStockPER", "PER_PBR", "-PER_PBR.csv",
+        [("date", "日期"), ("stock_id", "股票代碼"), ("dividend_yield", "股息殖利率"), ("PER", "PER"), ("PBR", "PBR")],
+        dtypes={"dividend_yield": "float64", "PER": "float64", "PBR": "float64"},
+        freshness="end_date", incremental=True, cache_ttl=3600, weight=2.0, label="PER_PBR"),
+    DatasetSpec(
+        "TaiwanStockInfo", "company-profile", "-company-profile.csv",
+        [("industry_category", "行業類別"), ("stock_id", "股票代碼"), ("stock_name", "股票名稱"), ("type", "類型"),
+         ("date", "日期")],
+        key=("stock_id", "industry_category", "type"), params=("data_id",),
+        snapshot_file="company-profile/.TaiwanStockInfo.json", cache_ttl=86400, weight=1.0, label="company_profile"),
+    DatasetSpec(
+        "TaiwanStockFinancialStatements", "financial", "-financial.csv",
+        [("date", "日期"), ("stock_id", "股票代碼"), ("type", "類型"), ("value", "值"), ("origin_name", "名稱")],
+        dtypes={"value": "float64"}, key=("stock_id", "date", "type"), streaming=True, cache_ttl=86400, weight=1.5,
+        label="financialstatements"),
+]
+
+# TWSE (TAIEX) 與 TPEX (TPEx) 指數：兩個市場的 TaiwanStockPrice 依日期合併為一行，
+# 由抓取程式的指數數據庫維護；columns 為每個市場的 (API 欄位, 標題)，標題前加上市場名稱
+MARKET_INDEX_SPEC = DatasetSpec(
+    "TWSE_TPEX", "TWSE_TPEX", "-TWSE_TPEX.csv",
+    [("close", "收盤指數"), ("open", "開盤價"), ("max", "最高價"), ("min", "最低價"), ("spread", "漲跌點數"),
+     ("spread_ratio", "漲跌幅")],
+    freshness="end_date", cache_ttl=3600, weight=1.0, label="TWSE/TPEX")
+MARKET_INDEX_MARKETS = {"TWSE": "TAIEX", "TPEX": "TPEx"}
+MARKET_INDEX_HEADER = ["日期"] + [f"{market}{title}" for market in MARKET_INDEX_MARKETS for title in MARKET_INDEX_SPEC.header]
+
+_extensions_loaded = False
+_registry_lock = threading.Lock()
+
+
+def register_dataset(spec):
+    """新增或取代同名的數據集"""
+    with _registry_lock:
+        for index, existing in enumerate(DATASETS):
+            if existing.name == spec.name:
+                DATASETS[index] = spec
+                return spec
+        DATASETS.append(spec)
+    return spec
+
+
+def load_dataset_file(path):
+    """
+    從 JSON 文件登錄數據集
+
+    Returns:
+        int: 登錄的數據集數
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        definitions = json.load(f)
+    for definition in definitions:
+        register_dataset(DatasetSpec(**definition))
+    return len(definitions)
+
+
+def get_datasets():
+    """回傳所有數據集；第一次呼叫時載入 FINDMIND_DATASETS 指定的 JSON 文件"""
+    global _extensions_loaded
+    if not _extensions_loaded:
+        _extensions_loaded = True
+        path = os.getenv("FINDMIND_DATASETS", "")
+        if path:
+            try:
+                print(f"Registered {load_dataset_file(path)} datasets from {path}")
+            except (OSError, ValueError, TypeError) as e:
+                print(f"Error loading FINDMIND_DATASETS file {path}: {e}")
+    return list(DATASETS)
+
+
+def get_dataset(name):
+    """依名稱取得數據集，不存在時為 None"""
+    for spec in get_datasets():
+        if spec.name == name:
+            return spec
+    return None
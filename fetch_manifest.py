@@ -0,0 +1,331 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+fetch_manifest.py
+
+本地 SQLite 抓取紀錄 (manifest)：以 (dataset, stock_id, start_date, end_date)
+為鍵，記錄每次抓取的時間、最後數據日期、行數、內容雜湊與 HTTP 狀態碼，
+讓抓取程式與讀取腳本以索引查詢取代目錄掃描與文件解析。
+
+SQLite 文件不提交至版本庫：抓取結束時將所有紀錄依鍵排序匯出為文字文件
+(與數據庫同名的 .jsonl，一行一筆紀錄)，開啟數據庫時再從匯出文件重建，
+版本庫中的差異可直接閱讀，每次執行也不會新增一份完整的二進位文件。
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+from dataset_registry import get_datasets
+
+DEFAULT_MANIFEST_PATH = "fetch_manifest.sqlite"
+
+# fetches 表的欄位，也是匯出文件中每筆紀錄的鍵順序
+MANIFEST_COLUMNS = ("dataset", "stock_id", "start_date", "end_date", "output_file", "fetched_at",
+                    "last_data_date", "row_count", "payload_hash", "http_status")
+
+FILE_NAME_PATTERN = re.compile(r"^\[(.+?)\] (\d{4}-\d{2}-\d{2})-(\d{4}-\d{2}-\d{2})(.*)$")
+
+
+def hash_payload(records):
+    """計算 API 回傳數據的 SHA-256 雜湊"""
+    payload = json.dumps(records, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PayloadHasher:
+    """逐筆累加計算雜湊，結果與對整個列表呼叫 hash_payload 相同"""
+
+    def __init__(self):
+        self.sha = hashlib.sha256(b"[")
+        self.count = 0
+
+    def update(self, record):
+        prefix = ", " if self.count else ""
+        self.sha.update((prefix + json.dumps(record, sort_keys=True, ensure_ascii=False, default=str)).encode("utf-8"))
+        self.count += 1
+
+    def hexdigest(self):
+        sha = self.sha.copy()
+        sha.update(b"]")
+        return sha.hexdigest()
+
+
+def get_export_path(path):
+    """manifest 的文字匯出文件：與數據庫同名，副檔名為 .jsonl"""
+    return f"{os.path.splitext(path)[0]}.jsonl"
+
+
+def get_dataset_directories():
+    """數據集 -> (目錄, 文件名後綴)，用於從既有文件補齊紀錄"""
+    return {spec.name: (spec.directory, spec.file_suffix) for spec in get_datasets()}
+
+
+def parse_data_file_name(file_name):
+    """
+    解析 "[id] start-end-suffix.csv" 格式的文件名
+
+    Returns:
+        tuple: (stock_id, start_date, end_date, suffix)，格式不符時為 None
+    """
+    match = FILE_NAME_PATTERN.match(file_name)
+    if not match:
+        return None
+    return match.group(1), match.group(2), match.group(3), match.group(4)
+
+
+def match_data_file(output_file, specs=None):
+    """
+    依目錄與文件名後綴找出輸出文件所屬的數據集
+
+    Parameters:
+    - output_file: 輸出文件路徑，例如 "stockdata/[2330] 2024-01-01-2024-02-01.csv"
+    - specs: 候選的數據集描述，預設為登錄表中的所有數據集
+
+    Returns:
+        tuple: (spec, stock_id, start_date, end_date)；不是數據集的輸出文件時為 None
+    """
+    directory = os.path.basename(os.path.dirname(os.path.normpath(output_file)))
+    parsed = parse_data_file_name(os.path.basename(output_file))
+    if not parsed:
+        return None
+    stock_id, start_date, end_date, suffix = parsed
+    for spec in (get_datasets() if specs is None else specs):
+        if spec.directory == directory and spec.file_suffix == suffix:
+            return spec, stock_id, start_date, end_date
+    return None
+
+
+def summarize_csv_file(file_path):
+    """讀取既有 CSV 文件的行數與最後一行的日期 (第一欄)"""
+    row_count = 0
+    last_line = None
+    with open(file_path, "r", encoding="utf-8-sig") as f:
+        header = f.readline()
+        for line in f:
+            if line.strip():
+                row_count += 1
+                last_line = line
+    last_data_date = None
+    if header.startswith("日期") and last_line:
+        candidate = last_line.split(",", 1)[0].strip()
+        if re.match(r"^\d{4}-\d{2}-\d{2}$", candidate):
+            last_data_date = candidate
+    return row_count, last_data_date
+
+
+class FetchManifest:
+    """
+    SQLite 抓取紀錄
+
+    開啟時匯入文字匯出文件 (export_path) 中較新的紀錄，export() 將所有紀錄寫回匯出文件。
+
+    Parameters:
+    - path: SQLite 文件路徑
+    """
+
+    def __init__(self, path=DEFAULT_MANIFEST_PATH):
+        self.path = path
+        self.export_path = get_export_path(path)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS fetches (
+                    dataset TEXT NOT NULL,
+                    stock_id TEXT NOT NULL,
+                    start_date TEXT NOT NULL,
+                    end_date TEXT NOT NULL,
+                    output_file TEXT,
+                    fetched_at TEXT,
+                    last_data_date TEXT,
+                    row_count INTEGER,
+                    payload_hash TEXT,
+                    http_status INTEGER,
+                    PRIMARY KEY (dataset, stock_id, start_date, end_date)
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_fetches_stock ON fetches (stock_id, dataset)")
+        if os.path.exists(self.export_path):
+            self.import_export()
+
+    def record(self, dataset, stock_id, start_date, end_date, output_file=None, records=None,
+               last_data_date=None, row_count=None, http_status=None, payload_hash=None):
+        """
+        新增或更新一筆抓取紀錄；未提供的欄位保留原值
+
+        Parameters:
+        - records: 本次 API 回傳的數據，用於計算雜湊
+        - last_data_date: 文件中最後一筆數據的日期
+        - row_count: 文件的數據行數
+        - http_status: 最後一次請求的 HTTP 狀態碼
+        - payload_hash: 已計算好的雜湊 (串流寫入時使用)，提供時忽略 records
+        """
+        if payload_hash is None and records is not None:
+            payload_hash = hash_payload(records)
+        fetched_at = datetime.now().isoformat(timespec="seconds")
+        with self.lock, self.conn:
+            self.conn.execute("""
+                INSERT INTO fetches (dataset, stock_id, start_date, end_date, output_file, fetched_at,
+                                     last_data_date, row_count, payload_hash, http_status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (dataset, stock_id, start_date, end_date) DO UPDATE SET
+                    output_file = COALESCE(excluded.output_file, output_file),
+                    fetched_at = excluded.fetched_at,
+                    last_data_date = COALESCE(excluded.last_data_date, last_data_date),
+                    row_count = COALESCE(excluded.row_count, row_count),
+                    payload_hash = COALESCE(excluded.payload_hash, payload_hash),
+                    http_status = COALESCE(excluded.http_status, http_status)
+            """, (dataset, str(stock_id), start_date, end_date, output_file, fetched_at,
+                  last_data_date, row_count, payload_hash, http_status))
+
+    def lookup(self, dataset, stock_id, start_date, end_date):
+        """查詢單一紀錄，不存在時為 None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT * FROM fetches WHERE dataset = ? AND stock_id = ? AND start_date = ? AND end_date = ?",
+                (dataset, str(stock_id), start_date, end_date)).fetchone()
+        return dict(row) if row else None
+
+    def entries(self, dataset=None, stock_id=None):
+        """依數據集與股票代碼查詢紀錄，依開始日期排序"""
+        conditions = []
+        params = []
+        if dataset is not None:
+            conditions.append("dataset = ?")
+            params.append(dataset)
+        if stock_id is not None:
+            conditions.append("stock_id = ?")
+            params.append(str(stock_id))
+        query = "SELECT * FROM fetches"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY stock_id, start_date, end_date"
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def sync_with_directories(self, base_dir="."):
+        """
+        為尚未記錄的既有文件補上紀錄 (行數與最後日期)，不更新已有紀錄
+
+        Returns:
+            int: 新增的紀錄數
+        """
+        with self.lock:
+            known = {row[0] for row in self.conn.execute("SELECT output_file FROM fetches WHERE output_file IS NOT NULL")}
+        new_rows = []
+        for dataset, (directory, suffix) in get_dataset_directories().items():
+            full_dir = os.path.join(base_dir, directory)
+            if not os.path.isdir(full_dir):
+                continue
+            for file_name in os.listdir(full_dir):
+                output_file = f"{directory}/{file_name}"
+                if output_file in known:
+                    continue
+                parsed = parse_data_file_name(file_name)
+                if not parsed or parsed[3] != suffix:
+                    continue
+                try:
+                    row_count, last_data_date = summarize_csv_file(os.path.join(full_dir, file_name))
+                except (OSError, UnicodeDecodeError) as e:
+                    print(f"讀取文件 {output_file} 時發生錯誤: {e}")
+                    continue
+                stock_id, start_date, end_date, _ = parsed
+                new_rows.append((dataset, stock_id, start_date, end_date, output_file, last_data_date, row_count))
+        with self.lock, self.conn:
+            self.conn.executemany("""
+                INSERT OR IGNORE INTO fetches (dataset, stock_id, start_date, end_date, output_file,
+                                               last_data_date, row_count)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, new_rows)
+        return len(new_rows)
+
+    def import_export(self, export_path=None):
+        """
+        從文字匯出文件重建紀錄：數據庫中沒有的紀錄直接加入，
+        已有的紀錄只在匯出文件的抓取時間較新時取代
+
+        Returns:
+            int: 讀取的紀錄數
+        """
+        export_path = export_path or self.export_path
+        rows = []
+        with open(export_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    rows.append(tuple(entry.get(column) for column in MANIFEST_COLUMNS))
+                except (ValueError, AttributeError):
+                    print(f"略過 manifest 匯出文件 {export_path} 中格式錯誤的一行")
+        columns = ", ".join(MANIFEST_COLUMNS)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in MANIFEST_COLUMNS[4:])
+        with self.lock, self.conn:
+            self.conn.executemany(f"""
+                INSERT INTO fetches ({columns}) VALUES ({", ".join("?" for _ in MANIFEST_COLUMNS)})
+                ON CONFLICT (dataset, stock_id, start_date, end_date) DO UPDATE SET {updates}
+                WHERE COALESCE(excluded.fetched_at, '') > COALESCE(fetches.fetched_at, '')
+            """, rows)
+        return len(rows)
+
+    def export(self, export_path=None):
+        """
+        將所有紀錄依 (dataset, stock_id, start_date, end_date) 排序寫入文字匯出文件
+        (暫存文件寫入後再以 os.replace 取代)
+
+        Returns:
+            int: 匯出的紀錄數
+        """
+        export_path = export_path or self.export_path
+        with self.lock:
+            rows = self.conn.execute(f"SELECT {', '.join(MANIFEST_COLUMNS)} FROM fetches "
+                                     "ORDER BY dataset, stock_id, start_date, end_date").fetchall()
+        temp_file = f"{export_path}.tmp"
+        try:
+            with open(temp_file, "w", encoding="utf-8", newline="\n") as f:
+                for row in rows:
+                    f.write(json.dumps(dict(zip(MANIFEST_COLUMNS, row)), ensure_ascii=False) + "\n")
+            os.replace(temp_file, export_path)
+        except BaseException:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+        return len(rows)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def get_manifest():
+    """
+    取得整個程序共用的 FetchManifest
+
+    路徑由 FINDMIND_MANIFEST 指定；設為空字串時停用並回傳 None。
+    """
+    global _manifest
+    path = os.getenv("FINDMIND_MANIFEST", DEFAULT_MANIFEST_PATH)
+    if not path:
+        return None
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = FetchManifest(path)
+        return _manifest
+
+
+def open_manifest(path=None):
+    """供讀取腳本使用：manifest 數據庫或其匯出文件存在時開啟 (必要時從匯出文件重建)，否則回傳 None"""
+    path = path or os.getenv("FINDMIND_MANIFEST", DEFAULT_MANIFEST_PATH)
+    if not path or not (os.path.exists(path) or os.path.exists(get_export_path(path))):
+        return None
+    return FetchManifest(path)
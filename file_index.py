@@ -0,0 +1,157 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+file_index.py
+
+數據目錄的文件索引：每個目錄的 "[id] start-end-suffix.csv" 文件名只列出與解析一次，
+建立 股票代碼 -> [(開始日期, 結束日期, 文件路徑)] 的字典，讀取腳本以字典查詢取代逐一掃描所有文件名。
+
+文件列表來自 list_data_files (包含只存在於列式存儲或本地整合數據庫的輸出)，
+解析結果保存在快取文件 (預設 .file_index.json)，以目錄、列式存儲分區與數據庫文件的修改時間
+判斷是否過期；目錄內容不變時下次執行不需要重新列出目錄。
+"""
+import json
+import os
+import threading
+
+from columnar_store import get_columnar_dir, is_pyarrow_available, list_data_files
+from dataset_registry import get_datasets
+from fetch_manifest import parse_data_file_name
+
+DEFAULT_FILE_INDEX_CACHE = ".file_index.json"
+
+CACHE_VERSION = 1
+
+
+def get_mtime(path):
+    """文件或目錄的修改時間 (奈秒)，不存在時為 None"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_directory_signature(directory):
+    """
+    目錄內容的簽名：數據目錄、對應的列式存儲數據集與分區目錄、本地整合數據庫文件的修改時間
+
+    新增、刪除或更名文件都會改變所在目錄的修改時間，簽名不同時快取的索引視為過期。
+    """
+    # 延遲匯入：local_store 匯入 columnar_store
+    from local_store import get_store_path
+    signature = [[directory, get_mtime(directory)]]
+    store_path = get_store_path()
+    if store_path:
+        signature.extend([path, get_mtime(path)] for path in (store_path, f"{store_path}-wal"))
+    if not os.path.isdir(get_columnar_dir()) or not is_pyarrow_available():
+        return signature
+    name = os.path.basename(os.path.normpath(directory))
+    for spec in get_datasets():
+        if spec.directory != name:
+            continue
+        dataset_dir = os.path.join(get_columnar_dir(), spec.name)
+        signature.append([dataset_dir, get_mtime(dataset_dir)])
+        if os.path.isdir(dataset_dir):
+            signature.extend([os.path.join(dataset_dir, partition), get_mtime(os.path.join(dataset_dir, partition))]
+                             for partition in sorted(os.listdir(dataset_dir)))
+    return signature
+
+
+def scan_directory(directory):
+    """
+    列出並解析目錄中的數據文件名
+
+    Returns:
+        list: [股票代碼, 開始日期, 結束日期, 文件名] 的列表，依 list_data_files 的順序；
+              不符合 "[id] start-end-suffix" 格式的文件不列入
+    """
+    entries = []
+    for file_name in list_data_files(directory):
+        parsed = parse_data_file_name(file_name)
+        if parsed:
+            stock_id, start_date, end_date, _ = parsed
+            entries.append([stock_id, start_date, end_date, file_name])
+    return entries
+
+
+def load_index_cache(cache_path, directory, signature):
+    """讀取快取的目錄索引，過期或不存在時為 None"""
+    if not cache_path or not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        if cache.get("version") != CACHE_VERSION:
+            return None
+        cached = cache["directories"].get(directory)
+        if cached is None or cached["signature"] != signature:
+            return None
+        return cached["files"]
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def save_index_cache(cache_path, directory, signature, entries):
+    """更新快取文件中單一目錄的索引 (暫存文件寫入後再以 os.replace 取代)"""
+    cache = {"version": CACHE_VERSION, "directories": {}}
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                existing = json.load(f)
+            if existing.get("version") == CACHE_VERSION and isinstance(existing.get("directories"), dict):
+                cache = existing
+        except (OSError, ValueError, AttributeError):
+            pass
+    cache["directories"][directory] = {"signature": signature, "files": entries}
+    temp_file = f"{cache_path}.tmp"
+    try:
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(temp_file, cache_path)
+    except OSError as e:
+        print(f"保存文件索引快取 {cache_path} 時發生錯誤: {e}")
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+
+_directories = {}
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_directory_entries(directory):
+    """取得目錄的解析結果 (同一程序內只列出一次，並優先使用快取文件)"""
+    if directory not in _directories:
+        cache_path = os.getenv("FINDMIND_FILE_INDEX_CACHE", DEFAULT_FILE_INDEX_CACHE)
+        signature = get_directory_signature(directory) if cache_path else None
+        entries = load_index_cache(cache_path, directory, signature)
+        if entries is None:
+            entries = scan_directory(directory)
+            if cache_path:
+                save_index_cache(cache_path, directory, signature, entries)
+        _directories[directory] = entries
+    return _directories[directory]
+
+
+def get_file_index(directory, suffix=".csv"):
+    """
+    取得目錄的文件索引 (同一程序內共用)
+
+    快取文件路徑由 FINDMIND_FILE_INDEX_CACHE 指定 (預設 .file_index.json)，設為空字串時不使用快取。
+
+    Parameters:
+    - directory: 數據目錄，例如 "stockdata"
+    - suffix: 只包含以此結尾的文件，例如 "-dividend.csv"
+
+    Returns:
+        dict: 股票代碼 -> [(開始日期, 結束日期, 文件路徑)]，同一股票的文件依文件名排序
+    """
+    with _indexes_lock:
+        key = (directory, suffix)
+        if key not in _indexes:
+            index = {}
+            for stock_id, start_date, end_date, file_name in get_directory_entries(directory):
+                if file_name.endswith(suffix):
+                    index.setdefault(stock_id, []).append((start_date, end_date, os.path.join(directory, file_name)))
+            _indexes[key] = index
+        return _indexes[key]
@@ -0,0 +1,631 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+finmind_client.py
+
+FinMind API 共用客戶端：所有數據集請求都透過同一個 requests.Session，
+以連線池與 keep-alive 重複使用 TCP/TLS 連線，並統一設定逾時時間。
+請求前經過令牌桶限流 (每小時配額 + 突發量)，遇到 429/402/5xx 時以
+指數退避加隨機抖動重試；連續觸發配額錯誤時熔斷器會暫停所有請求，
+而不是繼續消耗配額。成功的回應會寫入本地磁碟快取 (response_cache.py)，
+存活時間內的重複請求直接由快取回應。
+大型回應可用 stream_data 逐筆解析，不需將整個 JSON 載入記憶體。
+asyncio 後端使用 AsyncFinMindClient (需要 aiohttp)，請求在事件循環上進行，共用同一組限流與快取設定。
+"""
+import asyncio
+import codecs
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from response_cache import create_response_cache
+
+DEFAULT_API_URL = "https://api.finmindtrade.com/api/v4/data"
+
+# 配額相關狀態碼 (FinMind 超過配額時回傳 402)
+QUOTA_STATUS_CODES = (402, 429)
+# 可重試的狀態碼
+RETRY_STATUS_CODES = QUOTA_STATUS_CODES + (500, 502, 503, 504)
+# 串流解析時每次從 socket 讀取的位元組數
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def get_env_int(name, default):
+    """讀取整數環境變數，格式錯誤時使用預設值"""
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        print(f"Invalid {name} value, using default {default}")
+        return default
+
+
+def get_default_pool_size():
+    """
+    預設連線池大小：至少 10，且不小於同時進行的請求數
+    (FINDMIND_MAX_WORKERS；asyncio 後端時另外考慮 FINDMIND_ASYNC_CONCURRENCY)
+    """
+    size = max(10, get_env_int("FINDMIND_MAX_WORKERS", 1))
+    if os.getenv("FINDMIND_BACKEND", "threads").strip().lower() == "asyncio":
+        size = max(size, get_env_int("FINDMIND_ASYNC_CONCURRENCY", 32))
+    return size
+
+
+def get_env_float(name, default):
+    """讀取浮點數環境變數，格式錯誤時使用預設值"""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        print(f"Invalid {name} value, using default {default}")
+        return default
+
+
+class QuotaExceededError(requests.RequestException):
+    """配額耗盡且暫停時間超過上限時拋出，讓呼叫端照常略過該請求"""
+
+
+class TokenBucket:
+    """
+    令牌桶限流器
+
+    Parameters:
+    - rate_per_hour: 每小時可發出的請求數，0 表示不限流
+    - burst: 令牌桶容量 (允許的突發請求數)
+    """
+
+    def __init__(self, rate_per_hour, burst):
+        self.rate = rate_per_hour / 3600.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """預留一個令牌 (允許為負)，回傳需要等待補足的秒數"""
+        if self.rate <= 0:
+            return 0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def acquire(self):
+        """取得一個令牌，必要時阻塞等待"""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """acquire 的 asyncio 版本，等待時不阻塞事件循環"""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    配額熔斷器：連續配額錯誤達到門檻後暫停所有請求一段冷卻時間
+
+    Parameters:
+    - failure_threshold: 連續配額錯誤次數門檻
+    - cooldown: 熔斷後暫停秒數
+    - max_pause: 單次請求最多願意等待的秒數，超過則拋出 QuotaExceededError
+    """
+
+    def __init__(self, failure_threshold, cooldown, max_pause):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.max_pause = max_pause
+        self.failures = 0
+        self.open_until = 0.0
+        self.lock = threading.Lock()
+
+    def get_pause(self):
+        """熔斷期間需要暫停的秒數，超過上限時拋出 QuotaExceededError"""
+        with self.lock:
+            remaining = self.open_until - time.monotonic()
+        if remaining <= 0:
+            return 0
+        if remaining > self.max_pause:
+            raise QuotaExceededError(f"FinMind quota exhausted, circuit open for another {remaining:.0f}s")
+        print(f"FinMind quota circuit open, pausing {remaining:.0f}s")
+        return remaining
+
+    def wait_until_closed(self):
+        """熔斷期間等待冷卻結束"""
+        pause = self.get_pause()
+        if pause > 0:
+            time.sleep(pause)
+
+    async def wait_until_closed_async(self):
+        """wait_until_closed 的 asyncio 版本"""
+        pause = self.get_pause()
+        if pause > 0:
+            await asyncio.sleep(pause)
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+
+    def record_quota_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold and self.open_until <= time.monotonic():
+                self.open_until = time.monotonic() + self.cooldown
+                print(f"FinMind quota reached {self.failures} times in a row, opening circuit for {self.cooldown:.0f}s")
+
+
+class JsonRecordStream:
+    """
+    增量解析 FinMind 回應 {"msg": ..., "status": ..., "data": [{...}, ...]}
+
+    從位元組區塊逐筆產生 data 陣列中的紀錄，其他頂層欄位存入 fields；
+    緩衝區只保留尚未解析的部分。
+
+    Parameters:
+    - chunks: 位元組區塊的可迭代物件，例如 response.iter_content()
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.exhausted = False
+        self.fields = {}
+
+    def read_more(self):
+        """讀入下一個區塊，數據已結束時回傳 False"""
+        if self.exhausted:
+            return False
+        for chunk in self.chunks:
+            text = self.text_decoder.decode(chunk)
+            if text:
+                self.buffer = self.buffer[self.pos:] + text
+                self.pos = 0
+                return True
+        self.buffer = self.buffer[self.pos:] + self.text_decoder.decode(b"", final=True)
+        self.pos = 0
+        self.exhausted = True
+        return False
+
+    def peek(self):
+        """略過空白並回傳下一個字元，數據結束時回傳空字串"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.read_more():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Malformed FinMind response: expected {char!r}, found {found!r}")
+        self.pos += 1
+
+    def decode_value(self):
+        """解析下一個完整的 JSON 值，不完整時繼續讀入數據"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # 數字可能被區塊邊界截斷，結尾剛好在緩衝區末端時需再確認
+                if end < len(self.buffer) or self.exhausted:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.exhausted:
+                    raise
+            self.read_more()
+
+    def __iter__(self):
+        self.expect("{")
+        while True:
+            char = self.peek()
+            if char == "}":
+                self.pos += 1
+                return
+            if char == ",":
+                self.pos += 1
+                continue
+            if char == "":
+                raise ValueError("Malformed FinMind response: unexpected end of data")
+            key = self.decode_value()
+            self.expect(":")
+            if key != "data" or self.peek() != "[":
+                self.fields[key] = self.decode_value()
+                continue
+            self.pos += 1
+            while True:
+                char = self.peek()
+                if char == "]":
+                    self.pos += 1
+                    break
+                if char == ",":
+                    self.pos += 1
+                    continue
+                if char == "":
+                    raise ValueError("Malformed FinMind response: unexpected end of data")
+                yield self.decode_value()
+
+
+class StreamedData:
+    """
+    串流回應：迭代時逐筆產生紀錄，迭代結束後 msg / status 為回應的頂層欄位
+
+    Parameters:
+    - client: FinMindClient
+    - params: 查詢參數
+    """
+
+    def __init__(self, client, params):
+        self.client = client
+        self.params = params
+        self.msg = None
+        self.status = None
+
+    def __iter__(self):
+        return self.client.iter_records(self.params, self)
+
+
+class FinMindClient:
+    """
+    FinMind API 客戶端
+
+    Parameters:
+    - api_url: API 端點，預設為 FINDMIND_API_URL 或官方端點
+    - pool_size: 連線池大小，預設為 FINDMIND_POOL_SIZE
+    - connect_timeout: 連線逾時秒數，預設為 FINDMIND_CONNECT_TIMEOUT
+    - read_timeout: 讀取逾時秒數，預設為 FINDMIND_READ_TIMEOUT
+    - rate_limiter: TokenBucket，預設依 FINDMIND_RATE_PER_HOUR / FINDMIND_BURST 建立
+    - circuit_breaker: CircuitBreaker，預設依 FINDMIND_QUOTA_* 環境變數建立
+    - max_retries: 最大重試次數，預設為 FINDMIND_MAX_RETRIES
+    - cache: ResponseCache，預設依 FINDMIND_CACHE_* 環境變數建立；False 表示停用
+    """
+
+    def __init__(self, api_url=None, pool_size=None, connect_timeout=None, read_timeout=None,
+                 rate_limiter=None, circuit_breaker=None, max_retries=None, cache=None):
+        self.api_url = api_url or os.getenv("FINDMIND_API_URL", DEFAULT_API_URL)
+        if pool_size is None:
+            pool_size = get_env_int("FINDMIND_POOL_SIZE", get_default_pool_size())
+        if connect_timeout is None:
+            connect_timeout = get_env_float("FINDMIND_CONNECT_TIMEOUT", 10)
+        if read_timeout is None:
+            read_timeout = get_env_float("FINDMIND_READ_TIMEOUT", 60)
+        self.timeout = (connect_timeout, read_timeout)
+
+        if rate_limiter is None:
+            rate_limiter = TokenBucket(get_env_float("FINDMIND_RATE_PER_HOUR", 600),
+                                       get_env_int("FINDMIND_BURST", 10))
+        if circuit_breaker is None:
+            circuit_breaker = CircuitBreaker(get_env_int("FINDMIND_QUOTA_FAILURES", 3),
+                                             get_env_float("FINDMIND_QUOTA_COOLDOWN", 600),
+                                             get_env_float("FINDMIND_QUOTA_MAX_PAUSE", 3600))
+        if max_retries is None:
+            max_retries = get_env_int("FINDMIND_MAX_RETRIES", 4)
+        self.rate_limiter = rate_limiter
+        self.circuit_breaker = circuit_breaker
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = get_env_float("FINDMIND_BACKOFF_BASE", 1)
+        self.backoff_max = get_env_float("FINDMIND_BACKOFF_MAX", 60)
+        if cache is None:
+            cache = create_response_cache()
+        self.cache = cache or None
+        # 每個線程最後一次請求的 HTTP 狀態碼
+        self.local = threading.local()
+        # 每次 HTTP 請求的耗時 (秒)，供基準測試統計
+        self.latencies = []
+        self.latencies_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive",
+        })
+
+    def open_response(self, params, stream=False, attempt=0):
+        """
+        發送請求，遇到配額、伺服器錯誤或連線失敗時以退避重試
+
+        Returns:
+            tuple: (狀態碼正常的 requests.Response, 已使用的重試次數)
+        """
+        while True:
+            self.circuit_breaker.wait_until_closed()
+            self.rate_limiter.acquire()
+            started = time.perf_counter()
+            try:
+                response = self.session.get(self.api_url, params=params, timeout=self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.record_latency(started)
+                if attempt >= self.max_retries:
+                    raise
+                self.sleep_before_retry(attempt, f"{type(e).__name__}")
+                attempt += 1
+                continue
+
+            self.record_latency(started)
+            status = response.status_code
+            self.local.status = status
+            if status in RETRY_STATUS_CODES:
+                if status in QUOTA_STATUS_CODES:
+                    self.circuit_breaker.record_quota_failure()
+                if attempt >= self.max_retries:
+                    response.raise_for_status()
+                response.close()
+                self.sleep_before_retry(attempt, f"HTTP {status}", response.headers.get("Retry-After"))
+                attempt += 1
+                continue
+
+            response.raise_for_status()
+            return response, attempt
+
+    def get_data(self, params):
+        """
+        發送數據集請求並回傳解析後的 JSON，遇到配額或伺服器錯誤時自動重試
+
+        Raises:
+        - CacheMissError: 離線模式 (FINDMIND_OFFLINE=1) 且快取中沒有對應回應
+        - QuotaExceededError: 配額耗盡且熔斷暫停時間超過上限
+        - requests.RequestException: 重試後仍為 HTTP 錯誤或連線失敗
+        - ValueError: 回應不是有效的 JSON
+        """
+        self.local.status = None
+        if self.cache is not None:
+            data = self.cache.get(params)
+            if data is not None:
+                self.local.status = 200
+                return data
+        attempt = 0
+        while True:
+            response, attempt = self.open_response(params, attempt=attempt)
+            data = response.json()
+            # FinMind 也可能以 HTTP 200 搭配 JSON status 表示配額錯誤
+            if data.get("status") in QUOTA_STATUS_CODES:
+                self.circuit_breaker.record_quota_failure()
+                if attempt >= self.max_retries:
+                    raise QuotaExceededError(data.get("msg", "FinMind quota exceeded"))
+                self.sleep_before_retry(attempt, f"quota status {data.get('status')}")
+                attempt += 1
+                continue
+
+            self.circuit_breaker.record_success()
+            if self.cache is not None and data.get("status", 200) == 200:
+                self.cache.put(params, data)
+            return data
+
+    def stream_data(self, params):
+        """
+        發送數據集請求，回傳可逐筆迭代 data 紀錄的 StreamedData
+
+        紀錄在從 socket 讀取的同時解析，記憶體用量與回應大小無關；
+        迭代結束後可由 msg / status 取得回應的頂層欄位。
+        快取中有對應回應時直接由快取產生紀錄；串流回應不寫入快取。
+        """
+        return StreamedData(self, params)
+
+    def iter_records(self, params, result):
+        """StreamedData 的迭代實作，遇到配額錯誤時在產生第一筆紀錄前重試"""
+        self.local.status = None
+        if self.cache is not None:
+            data = self.cache.get(params)
+            if data is not None:
+                self.local.status = 200
+                result.msg, result.status = data.get("msg"), data.get("status")
+                yield from data.get("data", [])
+                return
+        attempt = 0
+        while True:
+            response, attempt = self.open_response(params, stream=True, attempt=attempt)
+            parser = JsonRecordStream(response.iter_content(STREAM_CHUNK_SIZE))
+            yielded = False
+            try:
+                for record in parser:
+                    yielded = True
+                    yield record
+            finally:
+                response.close()
+            result.msg, result.status = parser.fields.get("msg"), parser.fields.get("status")
+            if result.status in QUOTA_STATUS_CODES and not yielded:
+                self.circuit_breaker.record_quota_failure()
+                if attempt >= self.max_retries:
+                    raise QuotaExceededError(result.msg or "FinMind quota exceeded")
+                self.sleep_before_retry(attempt, f"quota status {result.status}")
+                attempt += 1
+                continue
+            self.circuit_breaker.record_success()
+            return
+
+    def record_latency(self, started):
+        with self.latencies_lock:
+            self.latencies.append(time.perf_counter() - started)
+
+    def get_latencies(self):
+        """回傳目前為止每次 HTTP 請求的耗時 (秒) 列表"""
+        with self.latencies_lock:
+            return list(self.latencies)
+
+    def get_last_status(self):
+        """回傳目前線程最後一次請求的 HTTP 狀態碼，尚未請求時為 None"""
+        return getattr(self.local, "status", None)
+
+    def sleep_before_retry(self, attempt, reason, retry_after=None):
+        """指數退避加完整隨機抖動；伺服器提供 Retry-After 時以其為準"""
+        time.sleep(self.get_retry_delay(attempt, reason, retry_after))
+
+    def get_retry_delay(self, attempt, reason, retry_after=None):
+        """計算並印出下一次重試前的等待秒數"""
+        delay = None
+        if retry_after:
+            try:
+                delay = min(float(retry_after), self.backoff_max)
+            except ValueError:
+                delay = None
+        if delay is None:
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        print(f"FinMind request failed ({reason}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+        return delay
+
+    def close(self):
+        """關閉連線池並輸出快取命中統計"""
+        if self.cache is not None:
+            self.cache.report()
+        self.session.close()
+
+
+_aiohttp_available = None
+_aiohttp_lock = threading.Lock()
+
+
+def is_aiohttp_available():
+    """檢查 aiohttp 是否可用，不可用時只警告一次"""
+    global _aiohttp_available
+    with _aiohttp_lock:
+        if _aiohttp_available is None:
+            try:
+                import aiohttp  # noqa: F401
+                _aiohttp_available = True
+            except ImportError:
+                print("aiohttp is not installed, the asyncio backend runs requests in a thread pool")
+                _aiohttp_available = False
+        return _aiohttp_available
+
+
+def build_error_response(status, reason, url):
+    """以 HTTP 狀態建立 requests.Response，讓非同步請求的錯誤與同步客戶端一樣以 requests.HTTPError 拋出"""
+    response = requests.Response()
+    response.status_code = status
+    response.reason = reason
+    response.url = url
+    return response
+
+
+class AsyncFinMindClient:
+    """
+    FinMind API 的 asyncio 客戶端 (需要 aiohttp)
+
+    每個請求都是事件循環上的協程，同時進行的請求數只受連線數上限限制，不需要一個線程對應一個請求。
+    與同步的 FinMindClient 共用 API 端點、逾時、令牌桶、熔斷器、重試設定、回應快取與耗時統計；
+    錯誤與同步客戶端相同，以 requests.RequestException / ValueError 拋出。
+    以 async with 使用，離開時關閉連線池。
+
+    Parameters:
+    - client: 共用設定的 FinMindClient
+    - concurrency: 連線數上限 (keep-alive 連線池大小)
+    """
+
+    def __init__(self, client, concurrency):
+        self.client = client
+        self.concurrency = max(1, concurrency)
+        self.session = None
+
+    async def __aenter__(self):
+        import aiohttp
+        connect_timeout, read_timeout = self.client.timeout
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.concurrency),
+            timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout),
+            headers={"Accept": "application/json", "Accept-Encoding": "gzip, deflate"})
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def open_response(self, params, attempt):
+        """
+        發送請求，遇到配額、伺服器錯誤或連線失敗時以退避重試 (與 FinMindClient.open_response 相同)
+
+        Returns:
+            tuple: (回應內容的位元組, HTTP 狀態碼, 已使用的重試次數)
+        """
+        import aiohttp
+        client = self.client
+        # requests 會略過值為 None 的參數並將其餘的值轉為字串
+        query = {key: str(value) for key, value in params.items() if value is not None}
+        while True:
+            await client.circuit_breaker.wait_until_closed_async()
+            await client.rate_limiter.acquire_async()
+            started = time.perf_counter()
+            try:
+                async with self.session.get(client.api_url, params=query) as response:
+                    status = response.status
+                    body = await response.read()
+                    reason, retry_after = response.reason, response.headers.get("Retry-After")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                client.record_latency(started)
+                if attempt >= client.max_retries:
+                    error_type = requests.Timeout if isinstance(e, asyncio.TimeoutError) else requests.ConnectionError
+                    raise error_type(f"{type(e).__name__}: {e}") from e
+                await asyncio.sleep(client.get_retry_delay(attempt, f"{type(e).__name__}"))
+                attempt += 1
+                continue
+
+            client.record_latency(started)
+            error_response = build_error_response(status, reason, client.api_url)
+            if status in RETRY_STATUS_CODES:
+                if status in QUOTA_STATUS_CODES:
+                    client.circuit_breaker.record_quota_failure()
+                if attempt >= client.max_retries:
+                    error_response.raise_for_status()
+                await asyncio.sleep(client.get_retry_delay(attempt, f"HTTP {status}", retry_after))
+                attempt += 1
+                continue
+
+            error_response.raise_for_status()
+            return body, status, attempt
+
+    async def fetch(self, params):
+        """
+        FinMindClient.get_data 的 asyncio 版本
+
+        Returns:
+            tuple: (解析後的 JSON, HTTP 狀態碼)；由快取回應時狀態碼為 200
+        """
+        client = self.client
+        if client.cache is not None:
+            data = await asyncio.to_thread(client.cache.get, params)
+            if data is not None:
+                return data, 200
+        attempt = 0
+        while True:
+            body, status, attempt = await self.open_response(params, attempt)
+            data = json.loads(body)
+            # FinMind 也可能以 HTTP 200 搭配 JSON status 表示配額錯誤
+            if data.get("status") in QUOTA_STATUS_CODES:
+                client.circuit_breaker.record_quota_failure()
+                if attempt >= client.max_retries:
+                    raise QuotaExceededError(data.get("msg", "FinMind quota exceeded"))
+                await asyncio.sleep(client.get_retry_delay(attempt, f"quota status {data.get('status')}"))
+                attempt += 1
+                continue
+
+            client.circuit_breaker.record_success()
+            if client.cache is not None and data.get("status", 200) == 200:
+                await asyncio.to_thread(client.cache.put, params, data)
+            return data, status
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """取得整個程序共用的 FinMindClient"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = FinMindClient()
+        return _client
@@ -0,0 +1,276 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+finmind_stub_server.py
+
+本地 FinMind API 替身伺服器：以與 /api/v4/data 相同的回應格式提供
+TaiwanStockPrice、TaiwanStockPER、TaiwanStockDividend、TaiwanStockInfo 與
+TaiwanStockFinancialStatements 的合成數據，或重播 response_cache.py 快取目錄中
+錄下的真實回應。可注入延遲、配額錯誤 (HTTP 402) 與伺服器錯誤 (HTTP 500)，
+供抓取程式的效能量測與回歸測試使用，不需要真實的 FINDMIND_GMAIL_TOKEN。
+
+另提供 /sheet.csv 端點回傳競標名單 CSV，對應 FINDMIND_SHEET_URL。
+
+python finmind_stub_server.py --port 8000 --latency 0.05 --quota-rate 0.01
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+from response_cache import make_cache_key
+
+DATA_PATH = "/api/v4/data"
+SHEET_PATH = "/sheet.csv"
+
+# 全市場查詢 (不帶 data_id) 時使用的預設股票代碼
+DEFAULT_UNIVERSE = ["1240", "2070", "3135"]
+
+
+def seeded_random(*parts):
+    """以參數決定亂數種子，讓相同請求得到相同的合成數據"""
+    seed = hashlib.md5("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return random.Random(int(seed[:16], 16))
+
+
+def iter_weekdays(start_date, end_date):
+    current = date.fromisoformat(start_date)
+    end = date.fromisoformat(end_date)
+    while current <= end:
+        if current.weekday() < 5:
+            yield current.isoformat()
+        current += timedelta(days=1)
+
+
+def synth_price(stock_id, day):
+    rng = seeded_random("price", stock_id, day)
+    close = round(rng.uniform(20, 200), 2)
+    return {
+        "date": day, "stock_id": stock_id,
+        "Trading_Volume": rng.randint(1000, 5000000), "Trading_money": rng.randint(100000, 500000000),
+        "open": round(close * rng.uniform(0.97, 1.03), 2), "max": round(close * 1.05, 2),
+        "min": round(close * 0.95, 2), "close": close, "spread": round(rng.uniform(-5, 5), 2),
+        "Trading_turnover": rng.randint(10, 5000), "spread_ratio": round(rng.uniform(-3, 3), 2),
+    }
+
+
+def synth_per(stock_id, day):
+    rng = seeded_random("per", stock_id, day)
+    return {"date": day, "stock_id": stock_id, "dividend_yield": round(rng.uniform(0, 8), 2),
+            "PER": round(rng.uniform(5, 60), 2), "PBR": round(rng.uniform(0.5, 8), 2)}
+
+
+def synth_dividend(stock_id, start_date, end_date):
+    records = []
+    for year in range(int(start_date[:4]), int(end_date[:4]) + 1):
+        day = f"{year}-07-15"
+        if not start_date <= day <= end_date:
+            continue
+        rng = seeded_random("dividend", stock_id, year)
+        records.append({
+            "date": day, "stock_id": stock_id, "year": f"{year - 1912}年",
+            "StockEarningsDistribution": 0.0, "StockStatutorySurplus": 0.0,
+            "StockExDividendTradingDate": "", "TotalEmployeeStockDividend": 0.0,
+            "TotalEmployeeStockDividendAmount": 0.0, "RatioOfEmployeeStockDividendOfTotal": 0.0,
+            "RatioOfEmployeeStockDividend": 0.0, "CashEarningsDistribution": round(rng.uniform(0, 5), 2),
+            "CashStatutorySurplus": 0.0, "CashExDividendTradingDate": day,
+            "CashDividendPaymentDate": f"{year}-08-15", "TotalEmployeeCashDividend": 0.0,
+            "TotalNumberOfCashCapitalIncrease": 0.0, "CashIncreaseSubscriptionRate": 0.0,
+            "CashIncreaseSubscriptionpRrice": 0.0, "RemunerationOfDirectorsAndSupervisors": 0.0,
+            "ParticipateDistributionOfTotalShares": 0.0, "AnnouncementDate": f"{year}-03-15",
+            "AnnouncementTime": "18:00:00",
+        })
+    return records
+
+
+def synth_financial(stock_id, start_date, end_date):
+    records = []
+    for year in range(int(start_date[:4]), int(end_date[:4]) + 1):
+        for quarter_end in ("03-31", "06-30", "09-30", "12-31"):
+            day = f"{year}-{quarter_end}"
+            if not start_date <= day <= end_date:
+                continue
+            rng = seeded_random("financial", stock_id, day)
+            for statement_type, origin_name in (("Revenue", "營業收入合計"), ("EPS", "基本每股盈餘（元）")):
+                records.append({"date": day, "stock_id": stock_id, "type": statement_type,
+                                "value": round(rng.uniform(-5, 1000), 2), "origin_name": origin_name})
+    return records
+
+
+def synth_info(stock_id, universe):
+    stock_ids = [stock_id] if stock_id else universe
+    return [{"industry_category": "電子工業", "stock_id": sid, "stock_name": f"合成{sid}",
+             "type": "tpex", "date": "2025-01-02"} for sid in stock_ids]
+
+
+def synth_response(params, universe):
+    """依查詢參數產生合成的 FinMind 回應"""
+    dataset = params.get("dataset")
+    stock_id = params.get("data_id")
+    start_date = params.get("start_date")
+    end_date = params.get("end_date") or start_date
+    if dataset == "TaiwanStockInfo":
+        records = synth_info(stock_id, universe)
+    elif not start_date:
+        return {"msg": "parameter start_date is required", "status": 422, "data": []}
+    elif dataset == "TaiwanStockPrice":
+        stock_ids = [stock_id] if stock_id else universe
+        records = [synth_price(sid, day) for day in iter_weekdays(start_date, end_date) for sid in stock_ids]
+    elif dataset == "TaiwanStockPER":
+        records = [synth_per(stock_id, day) for day in iter_weekdays(start_date, end_date)]
+    elif dataset == "TaiwanStockDividend":
+        records = synth_dividend(stock_id, start_date, end_date)
+    elif dataset == "TaiwanStockFinancialStatements":
+        records = synth_financial(stock_id, start_date, end_date)
+    else:
+        return {"msg": f"dataset {dataset} is not supported by the stub server", "status": 422, "data": []}
+    return {"msg": "success", "status": 200, "data": records}
+
+
+def load_recorded_response(replay_dir, params):
+    """從 response_cache.py 的快取目錄讀取錄下的回應，不存在時回傳 None"""
+    key = make_cache_key(params)
+    path = os.path.join(replay_dir, key[:2], f"{key}.json.gz")
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f).get("data")
+
+
+class StubConfig:
+    """
+    替身伺服器設定
+
+    Parameters:
+    - latency: 每個請求的平均延遲秒數 (實際延遲在 0.5 到 1.5 倍間隨機)
+    - quota_rate: 回傳 HTTP 402 配額錯誤的機率
+    - error_rate: 回傳 HTTP 500 的機率
+    - replay_dir: 錄下回應的快取目錄，找不到時改用合成數據
+    - sheet_file: /sheet.csv 回傳的競標名單文件
+    - universe: 全市場查詢時的股票代碼列表
+    """
+
+    def __init__(self, latency=0.0, quota_rate=0.0, error_rate=0.0, replay_dir=None, sheet_file=None,
+                 universe=None):
+        self.latency = latency
+        self.quota_rate = quota_rate
+        self.error_rate = error_rate
+        self.replay_dir = replay_dir
+        self.sheet_file = sheet_file
+        self.universe = universe or list(DEFAULT_UNIVERSE)
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.random = random.Random(0)
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 標題與內容分兩次寫入，keep-alive 連線上若啟用 Nagle 演算法會與延遲 ACK 互相等待 (約 40 ms)
+    disable_nagle_algorithm = True
+    config = StubConfig()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == SHEET_PATH:
+            return self.send_sheet()
+        if url.path != DATA_PATH:
+            return self.send_json(404, {"msg": "not found", "status": 404})
+
+        config = self.config
+        with config.lock:
+            config.request_count += 1
+            roll = config.random.random()
+            delay = config.latency * config.random.uniform(0.5, 1.5) if config.latency > 0 else 0
+        if delay:
+            time.sleep(delay)
+        if roll < config.quota_rate:
+            return self.send_json(402, {"msg": "Requests reach the upper limit.", "status": 402})
+        if roll < config.quota_rate + config.error_rate:
+            return self.send_json(500, {"msg": "Internal Server Error", "status": 500})
+
+        params = dict(parse_qsl(url.query))
+        payload = None
+        if config.replay_dir:
+            payload = load_recorded_response(config.replay_dir, params)
+        if payload is None:
+            payload = synth_response(params, config.universe)
+        self.send_json(200, payload)
+
+    def send_sheet(self):
+        if not self.config.sheet_file or not os.path.exists(self.config.sheet_file):
+            return self.send_json(404, {"msg": "no sheet configured", "status": 404})
+        with open(self.config.sheet_file, "rb") as f:
+            body = f.read()
+        # 與 Google Sheets 相同支援 ETag 條件請求
+        etag = '"' + hashlib.sha256(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Type", "text/csv; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(config, host="127.0.0.1", port=0):
+    """
+    在背景線程啟動替身伺服器
+
+    Returns:
+        ThreadingHTTPServer: 可由 server.server_address 取得實際埠號，結束時呼叫 shutdown()
+    """
+    handler = type("ConfiguredStubRequestHandler", (StubRequestHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local FinMind API stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="mean latency per request in seconds")
+    parser.add_argument("--quota-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 402")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+    parser.add_argument("--replay-dir", help="response cache directory with recorded responses")
+    parser.add_argument("--sheet", default="cleaned_auction_data.csv", help="CSV served at /sheet.csv")
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency, args.quota_rate, args.error_rate, args.replay_dir, args.sheet)
+    server = start_stub_server(config, args.host, args.port)
+    host, port = server.server_address[:2]
+    print(f"FinMind stub server listening on http://{host}:{port}{DATA_PATH} (sheet at {SHEET_PATH})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
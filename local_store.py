@@ -0,0 +1,544 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+local_store.py
+
+本地整合數據庫：所有數據集保存在同一個 SQLite 文件中，每個數據集一個資料表，
+以登錄表的 key (例如 stock_id, date[, type]) 為主鍵進行 upsert；
+windows 資料表記錄每個輸出文件對應的 (數據集, 股票代碼, 開始日期, 結束日期)，
+window_rows 資料表依來源順序 (seq) 保存每個輸出文件各行的原始欄位文字 (換行符與結尾是否換行記錄在 windows)：
+重疊的期間或不帶日期的數據集 (公司基本資料) 無法由主鍵與日期範圍還原各文件的內容，
+讀取與匯出單一輸出文件時以此為準，匯出的 CSV 與匯入的文件逐位元組相同。
+TWSE/TPEX 指數以 TaiwanStockPrice 的原始形式 (stock_id 為 TAIEX / TPEx) 保存在 TWSE_TPEX 資料表。
+
+FINDMIND_STORE 指定數據庫路徑時，抓取程式在寫入 CSV 的同時寫入數據庫，
+讀取腳本可直接以 SQL 查詢，CSV 文件不存在時也會從數據庫讀取；
+export 指令可從數據庫重新產生目前的 CSV 目錄結構。
+
+python local_store.py import                       # 匯入既有的 CSV / Parquet 文件
+python local_store.py export --output-dir exported  # 重新產生 CSV 文件
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from columnar_store import list_data_files, read_data_file
+from dataset_registry import MARKET_INDEX_HEADER, MARKET_INDEX_MARKETS, MARKET_INDEX_SPEC, get_dataset, get_datasets
+from fetch_manifest import match_data_file
+
+DEFAULT_STORE_PATH = "findmind_store.sqlite"
+
+# pandas 型別 -> SQLite 欄位型別，未列出的型別為 TEXT
+SQL_TYPES = {"Int64": "INTEGER", "int64": "INTEGER", "float64": "REAL"}
+
+MARKET_INDEX_FILE = os.path.join(MARKET_INDEX_SPEC.directory, "market_index.csv")
+
+
+def quote(name):
+    """SQLite 識別字 (資料表與欄位名稱)"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def get_table_columns(spec):
+    """資料表的欄位：登錄的 API 欄位，再加上不在其中的主鍵欄位"""
+    return spec.fields + [field for field in spec.key if field not in spec.fields]
+
+
+def get_store_specs():
+    """保存在數據庫中的數據集：登錄表中的所有數據集與 TWSE/TPEX 指數"""
+    return get_datasets() + [MARKET_INDEX_SPEC]
+
+
+def frame_to_cells(frame):
+    """DataFrame 各行寫入 CSV 時的欄位文字 (與 to_csv 寫入輸出文件的格式相同)，空值為 None"""
+    text = frame.to_csv(index=False, header=False, lineterminator="\n")
+    return [[cell if cell != "" else None for cell in row] for row in csv.reader(io.StringIO(text))]
+
+
+def cells_to_frame(spec, rows):
+    """以欄位文字建立 DataFrame，數值欄位依 spec.dtypes 轉換，欄位為 API 欄位"""
+    frame = pd.DataFrame.from_records(rows, columns=spec.fields)
+    for field, dtype in spec.dtypes.items():
+        try:
+            frame[field] = pd.to_numeric(frame[field]).astype(dtype)
+        except (TypeError, ValueError):
+            pass
+    return frame
+
+
+class LocalStore:
+    """
+    SQLite 本地整合數據庫
+
+    Parameters:
+    - path: SQLite 文件路徑
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.tables = set()
+        with self.lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS windows (
+                    dataset TEXT NOT NULL,
+                    stock_id TEXT NOT NULL,
+                    start_date TEXT NOT NULL,
+                    end_date TEXT NOT NULL,
+                    output_file TEXT NOT NULL,
+                    newline TEXT,
+                    final_newline INTEGER,
+                    PRIMARY KEY (dataset, stock_id, start_date, end_date)
+                )
+            """)
+            # 舊版數據庫的 windows 資料表沒有換行符欄位
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(windows)")]
+            for column, sql_type in (("newline", "TEXT"), ("final_newline", "INTEGER")):
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE windows ADD COLUMN {column} {sql_type}")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS window_rows (
+                    dataset TEXT NOT NULL,
+                    stock_id TEXT NOT NULL,
+                    start_date TEXT NOT NULL,
+                    end_date TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    cells TEXT NOT NULL,
+                    PRIMARY KEY (dataset, stock_id, start_date, end_date, seq)
+                )
+            """)
+
+    def ensure_table(self, spec):
+        """建立數據集的資料表 (呼叫者需持有 self.lock)"""
+        if spec.name in self.tables:
+            return
+        columns = [f"{quote(field)} {SQL_TYPES.get(spec.dtypes.get(field), 'TEXT')}"
+                   for field in get_table_columns(spec)]
+        key = ", ".join(quote(field) for field in spec.key)
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {quote(spec.name)} ({', '.join(columns)}, PRIMARY KEY ({key}))")
+        self.tables.add(spec.name)
+
+    def upsert_frame(self, spec, frame):
+        """
+        以主鍵新增或更新數據
+
+        Parameters:
+        - spec: 數據集描述 (DatasetSpec)
+        - frame: 欄位為 API 欄位或 CSV 標題的 DataFrame (例如 records_to_frame 的結果)
+
+        Returns:
+            int: 寫入的行數
+        """
+        frame = frame.rename(columns={title: field for field, title in spec.columns})
+        columns = list(frame.columns)
+        updates = [field for field in columns if field not in spec.key]
+        conflict = (f"DO UPDATE SET {', '.join(f'{quote(field)} = excluded.{quote(field)}' for field in updates)}"
+                    if updates else "DO NOTHING")
+        sql = (f"INSERT INTO {quote(spec.name)} ({', '.join(quote(field) for field in columns)}) "
+               f"VALUES ({', '.join('?' for _ in columns)}) "
+               f"ON CONFLICT ({', '.join(quote(field) for field in spec.key)}) {conflict}")
+        # 空值 (NaN / pd.NA) 寫入為 NULL；字串欄位以 Python 的文字形式保存 (例如保留 -0.0)，匯出時與原 CSV 相同
+        values = frame.astype(object).where(frame.notna(), None)
+        for field in columns:
+            if field not in spec.dtypes:
+                values[field] = values[field].map(lambda value: value if value is None else str(value))
+        rows = values.itertuples(index=False, name=None)
+        with self.lock, self.conn:
+            self.ensure_table(spec)
+            self.conn.executemany(sql, rows)
+        return len(frame)
+
+    def upsert_market_index(self, rows_by_date):
+        """
+        寫入指數數據
+
+        Parameters:
+        - rows_by_date: 日期 -> 依 MARKET_INDEX_HEADER 排列的欄位值 (不含日期)
+
+        Returns:
+            int: 寫入的行數
+        """
+        width = len(MARKET_INDEX_SPEC.fields)
+        records = []
+        for date, values in rows_by_date.items():
+            for index, data_id in enumerate(MARKET_INDEX_MARKETS.values()):
+                market_values = list(values[index * width:(index + 1) * width])
+                # 該市場在這一天沒有數據
+                if all(value is None or value == "" for value in market_values):
+                    continue
+                records.append(dict(zip(MARKET_INDEX_SPEC.fields, market_values), stock_id=data_id, date=date))
+        if not records:
+            return 0
+        return self.upsert_frame(MARKET_INDEX_SPEC, pd.DataFrame.from_records(records))
+
+    def record_window(self, output_file, frame=None, append=False, newline="\r\n", final_newline=True):
+        """
+        記錄輸出文件對應的數據集與期間
+
+        Parameters:
+        - output_file: 輸出文件路徑
+        - frame: 寫入輸出文件的 DataFrame，依序記錄為該文件的數據行 (取代原有的數據行)
+        - append: frame 附加在該文件已記錄的數據行之後 (保留原本的換行符)
+        - newline: 輸出文件的換行符
+        - final_newline: 最後一行是否以換行符結尾 (手動編輯過的文件可能沒有)
+
+        Returns:
+            bool: 是數據集的輸出文件時為 True
+        """
+        matched = match_data_file(output_file, get_store_specs())
+        if not matched:
+            return False
+        spec, stock_id, start_date, end_date = matched
+        window = (spec.name, str(stock_id), start_date, end_date)
+        output_file = f"{spec.directory}/{os.path.basename(output_file)}"
+        rows = frame_to_cells(frame) if frame is not None else None
+        with self.lock, self.conn:
+            self.conn.execute("""
+                INSERT INTO windows (dataset, stock_id, start_date, end_date, output_file, newline, final_newline)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (dataset, stock_id, start_date, end_date) DO UPDATE SET output_file = excluded.output_file
+            """, window + (output_file, newline, int(final_newline)))
+            if rows is None:
+                return True
+            # 附加時保留原本的換行符，附加的數據行一定以換行符結尾
+            self.conn.execute(f"""
+                UPDATE windows SET {"final_newline = 1" if append else "newline = ?, final_newline = ?"}
+                WHERE dataset = ? AND stock_id = ? AND start_date = ? AND end_date = ?
+            """, window if append else (newline, int(final_newline)) + window)
+            where = "dataset = ? AND stock_id = ? AND start_date = ? AND end_date = ?"
+            if append:
+                first_seq = self.conn.execute(f"SELECT COALESCE(MAX(seq) + 1, 0) FROM window_rows WHERE {where}",
+                                              window).fetchone()[0]
+            else:
+                self.conn.execute(f"DELETE FROM window_rows WHERE {where}", window)
+                first_seq = 0
+            self.conn.executemany("""
+                INSERT OR REPLACE INTO window_rows (dataset, stock_id, start_date, end_date, seq, cells)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (window + (first_seq + seq, json.dumps(cells, ensure_ascii=False)) for seq, cells in enumerate(rows)))
+        return True
+
+    def window_rows(self, dataset, stock_id, start_date, end_date):
+        """
+        依來源順序讀取輸出文件的數據行
+
+        Returns:
+            list: 每行為欄位文字的列表 (空值為 None)；沒有記錄數據行的期間 (例如舊版數據庫) 為 None
+        """
+        with self.lock:
+            rows = self.conn.execute("""
+                SELECT cells FROM window_rows
+                WHERE dataset = ? AND stock_id = ? AND start_date = ? AND end_date = ?
+                ORDER BY seq
+            """, (dataset, str(stock_id), start_date, end_date)).fetchall()
+        return [json.loads(cells) for cells, in rows] or None
+
+    def windows(self, dataset=None, stock_id=None):
+        """依數據集與股票代碼查詢已記錄的輸出文件，依開始日期排序"""
+        conditions = []
+        params = []
+        if dataset is not None:
+            conditions.append("dataset = ?")
+            params.append(dataset)
+        if stock_id is not None:
+            conditions.append("stock_id = ?")
+            params.append(str(stock_id))
+        query = "SELECT dataset, stock_id, start_date, end_date, output_file, newline, final_newline FROM windows"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY dataset, stock_id, start_date, end_date"
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [dict(zip(("dataset", "stock_id", "start_date", "end_date", "output_file", "newline", "final_newline"),
+                         row)) for row in rows]
+
+    def has_table(self, spec):
+        with self.lock:
+            row = self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                    (spec.name,)).fetchone()
+        return row is not None
+
+    def query(self, spec, stock_id=None, start_date=None, end_date=None):
+        """
+        查詢數據集，日期範圍只套用於帶有日期範圍的數據集
+
+        Returns:
+            DataFrame: 欄位為 CSV 標題，依日期排序，數值欄位依 spec.dtypes 轉換
+        """
+        if not self.has_table(spec):
+            return pd.DataFrame(columns=spec.header)
+        conditions = []
+        params = []
+        if stock_id is not None:
+            conditions.append("stock_id = ?")
+            params.append(str(stock_id))
+        if spec.is_date_ranged and "date" in get_table_columns(spec):
+            if start_date is not None:
+                conditions.append("date >= ?")
+                params.append(start_date)
+            if end_date is not None:
+                conditions.append("date <= ?")
+                params.append(end_date)
+        query = f"SELECT {', '.join(quote(field) for field in spec.fields)} FROM {quote(spec.name)}"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        # 同一日期的多筆數據 (例如財報的各科目) 保持寫入順序
+        query += " ORDER BY date, rowid" if "date" in get_table_columns(spec) else " ORDER BY rowid"
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        frame = cells_to_frame(spec, rows)
+        frame.columns = spec.header
+        return frame
+
+    def read_window(self, output_file):
+        """
+        讀取輸出文件對應的數據
+
+        Returns:
+            DataFrame: 與 CSV 文件相同的欄位與數據；未記錄的輸出文件為 None
+        """
+        matched = match_data_file(output_file)
+        if not matched:
+            return None
+        spec, stock_id, start_date, end_date = matched
+        if not any(window["start_date"] == start_date and window["end_date"] == end_date
+                   for window in self.windows(spec.name, stock_id)):
+            return None
+        rows = self.window_rows(spec.name, stock_id, start_date, end_date)
+        if rows is None:
+            return self.query(spec, stock_id, start_date, end_date)
+        frame = cells_to_frame(spec, rows)
+        frame.columns = spec.header
+        return frame
+
+    def get_market_index_rows(self, start_date=None, end_date=None):
+        """讀取指數數據 (日期 -> 依 MARKET_INDEX_HEADER 排列的欄位值)，與抓取程式的指數數據庫格式相同"""
+        if not self.has_table(MARKET_INDEX_SPEC):
+            return {}
+        width = len(MARKET_INDEX_SPEC.fields)
+        markets = list(MARKET_INDEX_MARKETS.values())
+        conditions = []
+        params = []
+        if start_date is not None:
+            conditions.append("date >= ?")
+            params.append(start_date)
+        if end_date is not None:
+            conditions.append("date <= ?")
+            params.append(end_date)
+        query = (f"SELECT stock_id, date, {', '.join(quote(field) for field in MARKET_INDEX_SPEC.fields)} "
+                 f"FROM {quote(MARKET_INDEX_SPEC.name)}")
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self.lock:
+            rows = self.conn.execute(query + " ORDER BY date", params).fetchall()
+        rows_by_date = {}
+        for stock_id, date, *values in rows:
+            if stock_id not in markets:
+                continue
+            row = rows_by_date.setdefault(date, [None] * (width * len(markets)))
+            index = markets.index(stock_id)
+            row[index * width:(index + 1) * width] = values
+        return rows_by_date
+
+    def import_files(self, base_dir="."):
+        """
+        匯入尚未記錄的既有輸出文件 (CSV 或 FINDMIND_COLUMNAR=only 的 Parquet) 與指數數據庫
+
+        Returns:
+            int: 匯入的文件數
+        """
+        known = {window["output_file"] for window in self.windows()}
+        imported = 0
+        for spec in get_datasets():
+            directory = os.path.join(base_dir, spec.directory)
+            for file_name in list_data_files(directory):
+                output_file = f"{spec.directory}/{file_name}"
+                matched = match_data_file(output_file)
+                if output_file in known or not matched or matched[0] is not spec:
+                    continue
+                try:
+                    # 以字串讀取 (只有空欄位為空值)，數值由資料表的欄位型別轉換，數據行保留原始文字
+                    frame = read_data_file(os.path.join(directory, file_name), dtype=str, keep_default_na=False,
+                                           na_values=[""])
+                except (OSError, UnicodeDecodeError, ValueError) as e:
+                    print(f"讀取文件 {output_file} 時發生錯誤: {e}")
+                    continue
+                if list(frame.columns) != spec.header:
+                    print(f"文件 {output_file} 的欄位與數據集 {spec.name} 不符，跳過")
+                    continue
+                # Parquet 文件的日期欄位為 datetime64，轉回與 API 相同的字串
+                for field, title in spec.columns:
+                    if field == "date" and pd.api.types.is_datetime64_any_dtype(frame[title]):
+                        frame[title] = frame[title].dt.strftime("%Y-%m-%d")
+                self.upsert_frame(spec, frame)
+                newline, final_newline = read_line_endings(os.path.join(directory, file_name))
+                self.record_window(output_file, frame, newline=newline, final_newline=final_newline)
+                imported += 1
+
+        index_file = os.path.join(base_dir, MARKET_INDEX_FILE)
+        if os.path.exists(index_file):
+            with open(index_file, "r", newline="", encoding="utf-8") as csvfile:
+                reader = csv.reader(csvfile)
+                if next(reader, None) == MARKET_INDEX_HEADER:
+                    self.upsert_market_index({row[0]: [value or None for value in row[1:]] for row in reader if row})
+        market_dir = os.path.join(base_dir, MARKET_INDEX_SPEC.directory)
+        if os.path.isdir(market_dir):
+            for file_name in os.listdir(market_dir):
+                output_file = f"{MARKET_INDEX_SPEC.directory}/{file_name}"
+                if output_file not in known and self.record_window(output_file):
+                    imported += 1
+        return imported
+
+    def export(self, output_dir=".", dataset=None):
+        """
+        從數據庫重新產生 CSV 文件 (與抓取程式相同的路徑、標題與 \\r\\n 換行)，各文件的數據行依來源順序寫出
+
+        Parameters:
+        - output_dir: 輸出的根目錄
+        - dataset: 只匯出指定的數據集
+
+        Returns:
+            int: 寫入的文件數
+        """
+        written = 0
+        for window in self.windows(dataset):
+            output_file = os.path.join(output_dir, window["output_file"])
+            if window["dataset"] == MARKET_INDEX_SPEC.name:
+                rows_by_date = self.get_market_index_rows(window["start_date"], window["end_date"])
+                if rows_by_date:
+                    write_market_index(output_file, rows_by_date)
+                    written += 1
+                continue
+            spec = get_dataset(window["dataset"])
+            if spec is None:
+                continue
+            rows = self.window_rows(spec.name, window["stock_id"], window["start_date"], window["end_date"])
+            if rows is None:
+                # 沒有記錄數據行的期間 (舊版數據庫) 改以主鍵資料表的日期範圍查詢
+                frame = self.query(spec, window["stock_id"], window["start_date"], window["end_date"])
+                rows = frame_to_cells(frame) if not frame.empty else None
+            if rows is None:
+                continue
+            newline = window["newline"] or "\r\n"
+            text = io.StringIO()
+            writer = csv.writer(text, lineterminator=newline)
+            writer.writerow(spec.header)
+            writer.writerows(rows)
+            text = text.getvalue()
+            if window["final_newline"] == 0:
+                text = text[:-len(newline)]
+            with open_export_file(output_file) as csvfile:
+                csvfile.write(text)
+            written += 1
+        if dataset in (None, MARKET_INDEX_SPEC.name):
+            rows_by_date = self.get_market_index_rows()
+            if rows_by_date:
+                write_market_index(os.path.join(output_dir, MARKET_INDEX_FILE), rows_by_date)
+                written += 1
+        return written
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def read_line_endings(file_path):
+    """
+    CSV 文件的換行符 (依第一行判斷) 與最後一行是否以換行符結尾
+
+    Returns:
+        tuple: (換行符, 是否以換行符結尾)；文件不存在 (只有 Parquet 或數據庫中的輸出) 時為 ("\\r\\n", True)
+    """
+    try:
+        with open(file_path, "rb") as f:
+            first_line = f.readline()
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return "\r\n", True
+            f.seek(-1, os.SEEK_END)
+            final_newline = f.read(1) == b"\n"
+    except OSError:
+        return "\r\n", True
+    newline = "\n" if first_line.endswith(b"\n") and not first_line.endswith(b"\r\n") else "\r\n"
+    return newline, final_newline
+
+
+@contextmanager
+def open_export_file(output_file):
+    """以暫存文件寫入，成功後再以 os.replace 取代目標文件"""
+    directory = os.path.dirname(output_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_file = f"{output_file}.tmp"
+    try:
+        with open(temp_file, "w", newline="", encoding="utf-8") as f:
+            yield f
+        os.replace(temp_file, output_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+
+def write_market_index(output_file, rows_by_date):
+    """將指數數據依日期排序寫入 CSV 文件"""
+    with open_export_file(output_file) as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(MARKET_INDEX_HEADER)
+        for date in sorted(rows_by_date):
+            writer.writerow([date] + list(rows_by_date[date]))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store_path():
+    return os.getenv("FINDMIND_STORE", "")
+
+
+def get_store(create=True):
+    """
+    取得整個程序共用的 LocalStore
+
+    路徑由 FINDMIND_STORE 指定；未設定時停用並回傳 None。
+    create 為 False 時 (讀取腳本) 只開啟已存在的數據庫。
+    """
+    global _store
+    path = get_store_path()
+    if not path or (not create and not os.path.exists(path)):
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = LocalStore(path)
+        return _store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consolidated local database of the FinMind datasets")
+    parser.add_argument("command", choices=("import", "export"),
+                        help="import existing output files, or export the database back to the CSV layout")
+    parser.add_argument("--store", default=get_store_path() or DEFAULT_STORE_PATH, help="SQLite database path")
+    parser.add_argument("--base-dir", default=".", help="directory containing the output directories to import")
+    parser.add_argument("--output-dir", default=".", help="root directory of the exported CSV files")
+    parser.add_argument("--dataset", help="only export this dataset")
+    args = parser.parse_args()
+
+    store = LocalStore(args.store)
+    if args.command == "import":
+        print(f"Imported {store.import_files(args.base_dir)} files into {args.store}")
+    else:
+        print(f"Exported {store.export(args.output_dir, args.dataset)} files to {args.output_dir}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+response_cache.py
+
+FinMind 回應的本地磁碟快取：以數據集與查詢參數 (不含 token) 的 SHA-256 為鍵，
+將成功的 JSON 回應以 gzip 壓縮存放。開放中的窗口依數據集設定較短的存活時間，
+結束日期已過去一段時間的窗口 (歷史數據不再變動) 使用較長的存活時間。
+快取總大小超過上限時，依最近使用時間淘汰最舊的項目 (LRU)。
+離線模式只讀快取，不發出任何請求，方便本地除錯與重播。
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import requests
+
+from dataset_registry import get_datasets
+
+DEFAULT_CACHE_DIR = ".finmind_cache"
+
+DEFAULT_TTL = 3600
+
+# 查詢參數中不參與快取鍵的欄位
+EXCLUDED_PARAMS = ("token",)
+
+
+class CacheMissError(requests.RequestException):
+    """離線模式下快取中沒有對應回應時拋出，讓呼叫端照常略過該請求"""
+
+
+def make_cache_key(params):
+    """以數據集與查詢參數 (排除 token) 計算快取鍵"""
+    items = sorted((str(k), str(v)) for k, v in params.items() if k not in EXCLUDED_PARAMS)
+    payload = json.dumps(items, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def parse_ttl_overrides(value):
+    """解析 "TaiwanStockPrice=600,TaiwanStockInfo=0" 格式的存活時間設定"""
+    ttls = {}
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        dataset, seconds = item.split("=", 1)
+        try:
+            ttls[dataset.strip()] = float(seconds)
+        except ValueError:
+            print(f"Invalid FINDMIND_CACHE_TTL entry {item!r}, ignored")
+    return ttls
+
+
+class ResponseCache:
+    """
+    FinMind 回應磁碟快取
+
+    Parameters:
+    - cache_dir: 快取目錄
+    - max_bytes: 快取總大小上限，超過時淘汰最久未使用的項目，0 表示不限制
+    - ttls: 數據集 -> 開放窗口存活秒數，未列出的數據集使用 DEFAULT_TTL
+    - closed_ttl: 已結束窗口的存活秒數
+    - settle_days: 結束日期早於今天超過這個天數時視為已結束的窗口
+    - offline: 只讀快取 (忽略存活時間)，缺少時拋出 CacheMissError
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=0, ttls=None, closed_ttl=30 * 86400,
+                 settle_days=7, offline=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # 開放窗口的預設存活秒數取自數據集登錄表
+        self.ttls = {spec.name: spec.cache_ttl for spec in get_datasets()}
+        self.ttls.update(ttls or {})
+        self.closed_ttl = closed_ttl
+        self.settle_days = settle_days
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # 快取目前總大小，首次寫入時才掃描目錄
+        self.total_bytes = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json.gz")
+
+    def get_ttl(self, params):
+        """依數據集與窗口是否已結束決定存活秒數"""
+        end_date = params.get("end_date")
+        if end_date:
+            try:
+                end = datetime.strptime(str(end_date), "%Y-%m-%d").date()
+            except ValueError:
+                end = None
+            if end is not None and end <= datetime.now().date() - timedelta(days=self.settle_days):
+                return self.closed_ttl
+        return self.ttls.get(params.get("dataset"), DEFAULT_TTL)
+
+    def get(self, params):
+        """
+        讀取快取的回應，過期或不存在時回傳 None
+
+        Raises:
+        - CacheMissError: 離線模式且快取中沒有對應回應
+        """
+        key = make_cache_key(params)
+        path = self.get_path(key)
+        try:
+            age = time.time() - os.path.getmtime(path)
+        except OSError:
+            return self.record_miss(params)
+        if not self.offline and age > self.get_ttl(params):
+            return self.record_miss(params)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError, EOFError) as e:
+            print(f"讀取快取 {path} 時發生錯誤: {e}")
+            return self.record_miss(params)
+        # 更新存取時間，供 LRU 淘汰使用 (寫入時間另存於項目內)
+        try:
+            os.utime(path, (time.time(), os.path.getmtime(path)))
+        except OSError:
+            pass
+        with self.lock:
+            self.hits += 1
+        return entry.get("data")
+
+    def contains(self, params):
+        """是否有未過期的快取回應 (只檢查文件時間，不讀取內容，也不計入命中率)"""
+        try:
+            age = time.time() - os.path.getmtime(self.get_path(make_cache_key(params)))
+        except OSError:
+            return False
+        return self.offline or age <= self.get_ttl(params)
+
+    def record_miss(self, params):
+        with self.lock:
+            self.misses += 1
+        if self.offline:
+            raise CacheMissError(f"Offline mode: no cached response for {params.get('dataset')} "
+                                 f"{params.get('data_id', '')} {params.get('start_date', '')}-{params.get('end_date', '')}")
+        return None
+
+    def put(self, params, data):
+        """寫入回應 (先寫臨時文件再替換，避免留下不完整的快取項目)"""
+        if self.offline:
+            return
+        key = make_cache_key(params)
+        path = self.get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {
+            "params": {k: v for k, v in params.items() if k not in EXCLUDED_PARAMS},
+            "cached_at": datetime.now().isoformat(timespec="seconds"),
+            "data": data,
+        }
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"寫入快取 {path} 時發生錯誤: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        if self.max_bytes > 0:
+            with self.lock:
+                if self.total_bytes is not None:
+                    self.total_bytes += os.path.getsize(path)
+                over_limit = self.total_bytes is None or self.total_bytes > self.max_bytes
+            if over_limit:
+                self.evict()
+
+    def evict(self):
+        """總大小超過上限時，依最後存取時間由舊到新刪除項目"""
+        with self.lock:
+            entries = []
+            total = 0
+            for root, _, files in os.walk(self.cache_dir):
+                for file_name in files:
+                    if not file_name.endswith(".json.gz"):
+                        continue
+                    path = os.path.join(root, file_name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_atime, stat.st_size, path))
+                    total += stat.st_size
+            if total > self.max_bytes:
+                entries.sort()
+                for _, size, path in entries:
+                    if total <= self.max_bytes:
+                        break
+                    try:
+                        os.remove(path)
+                        total -= size
+                    except OSError:
+                        pass
+            self.total_bytes = total
+
+    def report(self):
+        """輸出本次執行的命中統計"""
+        total = self.hits + self.misses
+        if total:
+            print(f"FinMind response cache: {self.hits}/{total} hits ({self.cache_dir})")
+
+
+def get_env_number(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        print(f"Invalid {name} value, using default {default}")
+        return default
+
+
+def create_response_cache():
+    """
+    依環境變數建立 ResponseCache；FINDMIND_CACHE=0 且非離線模式時回傳 None
+
+    - FINDMIND_CACHE_DIR: 快取目錄
+    - FINDMIND_CACHE_MAX_MB: 快取大小上限 (MB)
+    - FINDMIND_CACHE_TTL: 各數據集開放窗口的存活秒數，例如 "TaiwanStockPrice=600"
+    - FINDMIND_CACHE_CLOSED_TTL: 已結束窗口的存活秒數
+    - FINDMIND_OFFLINE: 只從快取重播，不發出請求
+    """
+    offline = os.getenv("FINDMIND_OFFLINE", "0") == "1"
+    if os.getenv("FINDMIND_CACHE", "1") != "1" and not offline:
+        return None
+    return ResponseCache(
+        cache_dir=os.getenv("FINDMIND_CACHE_DIR", DEFAULT_CACHE_DIR),
+        max_bytes=int(get_env_number("FINDMIND_CACHE_MAX_MB", 200) * 1024 * 1024),
+        ttls=parse_ttl_overrides(os.getenv("FINDMIND_CACHE_TTL")),
+        closed_ttl=get_env_number("FINDMIND_CACHE_CLOSED_TTL", 30 * 86400),
+        offline=offline,
+    )
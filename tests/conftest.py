@@ -0,0 +1,78 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+測試共用的 fixture
+
+- work_dir: 以臨時目錄為工作目錄，清除 FINDMIND_* 環境變數並重設共用的客戶端、manifest、本地數據庫、文件索引與交易日曆
+- fetch: 重新載入 FindMind-fetch_and_save_stock_data.py (每個測試的模組狀態互不影響)
+- stub: 在背景線程啟動 finmind_stub_server.py 的替身伺服器，FINDMIND_API_URL 指向它
+"""
+import importlib.util
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import fetch_manifest  # noqa: E402
+import file_index  # noqa: E402
+import finmind_client  # noqa: E402
+import local_store  # noqa: E402
+import trading_calendar  # noqa: E402
+from finmind_stub_server import DATA_PATH, SHEET_PATH, StubConfig, start_stub_server  # noqa: E402
+
+
+def load_script(file_name):
+    """以文件名載入倉庫中的腳本 (文件名含有連字號，不能直接 import)"""
+    module_name = "test_" + os.path.splitext(file_name)[0].replace("-", "_")
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(REPO_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def work_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name in list(os.environ):
+        if name.startswith("FINDMIND_"):
+            monkeypatch.delenv(name)
+    monkeypatch.setenv("FINDMIND_CACHE", "0")
+    monkeypatch.setenv("FINDMIND_CALENDAR_CACHE", "")
+    monkeypatch.setenv("FINDMIND_FILE_INDEX_CACHE", "")
+    monkeypatch.setenv("FINDMIND_MANIFEST", str(tmp_path / "fetch_manifest.sqlite"))
+    monkeypatch.setattr(finmind_client, "_client", None)
+    monkeypatch.setattr(fetch_manifest, "_manifest", None)
+    monkeypatch.setattr(local_store, "_store", None)
+    monkeypatch.setattr(file_index, "_directories", {})
+    monkeypatch.setattr(file_index, "_indexes", {})
+    monkeypatch.setattr(trading_calendar, "_calendars", {})
+    yield tmp_path
+    if fetch_manifest._manifest is not None:
+        fetch_manifest._manifest.close()
+    if local_store._store is not None:
+        local_store._store.close()
+
+
+@pytest.fixture
+def fetch(work_dir):
+    return load_script("FindMind-fetch_and_save_stock_data.py")
+
+
+@pytest.fixture
+def stub(work_dir, monkeypatch):
+    config = StubConfig(universe=["2330", "2317", "1240"])
+    server = start_stub_server(config)
+    host, port = server.server_address[:2]
+    monkeypatch.setenv("FINDMIND_API_URL", f"http://{host}:{port}{DATA_PATH}")
+    monkeypatch.setenv("FINDMIND_SHEET_URL", f"http://{host}:{port}{SHEET_PATH}")
+    monkeypatch.setenv("FINDMIND_RATE_PER_HOUR", "0")
+    monkeypatch.setenv("FINDMIND_BACKOFF_BASE", "0.01")
+    monkeypatch.setenv("FINDMIND_BACKOFF_MAX", "0.05")
+    yield config
+    if finmind_client._client is not None:
+        finmind_client._client.session.close()
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,57 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+columnar_store.py 的測試 (需要 pyarrow)，數據由替身伺服器 (finmind_stub_server.py) 回應
+"""
+import os
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from columnar_store import get_columnar_path, list_data_files, read_data_file, read_dataset  # noqa: E402
+
+WINDOW = ("2330", "2025-01-06", "2025-01-17")
+
+
+def test_parquet_copy_matches_the_csv_with_registry_types(fetch, stub, work_dir, monkeypatch):
+    monkeypatch.setenv("FINDMIND_COLUMNAR", "1")
+    spec = fetch.get_dataset("TaiwanStockPrice")
+    output_file = spec.output_file(*WINDOW)
+    assert fetch.fetch_and_save_dataset(spec, "token", *WINDOW, output_file)
+    columnar_file = get_columnar_path(output_file)
+    assert columnar_file == os.path.join("columnar", "TaiwanStockPrice", "stock_id=2330", "2025-01-06-2025-01-17.parquet")
+
+    frame = read_data_file(output_file)
+    assert str(frame["日期"].dtype).startswith("datetime64")
+    assert str(frame["成交量"].dtype) == "Int64"
+    csv_frame = pd.read_csv(output_file, encoding="utf-8")
+    assert list(frame.columns) == list(csv_frame.columns) == spec.header
+    assert frame["日期"].dt.strftime("%Y-%m-%d").tolist() == csv_frame["日期"].tolist()
+    assert frame["收盤價"].tolist() == csv_frame["收盤價"].tolist()
+
+    # 增量附加的尾段同時寫入 Parquet 文件
+    with open(output_file, "rb") as f:
+        lines = f.read().splitlines(keepends=True)
+    with open(output_file, "wb") as f:
+        f.writelines(lines[:4])
+    os.remove(columnar_file)
+    assert fetch.fetch_and_save_dataset(spec, "token", *WINDOW, output_file)
+    assert len(read_data_file(output_file)) == len(csv_frame)
+
+    scanned = read_dataset("TaiwanStockPrice")
+    assert scanned["stock_id"].unique().tolist() == ["2330"]
+    assert len(scanned) == len(csv_frame)
+
+
+def test_columnar_only_outputs_are_listed_and_fresh(fetch, stub, work_dir, monkeypatch):
+    monkeypatch.setenv("FINDMIND_COLUMNAR", "only")
+    spec = fetch.get_dataset("TaiwanStockPrice")
+    output_file = spec.output_file(*WINDOW)
+    assert fetch.fetch_and_save_dataset(spec, "token", *WINDOW, output_file)
+    assert not os.path.exists(output_file)
+    assert os.path.basename(output_file) in list_data_files("stockdata")
+    assert fetch.is_file_complete_with_end_date(output_file, WINDOW[2])
+    assert fetch.fetch_and_save_dataset(spec, "token", *WINDOW, output_file)
+    assert stub.request_count == 1
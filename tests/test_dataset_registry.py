@@ -0,0 +1,62 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+dataset_registry.py 的測試
+"""
+import json
+
+import pytest
+
+import dataset_registry
+from dataset_registry import DatasetSpec, get_dataset, get_datasets
+
+MARGIN = {"name": "TaiwanStockMarginPurchaseShortSale", "directory": "margin", "file_suffix": "-margin.csv",
+          "columns": [["date", "日期"], ["stock_id", "股票代碼"], ["MarginPurchaseTodayBalance", "融資今日餘額"]],
+          "dtypes": {"MarginPurchaseTodayBalance": "Int64"}, "freshness": "end_date", "label": "margin"}
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(dataset_registry, "DATASETS", list(dataset_registry.DATASETS))
+    monkeypatch.setattr(dataset_registry, "_extensions_loaded", False)
+    monkeypatch.delenv("FINDMIND_DATASETS", raising=False)
+    return dataset_registry
+
+
+def test_builtin_specs_keep_the_original_paths_and_params(registry):
+    assert [spec.name for spec in get_datasets()] == [
+        "TaiwanStockPrice", "TaiwanStockDividend", "TaiwanStockPER", "TaiwanStockInfo",
+        "TaiwanStockFinancialStatements"]
+    price = get_dataset("TaiwanStockPrice")
+    assert price.output_file("2330", "2025-01-06", "2025-01-17") == "stockdata/[2330] 2025-01-06-2025-01-17.csv"
+    assert price.build_params("token", "2330", "2025-01-06", "2025-01-17") == {
+        "dataset": "TaiwanStockPrice", "data_id": "2330", "start_date": "2025-01-06", "end_date": "2025-01-17",
+        "token": "token"}
+    info = get_dataset("TaiwanStockInfo")
+    # 公司基本資料不帶日期範圍
+    assert info.build_params("token", "2330", "2025-01-06", "2025-01-17") == {
+        "dataset": "TaiwanStockInfo", "data_id": "2330", "token": "token"}
+    assert not info.is_date_ranged
+    assert info.output_file("2330", "2025-01-06", "2025-01-17") == \
+        "company-profile/[2330] 2025-01-06-2025-01-17-company-profile.csv"
+    assert price.to_row({"date": "2025-01-06", "close": 1.5})[:3] == ["2025-01-06", None, None]
+
+
+def test_datasets_are_registered_from_a_json_file(registry, tmp_path, monkeypatch):
+    path = tmp_path / "datasets.json"
+    path.write_text(json.dumps([MARGIN, dict(MARGIN, name="TaiwanStockPER", directory="per")]), encoding="utf-8")
+    monkeypatch.setenv("FINDMIND_DATASETS", str(path))
+    names = [spec.name for spec in get_datasets()]
+    # 同名的數據集被取代，新的數據集接在最後
+    assert names.count("TaiwanStockPER") == 1 and names[-1] == "TaiwanStockMarginPurchaseShortSale"
+    assert get_dataset("TaiwanStockPER").directory == "per"
+    margin = get_dataset("TaiwanStockMarginPurchaseShortSale")
+    assert margin.header == ["日期", "股票代碼", "融資今日餘額"]
+    assert margin.output_file("2330", "2025-01-06", "2025-01-17") == "margin/[2330] 2025-01-06-2025-01-17-margin.csv"
+
+
+def test_invalid_specs_are_rejected():
+    with pytest.raises(ValueError):
+        DatasetSpec("X", "x", ".csv", [("date", "日期")], freshness="daily")
+    with pytest.raises(ValueError):
+        DatasetSpec("X", "x", ".csv", [("date", "日期")], incremental=True)
@@ -0,0 +1,344 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+FindMind-fetch_and_save_stock_data.py 的測試，API 請求由替身伺服器 (finmind_stub_server.py) 回應
+"""
+import asyncio
+import os
+
+import pytest
+
+from conftest import load_script
+
+ROWS = [
+    ("2330", "2025-01-06", "2025-01-17"),
+    ("2317", "2025-01-06", "2025-01-17"),
+    ("2330", "2025-01-13", "2025-01-24"),
+]
+
+
+def read_tree(directory):
+    """目錄下所有數據文件的內容 (相對路徑 -> 位元組)，略過以點開頭的快照與暫存文件"""
+    contents = {}
+    for root, _, files in os.walk(directory):
+        for file_name in files:
+            if file_name.startswith(".") or not file_name.endswith(".csv"):
+                continue
+            path = os.path.join(root, file_name)
+            with open(path, "rb") as f:
+                contents[os.path.relpath(path, directory)] = f.read()
+    return contents
+
+
+def test_concurrent_rows_match_serial_processing(fetch, stub, work_dir, monkeypatch):
+    for mode in ("serial", "threads"):
+        os.makedirs(work_dir / mode)
+        monkeypatch.chdir(work_dir / mode)
+        if mode == "serial":
+            for row in ROWS:
+                fetch.process_auction_row("token", *row)
+        else:
+            fetch.process_rows_concurrently("token", ROWS, max_workers=4)
+
+    serial, threads = read_tree(work_dir / "serial"), read_tree(work_dir / "threads")
+    assert "stockdata/[2330] 2025-01-06-2025-01-17.csv" in serial
+    assert "company-profile/[2317] 2025-01-06-2025-01-17-company-profile.csv" in serial
+    assert threads == serial
+
+
+def test_max_workers_from_environment(fetch, monkeypatch):
+    assert fetch.get_max_workers() == 1
+    monkeypatch.setenv("FINDMIND_MAX_WORKERS", "8")
+    assert fetch.get_max_workers() == 8
+    monkeypatch.setenv("FINDMIND_MAX_WORKERS", "eight")
+    assert fetch.get_max_workers() == 1
+
+
+def write_market_index(fetch, dates):
+    fetch.write_market_index_csv(fetch.MARKET_INDEX_FILE, {date: ["1"] * 12 for date in dates})
+
+
+def test_market_index_skips_non_trading_head_and_tail(fetch, stub, work_dir):
+    os.makedirs("TWSE_TPEX")
+    write_market_index(fetch, ["2024-01-02", "2024-01-03", "2024-01-04", "2024-01-05"])
+    # 2023-12-30/31 為週末、2024-01-01 為元旦，2024-01-06/07 為週末：庫中已涵蓋所有交易日
+    fetch.update_market_index("token", "2023-12-30", "2024-01-07")
+    assert stub.request_count == 0
+
+
+def test_market_index_fetches_missing_trading_head(fetch, stub, work_dir):
+    os.makedirs("TWSE_TPEX")
+    write_market_index(fetch, ["2024-01-02", "2024-01-03"])
+    index = fetch.update_market_index("token", "2023-12-29", "2024-01-03")
+    # TAIEX 與 TPEx 各請求一次 2023-12-29 至 2024-01-01
+    assert stub.request_count == 2
+    # 替身伺服器為每個平日產生數據 (包含元旦)
+    assert sorted(index) == ["2023-12-29", "2024-01-01", "2024-01-02", "2024-01-03"]
+    with open(fetch.MARKET_INDEX_FILE, encoding="utf-8") as f:
+        assert [line.split(",", 1)[0] for line in f.read().splitlines()[1:]] == sorted(index)
+
+
+def truncate_lines(path, keep):
+    """只保留前 keep 行 (保留原本的換行符)"""
+    with open(path, "rb") as f:
+        lines = f.read().splitlines(keepends=True)
+    with open(path, "wb") as f:
+        f.writelines(lines[:keep])
+
+
+def test_incremental_fetch_appends_only_the_missing_tail(fetch, stub, work_dir):
+    spec = fetch.get_dataset("TaiwanStockPrice")
+    args = (spec, "token", "2330", "2025-01-06", "2025-01-17")
+    output_file = spec.output_file(*args[2:])
+    assert fetch.fetch_and_save_dataset(*args, output_file)
+    with open(output_file, "rb") as f:
+        complete = f.read()
+
+    # 標題行 + 2025-01-06 至 2025-01-08 三個交易日
+    truncate_lines(output_file, 4)
+    params, last_date = fetch.get_dataset_request(*args, output_file)
+    assert last_date == "2025-01-08"
+    assert (params["start_date"], params["end_date"]) == ("2025-01-09", "2025-01-17")
+
+    assert fetch.fetch_and_save_dataset(*args, output_file)
+    with open(output_file, "rb") as f:
+        assert f.read() == complete
+    assert stub.request_count == 2
+
+
+def test_incremental_fetch_refetches_a_file_with_another_header(fetch, work_dir):
+    spec = fetch.get_dataset("TaiwanStockPrice")
+    output_file = spec.output_file("2330", "2025-01-06", "2025-01-17")
+    os.makedirs("stockdata")
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write("date,close\n2025-01-08,100\n")
+    assert fetch.get_incremental_start(output_file, spec.header, "2025-01-06", "2025-01-17") == ("2025-01-06", None)
+
+
+def test_freshness_check_reads_only_the_header_and_last_line(fetch, work_dir):
+    output_file = "stockdata/[2330] 2025-01-06-2025-01-17.csv"
+    os.makedirs("stockdata")
+    with open(output_file, "w", encoding="utf-8", newline="") as f:
+        f.write("日期,股票代碼,收盤價\r\n")
+        # 中間的內容不需要是有效的 CSV，只讀取標題行與文件結尾
+        f.write('"unterminated quote\r\n' * 5000)
+        f.write("2025-01-17,2330,100\r\n\r\n")
+
+    assert fetch.read_csv_tail_line(output_file) == ("2025-01-17,2330,100", "\r\n")
+    assert fetch.get_last_stored_date(output_file) == "2025-01-17"
+    assert fetch.is_file_complete_with_end_date(output_file, "2025-01-17")
+    assert not fetch.is_file_complete_with_end_date(output_file, "2025-01-20")
+    assert not fetch.is_file_complete_with_end_date("stockdata/missing.csv", "2025-01-17")
+
+
+def test_tail_line_longer_than_the_chunk_is_not_trusted(fetch, work_dir):
+    with open("long.csv", "w", encoding="utf-8", newline="\n") as f:
+        f.write("日期,備註\n" + "2025-01-17," + "x" * 100 + "\n")
+    assert fetch.read_csv_tail_line("long.csv", chunk_size=50) == (None, "\n")
+    assert fetch.read_csv_tail_line("long.csv")[0].startswith("2025-01-17,")
+
+
+def test_bulk_price_refresh_appends_rows_and_falls_back_outside_the_universe(fetch, stub, work_dir):
+    spec = fetch.get_dataset("TaiwanStockPrice")
+    windows = [("2330", "2025-01-06", "2025-01-17"), ("2317", "2025-01-06", "2025-01-17"),
+               ("9999", "2025-01-06", "2025-01-17")]
+    complete = {}
+    for stock_id, start_date, end_date in windows:
+        output_file = spec.output_file(stock_id, start_date, end_date)
+        assert fetch.fetch_and_save_dataset(spec, "token", stock_id, start_date, end_date, output_file)
+        with open(output_file, "rb") as f:
+            complete[output_file] = f.read()
+        truncate_lines(output_file, 4)
+    stub.request_count = 0
+
+    handled = fetch.fetch_and_save_stock_data_bulk("token", windows, max_days=10)
+    # 2025-01-09 至 2025-01-17 共七個平日，每日一次全市場查詢
+    assert stub.request_count == 7
+    assert handled == {spec.output_file(*window) for window in windows[:2]}
+    for output_file in handled:
+        with open(output_file, "rb") as f:
+            assert f.read() == complete[output_file]
+    # 9999 不在全市場回應中，文件維持原樣交由逐股請求
+    assert fetch.get_last_stored_date(spec.output_file(*windows[2]), spec.header) == "2025-01-08"
+    assert fetch.fetch_and_save_stock_data_bulk("token", windows[:2], max_days=10) == set()
+
+
+def test_stock_info_snapshot_is_reused_within_the_ttl(fetch, stub, work_dir, monkeypatch):
+    monkeypatch.setenv("FINDMIND_MAX_RETRIES", "0")
+    spec = fetch.get_dataset("TaiwanStockInfo")
+    snapshot = fetch.get_dataset_snapshot(spec, "token")
+    assert sorted(snapshot) == ["1240", "2317", "2330"]
+    assert os.path.exists(spec.snapshot_file)
+    assert fetch.get_dataset_snapshot(spec, "token") is snapshot
+    assert stub.request_count == 1
+
+    # 下一次執行 (例如由 actions/cache 還原快照) 在有效期內不再請求
+    assert load_script("FindMind-fetch_and_save_stock_data.py").get_dataset_snapshot(spec, "token") == snapshot
+    assert stub.request_count == 1
+
+    # 過期後重新請求；請求失敗時退回過期的快照
+    monkeypatch.setenv("FINDMIND_STOCK_INFO_TTL", "0")
+    stub.error_rate = 1.0
+    assert load_script("FindMind-fetch_and_save_stock_data.py").get_dataset_snapshot(spec, "token") == snapshot
+    assert stub.request_count == 2
+
+
+def test_merge_date_ranges_coalesces_overlapping_and_adjacent_ranges(fetch):
+    assert fetch.merge_date_ranges([
+        ("2025-01-13", "2025-01-24"), ("2025-01-06", "2025-01-17"),
+        ("2025-01-25", "2025-01-31"), ("2025-02-03", "2025-02-07"), ("2025-02-04", "2025-02-05"),
+    ]) == [("2025-01-06", "2025-01-31"), ("2025-02-03", "2025-02-07")]
+    assert fetch.merge_date_ranges([]) == []
+
+
+def test_overlapping_windows_share_one_merged_request(fetch, stub, work_dir):
+    fetch.register_coalesced_ranges(ROWS)
+    assert fetch.coalesced_ranges[("TaiwanStockPrice", "2330")] == [("2025-01-06", "2025-01-24")]
+    # 2317 只有一個期間，不需要合併
+    assert ("TaiwanStockPrice", "2317") not in fetch.coalesced_ranges
+
+    params = {"dataset": "TaiwanStockPrice", "data_id": "2330", "token": "token"}
+    first = fetch.request_dataset(dict(params, start_date="2025-01-06", end_date="2025-01-17"))
+    second = fetch.request_dataset(dict(params, start_date="2025-01-13", end_date="2025-01-24"))
+    assert stub.request_count == 1
+    assert (first["data"][0]["date"], first["data"][-1]["date"]) == ("2025-01-06", "2025-01-17")
+    assert (second["data"][0]["date"], second["data"][-1]["date"]) == ("2025-01-13", "2025-01-24")
+
+
+def test_coalescing_starts_from_each_file_missing_tail(fetch, stub, work_dir):
+    spec = fetch.get_dataset("TaiwanStockPrice")
+    assert fetch.fetch_and_save_dataset(spec, "token", *ROWS[0], spec.output_file(*ROWS[0]))
+    fetch.register_coalesced_ranges(ROWS)
+    # 第一個文件已完整，只剩下第二個期間，不需要合併
+    assert ("TaiwanStockPrice", "2330") not in fetch.coalesced_ranges
+
+
+def test_asyncio_backend_matches_threads(fetch, stub, work_dir, monkeypatch):
+    monkeypatch.setenv("FINDMIND_ASYNC_CONCURRENCY", "4")
+    requests_by_mode = {}
+    for mode in ("threads", "asyncio"):
+        os.makedirs(work_dir / mode)
+        monkeypatch.chdir(work_dir / mode)
+        before = stub.request_count
+        # 每種後端都從空的快照與合併結果開始
+        fetch.dataset_snapshots.clear()
+        fetch.register_coalesced_ranges(ROWS)
+        if mode == "threads":
+            fetch.process_rows_concurrently("token", ROWS, max_workers=4)
+        else:
+            fetch.process_rows_async("token", ROWS)
+        requests_by_mode[mode] = stub.request_count - before
+
+    threads, asyncio_tree = read_tree(work_dir / "threads"), read_tree(work_dir / "asyncio")
+    assert "stockdata/[2330] 2025-01-13-2025-01-24.csv" in asyncio_tree
+    assert asyncio_tree == threads
+    # 合併範圍在兩種後端都只請求一次
+    assert requests_by_mode["asyncio"] == requests_by_mode["threads"]
+
+
+def test_interval_limiter_spaces_job_starts(fetch):
+    async def start_jobs(limiter, count):
+        loop = asyncio.get_running_loop()
+        started = []
+        for _ in range(count):
+            await limiter.acquire()
+            started.append(loop.time())
+        return started
+
+    started = asyncio.run(start_jobs(fetch.IntervalLimiter(2, 0.2), 3))
+    assert started[1] - started[0] < 0.1
+    assert started[2] - started[0] >= 0.19
+    assert len(asyncio.run(start_jobs(fetch.IntervalLimiter(0, 60), 5))) == 5
+
+
+def test_auction_sheet_is_downloaded_conditionally(fetch, stub, work_dir, capsys):
+    sheet = work_dir / "sheet.csv"
+    sheet.write_text("股票代號,DateStart,DateEnd\n2330,2025/01/06,2025/01/17\n", encoding="utf-8")
+    stub.sheet_file = str(sheet)
+    url = os.environ["FINDMIND_SHEET_URL"]
+
+    assert fetch.download_google_sheet(url, "auction_data.csv")
+    with open("auction_data.csv", "rb") as f:
+        assert f.read() == sheet.read_bytes()
+    assert fetch.load_sheet_state()["etag"]
+
+    # 上次的 ETag 隨狀態文件保存 (工作流程會提交這個文件)，沒有變更時伺服器回傳 304
+    capsys.readouterr()
+    assert not fetch.download_google_sheet(url, "auction_data.csv")
+    assert "not modified" in capsys.readouterr().out
+
+    sheet.write_text("股票代號,DateStart,DateEnd\n2317,2025/01/06,2025/01/17\n", encoding="utf-8")
+    assert fetch.download_google_sheet(url, "auction_data.csv")
+    with open("auction_data.csv", "rb") as f:
+        assert f.read() == sheet.read_bytes()
+
+
+def test_priority_run_stays_within_the_call_budget(fetch, stub, work_dir, monkeypatch):
+    monkeypatch.setenv("FINDMIND_BUDGET_CALLS", "4")
+    # 本次執行先前已用掉一個請求 (例如市場指數)，預算包含這一個
+    calls_before = len(fetch.get_client().get_latencies()) - 1
+    deferred = fetch.run_prioritized_jobs("token", ROWS[:2], max_workers=2, calls_before=calls_before)
+    assert stub.request_count <= 3
+    # 公司基本資料由快照提供，不會被延後
+    assert deferred and "TaiwanStockInfo" not in {dataset for _, dataset, _ in deferred}
+    assert all(not os.path.exists(output_file) for _, _, output_file in deferred)
+
+    # 下次執行 (不限預算) 只補上延後的任務，每個任務一次請求
+    before = stub.request_count
+    monkeypatch.setenv("FINDMIND_BUDGET_CALLS", "0")
+    assert fetch.run_prioritized_jobs("token", ROWS[:2], max_workers=2) == []
+    assert stub.request_count - before == len(deferred)
+
+
+def test_missing_files_score_above_complete_ones(fetch, stub, work_dir):
+    spec = fetch.get_dataset("TaiwanStockPrice")
+    complete_job, missing_job = (
+        (spec.output_file(*row), fetch.fetch_and_save_dataset, (spec, "token", *row, spec.output_file(*row)))
+        for row in ROWS[:2])
+    assert fetch.fetch_and_save_dataset(*complete_job[2])
+    assert fetch.score_fetch_job("2025-01-17", complete_job)[:2] == (0.0, 0)
+    score, expected_calls, dataset = fetch.score_fetch_job("2025-01-17", missing_job)
+    assert (score, expected_calls, dataset) == (spec.weight, 1, "TaiwanStockPrice")
+
+
+def test_checkpoint_resumes_only_matching_windows(fetch, work_dir):
+    closed = "stockdata/[2330] 2025-01-06-2025-01-17.csv"
+    open_window = "stockdata/[2330] 2025-01-06-2999-12-31.csv"
+    os.makedirs("stockdata")
+    for output_file in (closed, open_window):
+        with open(output_file, "w", encoding="utf-8") as f:
+            f.write("date\n")
+
+    assert fetch.start_checkpoint(ROWS) == 0
+    fetch.record_checkpoint(closed)
+    # 尚未結束的期間每次都要重新檢查，不寫入檢查點
+    fetch.record_checkpoint(open_window)
+    with open(fetch.CHECKPOINT_FILE, "a", encoding="utf-8") as f:
+        f.write('{"output_file": "stockdata/[2317] 2025')
+    # 中斷後以相同的期間重新執行：寫到一半的最後一行被忽略
+    assert fetch.start_checkpoint(ROWS) == 1
+    assert fetch.checkpoint_done == {closed}
+    assert fetch.run_fetch_job((closed, None, ())) is None
+
+    assert fetch.start_checkpoint(ROWS[:2]) == 0
+    fetch.finish_checkpoint()
+    assert not os.path.exists(fetch.CHECKPOINT_FILE)
+
+
+class FailingFrame:
+    def to_csv(self, *args, **kwargs):
+        raise OSError("disk full")
+
+
+def test_failed_writes_keep_the_original_file(fetch, work_dir):
+    with open("data.csv", "w", encoding="utf-8", newline="") as f:
+        f.write("date,close\r\n2025-01-06,1\r\n")
+    with pytest.raises(OSError):
+        fetch.append_csv_frame("data.csv", FailingFrame())
+    with pytest.raises(RuntimeError):
+        with fetch.open_atomic("data.csv") as f:
+            f.write("date\n")
+            raise RuntimeError("interrupted")
+    assert sorted(os.listdir()) == ["data.csv"]
+    with open("data.csv", encoding="utf-8", newline="") as f:
+        assert f.read() == "date,close\r\n2025-01-06,1\r\n"
@@ -0,0 +1,69 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+fetch_manifest.py 的測試
+"""
+import json
+import os
+
+from fetch_manifest import FetchManifest, PayloadHasher, hash_payload, open_manifest
+
+RECORDS = [{"date": "2025-01-06", "stock_id": "2330", "close": 100.5}, {"date": "2025-01-07", "stock_id": "2330"}]
+
+
+def test_record_keeps_fields_that_are_not_updated(work_dir):
+    manifest = FetchManifest("manifest.sqlite")
+    manifest.record("TaiwanStockPrice", 2330, "2025-01-06", "2025-01-17", output_file="stockdata/a.csv",
+                    records=RECORDS, last_data_date="2025-01-07", row_count=2, http_status=200)
+    manifest.record("TaiwanStockPrice", "2330", "2025-01-06", "2025-01-17", http_status=402)
+    entry = manifest.lookup("TaiwanStockPrice", "2330", "2025-01-06", "2025-01-17")
+    assert entry["row_count"] == 2
+    assert entry["last_data_date"] == "2025-01-07"
+    assert entry["payload_hash"] == hash_payload(RECORDS)
+    assert entry["http_status"] == 402
+    manifest.close()
+
+
+def test_payload_hasher_matches_hash_payload():
+    hasher = PayloadHasher()
+    for record in RECORDS:
+        hasher.update(record)
+    assert hasher.hexdigest() == hash_payload(RECORDS)
+
+
+def test_export_is_sorted_text_and_rebuilds_the_database(work_dir):
+    manifest = FetchManifest("manifest.sqlite")
+    manifest.record("TaiwanStockPrice", "2330", "2025-02-03", "2025-02-14", row_count=9)
+    manifest.record("TaiwanStockDividend", "2330", "2025-01-06", "2025-01-17", row_count=1)
+    manifest.record("TaiwanStockPrice", "1240", "2025-01-06", "2025-01-17", row_count=10, http_status=200)
+    assert manifest.export() == 3
+    manifest.close()
+    with open("manifest.jsonl", "rb") as f:
+        exported = f.read()
+    lines = [json.loads(line) for line in exported.decode("utf-8").splitlines()]
+    assert [(line["dataset"], line["stock_id"]) for line in lines] == [
+        ("TaiwanStockDividend", "2330"), ("TaiwanStockPrice", "1240"), ("TaiwanStockPrice", "2330")]
+
+    # 全新的工作目錄只有匯出文件：開啟時重建數據庫，再次匯出的內容完全相同
+    os.remove("manifest.sqlite")
+    rebuilt = open_manifest("manifest.sqlite")
+    assert rebuilt.lookup("TaiwanStockPrice", "1240", "2025-01-06", "2025-01-17")["row_count"] == 10
+    rebuilt.export()
+    rebuilt.close()
+    with open("manifest.jsonl", "rb") as f:
+        assert f.read() == exported
+
+
+def test_import_keeps_the_newer_entry(work_dir):
+    key = ("TaiwanStockPrice", "2330", "2025-01-06", "2025-01-17")
+    entry = dict(zip(("dataset", "stock_id", "start_date", "end_date"), key))
+    with open("manifest.jsonl", "w", encoding="utf-8") as f:
+        f.write(json.dumps(dict(entry, fetched_at="2025-01-20T00:00:00", row_count=5)) + "\n")
+    manifest = FetchManifest("manifest.sqlite")
+    assert manifest.lookup(*key)["row_count"] == 5
+
+    manifest.record(*key, row_count=10)
+    manifest.import_export()
+    assert manifest.lookup(*key)["row_count"] == 10
+    manifest.close()
+    assert open_manifest("missing.sqlite") is None
@@ -0,0 +1,81 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+file_index.py 的測試：股票代碼 -> [(開始日期, 結束日期, 文件路徑)] 的索引與修改時間失效的快取文件
+"""
+import json
+import os
+
+import pytest
+
+import file_index
+from file_index import get_file_index
+
+FILES = [
+    "[2330] 2025-01-06-2025-01-17-dividend.csv",
+    "[2330] 2024-01-01-2024-12-31-dividend.csv",
+    "[2317] 2025-01-06-2025-01-17-dividend.csv",
+    "[2330] 2025-01-06-2025-01-17-PER.csv",
+    "notes.txt",
+]
+
+
+def write_files(directory, file_names):
+    os.makedirs(directory, exist_ok=True)
+    for file_name in file_names:
+        with open(os.path.join(directory, file_name), "w", encoding="utf-8") as f:
+            f.write("日期\n")
+
+
+def reset_process_index():
+    """模擬新的程序：清除同一程序內的索引，只保留快取文件"""
+    file_index._directories.clear()
+    file_index._indexes.clear()
+
+
+def test_index_maps_stock_ids_to_sorted_windows(work_dir):
+    write_files("dividend", FILES)
+    index = get_file_index("dividend", "-dividend.csv")
+    # 不符合後綴或文件名格式的文件不列入，同一股票依文件名排序
+    assert index == {
+        "2330": [("2024-01-01", "2024-12-31", os.path.join("dividend", FILES[1])),
+                 ("2025-01-06", "2025-01-17", os.path.join("dividend", FILES[0]))],
+        "2317": [("2025-01-06", "2025-01-17", os.path.join("dividend", FILES[2]))],
+    }
+    assert get_file_index("dividend", "-dividend.csv") is index
+    assert list(get_file_index("dividend", "-PER.csv")) == ["2330"]
+    assert get_file_index("missing") == {}
+
+
+def test_cache_file_is_reused_until_the_directory_changes(work_dir, monkeypatch):
+    monkeypatch.setenv("FINDMIND_FILE_INDEX_CACHE", ".file_index.json")
+    write_files("dividend", FILES)
+    get_file_index("dividend", "-dividend.csv")
+    with open(".file_index.json", encoding="utf-8") as f:
+        cache = json.load(f)
+    assert len(cache["directories"]["dividend"]["files"]) == 4
+
+    # 目錄未變更：下次執行直接使用快取，不再列出目錄
+    reset_process_index()
+    scan_directory = file_index.scan_directory
+    monkeypatch.setattr(file_index, "scan_directory", lambda directory: pytest.fail("不應重新列出目錄"))
+    assert len(get_file_index("dividend", "-dividend.csv")["2330"]) == 2
+
+    # 新增文件改變目錄的修改時間，快取過期後重新列出
+    write_files("dividend", ["[2330] 2026-01-05-2026-01-16-dividend.csv"])
+    mtime = os.stat("dividend").st_mtime_ns + 1_000_000_000
+    os.utime("dividend", ns=(mtime, mtime))
+    reset_process_index()
+    monkeypatch.setattr(file_index, "scan_directory", scan_directory)
+    assert [window[0] for window in get_file_index("dividend", "-dividend.csv")["2330"]] == [
+        "2024-01-01", "2025-01-06", "2026-01-05"]
+    with open(".file_index.json", encoding="utf-8") as f:
+        assert len(json.load(f)["directories"]["dividend"]["files"]) == 5
+
+
+def test_empty_cache_path_disables_the_cache_file(work_dir):
+    # work_dir 將 FINDMIND_FILE_INDEX_CACHE 設為空字串
+    write_files("dividend", FILES)
+    assert "2317" in get_file_index("dividend", "-dividend.csv")
+    assert not os.path.exists(".file_index.json")
+    assert file_index.load_index_cache("", "dividend", None) is None
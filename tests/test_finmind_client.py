@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+finmind_client.py 的測試，請求由替身伺服器 (finmind_stub_server.py) 回應
+"""
+import json
+import os
+
+import pytest
+import requests
+
+from finmind_client import CircuitBreaker, FinMindClient, JsonRecordStream, QuotaExceededError, TokenBucket, get_client
+
+PRICE_PARAMS = {"dataset": "TaiwanStockPrice", "data_id": "2330", "start_date": "2025-01-06",
+                "end_date": "2025-01-10", "token": "token"}
+
+
+def test_shared_client_reuses_one_keep_alive_connection(stub, monkeypatch):
+    monkeypatch.setenv("FINDMIND_POOL_SIZE", "4")
+    client = get_client()
+    assert get_client() is client
+
+    for day in ("2025-01-06", "2025-01-07", "2025-01-08"):
+        data = client.get_data(dict(PRICE_PARAMS, start_date=day, end_date=day))
+        assert data["msg"] == "success"
+        assert [record["date"] for record in data["data"]] == [day]
+
+    pool_manager = client.session.get_adapter(os.environ["FINDMIND_API_URL"]).poolmanager
+    pools = [pool_manager.pools[key] for key in pool_manager.pools.keys()]
+    # 三次請求共用同一個連線池中的同一條連線
+    assert len(pools) == 1
+    assert pools[0].pool.maxsize == 4
+    assert pools[0].num_connections == 1
+    assert stub.request_count == 3
+    assert len(client.get_latencies()) == 3
+    assert client.get_last_status() == 200
+
+
+def test_default_pool_covers_concurrent_workers(work_dir, monkeypatch):
+    assert FinMindClient().session.get_adapter("https://").poolmanager.connection_pool_kw["maxsize"] == 10
+    monkeypatch.setenv("FINDMIND_MAX_WORKERS", "16")
+    assert FinMindClient().session.get_adapter("https://").poolmanager.connection_pool_kw["maxsize"] == 16
+
+
+def test_token_bucket_allows_the_burst_then_waits_for_refill():
+    bucket = TokenBucket(rate_per_hour=3600, burst=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    # 每秒補充一個令牌，第三個請求需要等待約一秒
+    assert 0.9 < bucket.reserve() <= 1.0
+    assert TokenBucket(rate_per_hour=0, burst=1).reserve() == 0
+
+
+def test_server_errors_are_retried_then_raised(stub, monkeypatch):
+    monkeypatch.setenv("FINDMIND_MAX_RETRIES", "2")
+    stub.error_rate = 1.0
+    with pytest.raises(requests.HTTPError):
+        get_client().get_data(PRICE_PARAMS)
+    assert stub.request_count == 3
+    assert get_client().get_last_status() == 500
+
+
+def test_quota_errors_open_the_circuit(stub, monkeypatch):
+    monkeypatch.setenv("FINDMIND_QUOTA_FAILURES", "2")
+    monkeypatch.setenv("FINDMIND_QUOTA_COOLDOWN", "60")
+    monkeypatch.setenv("FINDMIND_QUOTA_MAX_PAUSE", "1")
+    stub.quota_rate = 1.0
+    # 兩次 402 後熔斷 60 秒，超過願意等待的 1 秒，不再發出請求
+    with pytest.raises(QuotaExceededError):
+        get_client().get_data(PRICE_PARAMS)
+    assert stub.request_count == 2
+
+
+def test_circuit_breaker_closes_after_a_success():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60, max_pause=1)
+    breaker.record_quota_failure()
+    breaker.record_success()
+    breaker.record_quota_failure()
+    assert breaker.get_pause() == 0
+
+
+def test_retry_after_header_takes_precedence(work_dir):
+    client = FinMindClient(cache=False)
+    assert client.get_retry_delay(0, "HTTP 429", retry_after="0.5") == 0.5
+    assert client.get_retry_delay(0, "HTTP 429", retry_after="3600") == client.backoff_max
+    assert 0 <= client.get_retry_delay(3, "HTTP 500") <= min(client.backoff_max, client.backoff_base * 8)
+
+
+STREAM_RECORDS = [
+    {"date": "2025-01-06", "stock_id": "2330", "close": 1075.0, "spread": -12.5, "Trading_Volume": 31415926},
+    {"date": "2025-01-07", "stock_id": "2330", "origin_name": "基本每股盈餘（元）", "note": "a \\\"}, ] {", "value": 1e-3},
+    {"date": "2025-01-08", "stock_id": "2330", "nested": {"data": [1, 2]}, "flag": None},
+]
+STREAM_BODY = json.dumps({"msg": "success", "status": 200, "data": STREAM_RECORDS}, ensure_ascii=False,
+                         indent=1).encode("utf-8")
+
+
+def parse_chunks(chunks):
+    parser = JsonRecordStream(chunks)
+    return list(parser), parser.fields
+
+
+def test_record_stream_handles_every_chunk_boundary():
+    # 在每個位元組切開 (包括多位元組 UTF-8 字元與數字的中間)
+    for split in range(len(STREAM_BODY) + 1):
+        records, fields = parse_chunks([STREAM_BODY[:split], STREAM_BODY[split:]])
+        assert records == STREAM_RECORDS, split
+        assert fields == {"msg": "success", "status": 200}
+    records, _ = parse_chunks(STREAM_BODY[i:i + 1] for i in range(len(STREAM_BODY)))
+    assert records == STREAM_RECORDS
+
+
+def test_record_stream_reads_fields_after_the_data_and_rejects_truncation():
+    body = json.dumps({"data": [], "status": 402, "msg": "Requests reach the upper limit."}).encode("utf-8")
+    assert parse_chunks([body]) == ([], {"status": 402, "msg": "Requests reach the upper limit."})
+    with pytest.raises(ValueError):
+        parse_chunks([STREAM_BODY[:-40]])
+
+
+def test_stream_data_matches_get_data(stub):
+    client = get_client()
+    params = dict(PRICE_PARAMS, end_date="2025-01-31")
+    streamed = client.stream_data(params)
+    assert list(streamed) == client.get_data(params)["data"]
+    assert (streamed.msg, streamed.status) == ("success", 200)
@@ -0,0 +1,53 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+finmind_stub_server.py 與 FindMind-benchmark.py 的測試
+"""
+import os
+
+import requests
+
+from conftest import load_script
+from finmind_stub_server import synth_response
+from response_cache import ResponseCache
+
+PRICE_PARAMS = {"dataset": "TaiwanStockPrice", "data_id": "2330", "start_date": "2025-01-03",
+                "end_date": "2025-01-07", "token": "token"}
+
+
+def test_synthetic_data_is_deterministic_weekdays_only():
+    first = synth_response(PRICE_PARAMS, ["2330"])
+    assert first == synth_response(dict(PRICE_PARAMS), ["2330"])
+    # 2025-01-04/05 為週末
+    assert [record["date"] for record in first["data"]] == ["2025-01-03", "2025-01-06", "2025-01-07"]
+    all_market = synth_response(dict(PRICE_PARAMS, data_id=None), ["2330", "2317"])
+    assert all_market["data"][0] == first["data"][0]
+    assert synth_response(dict(PRICE_PARAMS, start_date=None), ["2330"])["status"] == 422
+
+
+def test_stub_serves_replays_and_injects_errors(stub, tmp_path):
+    url = os.environ["FINDMIND_API_URL"]
+    response = requests.get(url, params=PRICE_PARAMS)
+    assert response.status_code == 200
+    assert response.json() == synth_response(PRICE_PARAMS, stub.universe)
+
+    # 快取項目存放的是完整的 API 回應
+    recorded = {"msg": "success", "status": 200, "data": [{"date": "2025-01-03", "stock_id": "2330", "close": 1.0}]}
+    ResponseCache(str(tmp_path / "replay")).put(PRICE_PARAMS, recorded)
+    stub.replay_dir = str(tmp_path / "replay")
+    assert requests.get(url, params=PRICE_PARAMS).json() == recorded
+
+    stub.quota_rate = 1.0
+    assert requests.get(url, params=PRICE_PARAMS).status_code == 402
+    stub.quota_rate, stub.error_rate = 0.0, 1.0
+    assert requests.get(url, params=PRICE_PARAMS).status_code == 500
+    assert stub.request_count == 4
+
+
+def test_benchmark_percentile_uses_nearest_rank():
+    benchmark = load_script("FindMind-benchmark.py")
+    values = [float(value) for value in range(1, 101)]
+    assert benchmark.percentile(values, 0.50) == 50.0
+    assert benchmark.percentile(values, 0.99) == 99.0
+    assert benchmark.percentile([0.2], 0.99) == 0.2
+    assert benchmark.percentile([], 0.5) == 0.0
@@ -0,0 +1,127 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+local_store.py 的測試：匯入再匯出的 CSV 文件與原始文件逐位元組相同
+"""
+import os
+import sqlite3
+
+import pandas as pd
+
+from dataset_registry import get_dataset
+from local_store import LocalStore
+
+PRICE_HEADER = "日期,股票代碼,成交量,成交金額,開盤價,最高價,最低價,收盤價,漲跌幅,交易筆數"
+FINANCIAL_HEADER = "日期,股票代碼,類型,值,名稱"
+PROFILE_HEADER = "行業類別,股票代碼,股票名稱,類型,日期"
+
+# 同一股票重疊的期間在不同日期抓取：較早的文件少了後面的數據，公司基本資料的內容也不同
+TREE = {
+    "stockdata/[6474] 2025-05-07-2025-12-11.csv": "\n".join([
+        PRICE_HEADER,
+        "2025-05-07,6474,2013,66328,31.38,33.0,32.0,33.0,1.57,6",
+        "2025-11-07,6474,8400,325026,38.81,39.5,37.8,39.5,-0.12,26",
+    ]) + "\n",
+    "stockdata/[6474] 2025-05-07-2025-12-15.csv": "\r\n".join([
+        PRICE_HEADER,
+        "2025-05-07,6474,2013,66328,31.38,33.0,32.0,33.0,1.57,6",
+        "2025-11-07,6474,8400,325026,38.81,39.5,37.8,39.5,-0.12,26",
+        "2025-11-11,6474,37601,1450838,38.29,39.5,37.8,39.0,0.3,61",
+        "2025-12-15,6474,30401,1047972,34.7,34.7,34.4,34.5,-0.2,",
+    ]) + "\r\n",
+    "financial/[6474] 2025-05-07-2025-12-11-financial.csv": "\r\n".join([
+        FINANCIAL_HEADER,
+        "2025-06-30,6474,IncomeFromContinuingOperations,40381000.0,繼續營業單位本期淨利（淨損）",
+        "2025-06-30,6474,EPS,0.86,基本每股盈餘（元）",
+    ]) + "\r\n",
+    "financial/[6474] 2025-05-07-2025-12-15-financial.csv": "\r\n".join([
+        FINANCIAL_HEADER,
+        "2025-06-30,6474,IncomeFromContinuingOperations,40381000.0,繼續營業單位本期淨利（淨損）",
+        "2025-06-30,6474,EPS,0.86,基本每股盈餘（元）",
+        "2025-09-30,6474,EPS,0.83,基本每股盈餘（元）",
+        '2025-09-30,6474,Note,,"a, ""quoted"" NA"',
+    ]) + "\r\n",
+    "company-profile/[6474] 2025-05-07-2025-12-11-company-profile.csv":
+        f"{PROFILE_HEADER}\r\n電子通路業,6474,華豫寧,emerging,2025-11-10\r\n",
+    "company-profile/[6474] 2025-05-07-2025-12-12-company-profile.csv":
+        f"{PROFILE_HEADER}\r\n電子通路業,6474,華豫寧,emerging,2025-11-12\r\n",
+    # 手動編輯過、最後一行沒有換行符的文件
+    "company-profile/[6474] 2025-05-07-2025-12-15-company-profile.csv":
+        f"{PROFILE_HEADER}\r\n電子通路業,6474,華豫寧,tpex,2025-12-31\r\n觀光事業,6474,華豫寧,tpex,2025-04-04",
+}
+
+
+def write_tree(base_dir, tree):
+    for output_file, text in tree.items():
+        path = os.path.join(base_dir, output_file)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+
+
+def read_bytes(base_dir, output_file):
+    with open(os.path.join(base_dir, output_file), "rb") as f:
+        return f.read()
+
+
+def test_import_then_export_round_trips_every_file(work_dir):
+    write_tree(work_dir / "source", TREE)
+    store = LocalStore(str(work_dir / "store.sqlite"))
+    assert store.import_files(str(work_dir / "source")) == len(TREE)
+    assert store.export(str(work_dir / "exported")) == len(TREE)
+    for output_file in TREE:
+        assert read_bytes(work_dir / "exported", output_file) == read_bytes(work_dir / "source", output_file), output_file
+
+    # 讀取單一文件只回傳該文件的數據行，不包含重疊期間的其他數據
+    frame = store.read_window("stockdata/[6474] 2025-05-07-2025-12-11.csv")
+    assert frame["日期"].tolist() == ["2025-05-07", "2025-11-07"]
+    assert str(frame["成交量"].dtype) == "Int64"
+    profile = store.read_window("company-profile/[6474] 2025-05-07-2025-12-11-company-profile.csv")
+    assert profile["日期"].tolist() == ["2025-11-10"]
+    # 以主鍵合併的資料表仍可依日期範圍查詢
+    assert len(store.query(get_dataset("TaiwanStockPrice"), "6474", "2025-11-01", "2025-11-30")) == 2
+    store.close()
+
+
+def test_fetched_and_appended_windows_export_like_the_csv(fetch, stub, work_dir, monkeypatch):
+    monkeypatch.setenv("FINDMIND_STORE", str(work_dir / "store.sqlite"))
+    spec = fetch.get_dataset("TaiwanStockPrice")
+    rows = [("2330", "2025-01-06", "2025-01-17"), ("2330", "2025-01-13", "2025-01-24")]
+    for row in rows:
+        assert fetch.fetch_and_save_dataset(spec, "token", *row, spec.output_file(*row))
+    # 模擬上次執行只抓到前三個交易日：文件與數據庫同時截斷，再以增量更新補上尾段
+    store = fetch.get_store()
+    output_file = spec.output_file(*rows[0])
+    with open(output_file, "rb") as f:
+        lines = f.read().splitlines(keepends=True)
+    with open(output_file, "wb") as f:
+        f.writelines(lines[:4])
+    store.record_window(output_file, pd.read_csv(output_file, dtype=str))
+    assert fetch.fetch_and_save_dataset(spec, "token", *rows[0], output_file)
+    assert len(store.read_window(output_file)) == len(lines) - 1
+
+    assert store.export(str(work_dir / "exported")) == 2
+    for row in rows:
+        output_file = spec.output_file(*row)
+        assert read_bytes(work_dir / "exported", output_file) == read_bytes(work_dir, output_file)
+
+
+def test_store_opens_a_database_without_window_rows(work_dir):
+    # 舊版數據庫沒有 window_rows 與換行符欄位，開啟時自動補上，匯出改以日期範圍查詢
+    conn = sqlite3.connect("old.sqlite")
+    conn.execute("CREATE TABLE windows (dataset TEXT NOT NULL, stock_id TEXT NOT NULL, start_date TEXT NOT NULL, "
+                 "end_date TEXT NOT NULL, output_file TEXT NOT NULL, PRIMARY KEY (dataset, stock_id, start_date, end_date))")
+    conn.commit()
+    conn.close()
+    write_tree(work_dir / "source", {output_file: text for output_file, text in TREE.items()
+                                     if output_file.endswith("12-15.csv")})
+    store = LocalStore("old.sqlite")
+    spec = get_dataset("TaiwanStockPrice")
+    output_file = "stockdata/[6474] 2025-05-07-2025-12-15.csv"
+    frame = pd.read_csv(os.path.join(work_dir, "source", output_file), dtype=str)
+    store.upsert_frame(spec, frame)
+    store.record_window(output_file)
+    assert store.windows("TaiwanStockPrice")[0]["newline"] == "\r\n"
+    assert store.export(str(work_dir / "exported"), "TaiwanStockPrice") == 1
+    assert read_bytes(work_dir / "exported", output_file) == read_bytes(work_dir / "source", output_file)
+    store.close()
@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+FindMind-read_stock_data_by_date.py 的測試：腳本在載入時處理工作目錄中的競標數據
+
+股價文件涵蓋 2021-02-01 至 2021-02-26 的交易日，收盤價為 100 + 日期 (2021-02-05 為 105)；
+2021-02-11、2021-02-12 是 workalendar 的農曆新年假日，2021-02-15、2021-02-16 記在 holidays.csv，
+2021-02-23 在範圍內但沒有數據，2021-02-03 有兩筆數據 (使用第一筆)。
+"""
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import load_script
+
+PRICE_HEADER = "日期,股票代碼,成交量,成交金額,開盤價,最高價,最低價,收盤價,漲跌幅,交易筆數"
+PRICE_FILE = "stockdata/[2330] 2021-02-01-2021-02-26.csv"
+TRADING_DAYS = [1, 2, 3, 4, 5, 8, 9, 10, 17, 18, 19, 22, 24, 25, 26]
+
+
+def write_file(path, text):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+
+
+@pytest.fixture
+def run_script(work_dir, monkeypatch):
+    """寫入競標數據、股價文件與 holidays.csv 後執行腳本，回傳 (模組, 輸出的 DataFrame)"""
+    write_file("holidays.csv", '2021-02-15, "農曆春節休市"\n2021-02-16, "農曆春節休市"\n')
+    rows = [f"2021-02-{day:02d},2330,1000,100000,1,1,1,{100 + day},0,10" for day in TRADING_DAYS]
+    rows.insert(3, "2021-02-03,2330,1000,100000,1,1,1,999,0,10")
+    write_file(PRICE_FILE, "\r\n".join([PRICE_HEADER] + rows) + "\r\n")
+    write_file("cleaned_auction_data.csv", "\n".join([
+        "股票代號,DateStart,DateStart+1,DateStart+3,DateStart-1,DateEnd+2,DateEnd",
+        "2330,2021/02/05,,,,,2021/02/19",
+        "9999,2021/02/05,,,,,2021/02/19",
+        "2330,,,,,,2021/02/03",
+        "2330,2021/02/31,,,,,2021/02/10",
+    ]) + "\n")
+
+    def run(**env):
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        module = load_script("FindMind-read_stock_data_by_date.py")
+        output = pd.read_csv("auction_data_processed/updated_cleaned_auction_data.csv", encoding="utf-8-sig",
+                             dtype=str, keep_default_na=False)
+        return module, output
+    return run
+
+
+def test_each_price_file_is_indexed_once(run_script):
+    module, output = run_script()
+    assert list(module.price_history) == [os.path.basename(PRICE_FILE)]
+    history = module.price_history[os.path.basename(PRICE_FILE)]
+    assert history["total_rows"] == len(TRADING_DAYS) + 1
+    assert (str(history["min_date"]), str(history["max_date"])) == ("2021-02-01", "2021-02-26")
+    # 重複日期使用第一筆
+    assert output["DateEnd"].tolist()[2] == "103.0"
+    assert output["資料總數"].tolist() == ["16", "無資料", "16", "16"]
+    # 2021-02-01 至 2021-02-26 的交易日 (已扣除 holidays.csv 的休市日)
+    assert output["總工作天數"].tolist()[0] == "16"
+    assert module.get_security_prices("9999") == (None, None)
+
+
+DATE_COLUMNS = ["DateStart", "DateStart+1", "DateStart+3", "DateStart-1", "DateEnd+2", "DateEnd"]
+
+
+def test_offsets_resolve_to_calendar_day_closes(run_script):
+    module, output = run_script()
+    assert module.date_columns["DateStart+3"] == {"base": "DateStart", "offset": 3}
+    assert output[DATE_COLUMNS].values.tolist() == [
+        # 2021-02-06 (週六) 與 2021-02-21 (週日) 沒有收盤價
+        ["105.0", "", "108.0", "104.0", "", "119.0"],
+        # 沒有股價文件
+        ["", "", "", "", "", ""],
+        # 基礎日期為空
+        ["無資料", "無資料", "無資料", "無資料", "105.0", "103.0"],
+        # 無效日期；2021-02-12 為農曆新年假日
+        ["", "", "", "", "", "110.0"],
+    ]
+
+
+@pytest.mark.parametrize("fallback, missing_close", [("none", ""), ("previous", "122.0"), ("next", "124.0")])
+def test_trading_day_offsets_with_nearest_session_fallback(run_script, fallback, missing_close):
+    module, output = run_script(FINDMIND_OFFSET_MODE="trading", FINDMIND_OFFSET_FALLBACK=fallback)
+    assert output[DATE_COLUMNS].values.tolist() == [
+        # 2021-02-05 (週五) +1 為 2021-02-08，+3 跳過 2021-02-11/12 的休市日；
+        # 2021-02-19 +2 為 2021-02-23，在文件範圍內但沒有數據
+        ["105.0", "108.0", "110.0", "104.0", missing_close, "119.0"],
+        ["", "", "", "", "", ""],
+        ["無資料", "無資料", "無資料", "無資料", "105.0", "103.0"],
+        # 2021-02-10 +2 跳過農曆新年與 holidays.csv 的休市日
+        ["", "", "", "", "118.0", "110.0"],
+    ]
+
+    # 基礎日期不是交易日：正偏移從前一個交易日起算，負偏移從下一個交易日起算
+    saturday = pd.Series(pd.to_datetime(["2021-02-06", "2021-02-06", "2021-02-13"]))
+    targets = module.compute_target_dates(saturday, pd.Series([1, -1, 1]))
+    assert targets.dt.strftime("%Y-%m-%d").tolist() == ["2021-02-08", "2021-02-05", "2021-02-17"]
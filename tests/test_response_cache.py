@@ -0,0 +1,78 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+response_cache.py 的測試
+"""
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from response_cache import CacheMissError, ResponseCache, create_response_cache, make_cache_key, parse_ttl_overrides
+
+CLOSED = {"dataset": "TaiwanStockPrice", "data_id": "2330", "start_date": "2025-01-06", "end_date": "2025-01-17"}
+
+
+def age_entry(cache, params, seconds):
+    """把快取項目的寫入時間調早 seconds 秒"""
+    path = cache.get_path(make_cache_key(params))
+    stamp = time.time() - seconds
+    os.utime(path, (stamp, stamp))
+
+
+def test_cache_key_ignores_the_token_and_parameter_order():
+    key = make_cache_key(dict(CLOSED, token="a"))
+    assert key == make_cache_key(dict(reversed(list(CLOSED.items())), token="b"))
+    assert key != make_cache_key(dict(CLOSED, end_date="2025-01-18"))
+
+
+def test_closed_and_open_windows_use_different_ttls(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache"), ttls={"TaiwanStockPrice": 60}, closed_ttl=3600)
+    today = datetime.now().strftime("%Y-%m-%d")
+    open_window = dict(CLOSED, start_date=(datetime.now() - timedelta(days=10)).strftime("%Y-%m-%d"), end_date=today)
+    assert cache.get_ttl(CLOSED) == 3600
+    assert cache.get_ttl(open_window) == 60
+
+    for params in (CLOSED, open_window):
+        cache.put(dict(params, token="secret"), [{"date": params["end_date"]}])
+        assert cache.contains(params)
+        age_entry(cache, params, 120)
+    # 兩分鐘後開放窗口已過期，已結束窗口仍有效
+    assert cache.get(CLOSED) == [{"date": "2025-01-17"}]
+    assert cache.get(open_window) is None
+    assert not cache.contains(open_window)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_offline_mode_replays_expired_entries_and_raises_on_misses(tmp_path):
+    ResponseCache(str(tmp_path), closed_ttl=0).put(CLOSED, [{"date": "2025-01-17"}])
+    offline = ResponseCache(str(tmp_path), closed_ttl=0, offline=True)
+    assert offline.get(CLOSED) == [{"date": "2025-01-17"}]
+    with pytest.raises(CacheMissError):
+        offline.get(dict(CLOSED, data_id="2317"))
+
+
+def test_evicts_the_least_recently_used_entries(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    entries = [dict(CLOSED, data_id=stock_id) for stock_id in ("2330", "2317", "1240")]
+    for index, params in enumerate(entries):
+        cache.put(params, [{"stock_id": params["data_id"]}])
+        path = cache.get_path(make_cache_key(params))
+        os.utime(path, (1000 + index, os.path.getmtime(path)))
+    # 讀取最舊的 2330 後，最久未使用的是 2317
+    cache.get(entries[0])
+    cache.max_bytes = sum(os.path.getsize(cache.get_path(make_cache_key(entries[index]))) for index in (0, 2))
+    cache.evict()
+    assert [cache.contains(params) for params in entries] == [True, False, True]
+
+
+def test_create_response_cache_from_environment(tmp_path, monkeypatch):
+    monkeypatch.setenv("FINDMIND_CACHE", "0")
+    monkeypatch.delenv("FINDMIND_OFFLINE", raising=False)
+    assert create_response_cache() is None
+    monkeypatch.setenv("FINDMIND_CACHE", "1")
+    monkeypatch.setenv("FINDMIND_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("FINDMIND_CACHE_TTL", "TaiwanStockPrice=600, bad")
+    assert create_response_cache().ttls["TaiwanStockPrice"] == 600
+    assert parse_ttl_overrides("TaiwanStockInfo=x") == {}
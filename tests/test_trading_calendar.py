@@ -0,0 +1,54 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+trading_calendar.py 的測試：補行上班的週六不是交易日，週一至週五的國定假日與 holidays.csv 的額外休市日都要扣除。
+
+2021-02-20 (週六) 在 workalendar 是補行上班日，2021-02-11、2021-02-12 是 workalendar 的農曆新年假日，
+2021-02-15、2021-02-16 只記在測試用的 holidays.csv。
+"""
+import os
+import sys
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from trading_calendar import get_trading_calendar  # noqa: E402
+
+MAKE_UP_SATURDAY = "2021-02-20"
+
+
+@pytest.fixture
+def calendar(tmp_path, monkeypatch):
+    holidays_path = tmp_path / "holidays.csv"
+    holidays_path.write_text('2021-02-15, "農曆春節休市"\n2021-02-16, "農曆春節休市"\n', encoding="utf-8")
+    monkeypatch.setenv("FINDMIND_CALENDAR_CACHE", "")
+    return get_trading_calendar(str(holidays_path), first_year=2021, last_year=2021)
+
+
+def test_make_up_saturday_is_not_a_trading_day(calendar):
+    assert not calendar.is_trading_day(MAKE_UP_SATURDAY)
+    # 週末不算休市日 (is_holiday 只標記週一至週五)
+    assert not calendar.is_holiday(MAKE_UP_SATURDAY)
+
+
+def test_weekday_holidays_are_excluded(calendar):
+    for day in ("2021-02-11", "2021-02-12", "2021-02-15", "2021-02-16"):
+        assert not calendar.is_trading_day(day)
+        assert calendar.is_holiday(day)
+    assert calendar.is_trading_day("2021-02-17")
+
+
+def test_count_trading_days_excludes_make_up_saturday(calendar):
+    # 2021-02-08 至 2021-02-22 有 11 個週一至週五，扣除 4 個休市日；舊的逐日迴圈會把 2021-02-20 也算進去 (8 天)
+    assert calendar.count_trading_days("2021-02-08", "2021-02-22") == 7
+    assert calendar.trading_days("2021-02-08", "2021-02-22") == [
+        date(2021, 2, 8), date(2021, 2, 9), date(2021, 2, 10),
+        date(2021, 2, 17), date(2021, 2, 18), date(2021, 2, 19), date(2021, 2, 22),
+    ]
+
+
+def test_offset_skips_make_up_saturday(calendar):
+    assert calendar.offset("2021-02-19", 1) == calendar.offset("2021-02-22", 0)
+    assert str(calendar.offset(MAKE_UP_SATURDAY, 0, roll="forward")) == "2021-02-22"
@@ -0,0 +1,225 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+trading_calendar.py
+
+台灣股市交易日曆：週一至週五，扣除 workalendar 的台灣國定假日與 holidays.csv 的額外休市日。
+兩者只在第一次使用時合併一次，並保存在快取文件 (預設 .trading_calendar.json)，
+holidays.csv 變更或需要的年份超出快取範圍時才重新計算。
+
+交易日判斷、區間交易日數、交易日偏移與交易日列表都以 numpy 的
+busdaycalendar / is_busday / busday_count / busday_offset 進行陣列運算，
+不需要逐日呼叫 workalendar。
+"""
+import csv
+import json
+import os
+import re
+import threading
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from workalendar.asia import Taiwan
+
+DEFAULT_HOLIDAYS_FILE = "holidays.csv"
+DEFAULT_CALENDAR_CACHE = ".trading_calendar.json"
+DEFAULT_FIRST_YEAR = 2010
+
+# 台灣股市只在週一至週五交易 (補行上班的週六不開市)
+WEEKMASK = "1111100"
+
+CACHE_VERSION = 1
+
+
+def to_days(dates):
+    """將日期 (字串、date、Timestamp 或其陣列) 轉換為 numpy datetime64[D]"""
+    if isinstance(dates, (str, date, np.datetime64)):
+        return np.datetime64(pd.Timestamp(dates).date(), "D")
+    return pd.to_datetime(pd.Series(dates)).to_numpy().astype("datetime64[D]")
+
+
+def read_holidays_file(holidays_path=DEFAULT_HOLIDAYS_FILE):
+    """
+    讀取 holidays.csv 的額外休市日 (每行第一欄為 YYYY-MM-DD，其後為說明)
+
+    Returns:
+        set: datetime.date 的集合
+    """
+    holidays = set()
+    with open(holidays_path, "r", encoding="utf-8") as file:
+        for row in csv.reader(file):
+            date_part = row[0].strip() if len(row) > 0 else None
+            match = re.search(r"(\d{4}-\d{2}-\d{2})", date_part or "")
+            if not match:
+                continue
+            parsed = pd.to_datetime(match.group(1), errors="coerce")
+            if pd.notna(parsed):
+                holidays.add(parsed.date())
+    return holidays
+
+
+def compute_market_holidays(first_year, last_year):
+    """以 workalendar 計算週一至週五中的台灣國定假日 (含調整放假日)"""
+    cal = Taiwan()
+    holidays = []
+    current = date(first_year, 1, 1)
+    last = date(last_year, 12, 31)
+    while current <= last:
+        if current.weekday() < 5 and not cal.is_working_day(current):
+            holidays.append(current)
+        current += timedelta(days=1)
+    return holidays
+
+
+class TradingCalendar:
+    """
+    台灣股市交易日曆
+
+    Parameters:
+    - market_holidays: workalendar 的休市日 (週一至週五)
+    - custom_holidays: holidays.csv 的額外休市日
+    - first_year / last_year: market_holidays 涵蓋的年份，範圍之外只排除週末
+    """
+
+    def __init__(self, market_holidays, custom_holidays, first_year, last_year):
+        self.market_holidays = set(market_holidays)
+        self.custom_holidays = set(custom_holidays)
+        self.holidays = self.market_holidays | self.custom_holidays
+        self.first_year = first_year
+        self.last_year = last_year
+        self.busdaycal = np.busdaycalendar(
+            weekmask=WEEKMASK, holidays=np.array(sorted(self.holidays), dtype="datetime64[D]"))
+
+    def covers(self, first_year, last_year):
+        return self.first_year <= first_year and last_year <= self.last_year
+
+    def is_trading_day(self, dates):
+        """是否為交易日 (純量或布林陣列)"""
+        return np.is_busday(to_days(dates), busdaycal=self.busdaycal)
+
+    def is_holiday(self, dates):
+        """是否為週一至週五中的休市日 (國定假日或額外休市日)"""
+        days = to_days(dates)
+        return np.is_busday(days, weekmask=WEEKMASK) & ~np.is_busday(days, busdaycal=self.busdaycal)
+
+    def count_trading_days(self, start_dates, end_dates):
+        """區間內 (包含開始與結束日期) 的交易日數"""
+        return np.busday_count(to_days(start_dates), to_days(end_dates) + np.timedelta64(1, "D"),
+                               busdaycal=self.busdaycal)
+
+    def offset(self, dates, offsets, roll="raise"):
+        """
+        交易日偏移
+
+        Parameters:
+        - dates: 基準日期
+        - offsets: 偏移的交易日數 (可為負數)
+        - roll: 基準日期不是交易日時的處理方式 (numpy busday_offset 的 roll：
+                raise、forward、following、backward、preceding 等)
+        """
+        return np.busday_offset(to_days(dates), offsets, roll=roll, busdaycal=self.busdaycal)
+
+    def trading_days(self, start_date, end_date):
+        """區間內 (包含開始與結束日期) 的所有交易日，回傳 datetime.date 的列表"""
+        days = np.arange(to_days(start_date), to_days(end_date) + np.timedelta64(1, "D"), dtype="datetime64[D]")
+        return days[np.is_busday(days, busdaycal=self.busdaycal)].astype(object).tolist()
+
+
+def get_holidays_signature(holidays_path):
+    """holidays.csv 的修改時間與大小，用於判斷快取是否過期"""
+    if not os.path.exists(holidays_path):
+        return None
+    stat = os.stat(holidays_path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def load_calendar_cache(cache_path, holidays_path, first_year, last_year):
+    """讀取快取的交易日曆，過期或不涵蓋需要的年份時為 None"""
+    if not cache_path or not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        if (cache.get("version") != CACHE_VERSION or cache.get("holidays_file") != holidays_path
+                or cache.get("holidays_signature") != get_holidays_signature(holidays_path)):
+            return None
+        calendar = TradingCalendar(
+            [date.fromisoformat(day) for day in cache["market_holidays"]],
+            [date.fromisoformat(day) for day in cache["custom_holidays"]],
+            cache["first_year"], cache["last_year"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return calendar if calendar.covers(first_year, last_year) else None
+
+
+def save_calendar_cache(cache_path, holidays_path, calendar):
+    """以暫存文件寫入後再以 os.replace 取代，保存合併後的交易日曆"""
+    cache = {
+        "version": CACHE_VERSION,
+        "holidays_file": holidays_path,
+        "holidays_signature": get_holidays_signature(holidays_path),
+        "first_year": calendar.first_year,
+        "last_year": calendar.last_year,
+        "market_holidays": sorted(day.isoformat() for day in calendar.market_holidays),
+        "custom_holidays": sorted(day.isoformat() for day in calendar.custom_holidays),
+    }
+    temp_file = f"{cache_path}.tmp"
+    try:
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(temp_file, cache_path)
+    except OSError as e:
+        print(f"保存交易日曆快取 {cache_path} 時發生錯誤: {e}")
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+
+def build_trading_calendar(holidays_path, first_year, last_year):
+    """合併 workalendar 的國定假日與 holidays.csv 的額外休市日"""
+    custom_holidays = set()
+    if os.path.exists(holidays_path):
+        try:
+            custom_holidays = read_holidays_file(holidays_path)
+            print(f"成功讀取 {holidays_path}，共 {len(custom_holidays)} 個假日")
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            print(f"讀取 {holidays_path} 時發生錯誤: {e}")
+    else:
+        print(f"找不到 {holidays_path}，將不考慮額外假日")
+    if custom_holidays:
+        first_year = min(first_year, min(custom_holidays).year)
+        last_year = max(last_year, max(custom_holidays).year)
+    return TradingCalendar(compute_market_holidays(first_year, last_year), custom_holidays, first_year, last_year)
+
+
+_calendars = {}
+_calendars_lock = threading.Lock()
+
+
+def get_trading_calendar(holidays_path=DEFAULT_HOLIDAYS_FILE, first_year=None, last_year=None):
+    """
+    取得交易日曆 (同一程序內共用)
+
+    快取文件路徑由 FINDMIND_CALENDAR_CACHE 指定 (預設 .trading_calendar.json)，設為空字串時不使用快取。
+
+    Parameters:
+    - holidays_path: 額外休市日文件
+    - first_year / last_year: 至少需要涵蓋的年份，預設為 2010 年至明年
+    """
+    first_year = min(first_year or DEFAULT_FIRST_YEAR, DEFAULT_FIRST_YEAR)
+    last_year = max(last_year or 0, datetime.now().year + 1)
+    cache_path = os.getenv("FINDMIND_CALENDAR_CACHE", DEFAULT_CALENDAR_CACHE)
+    with _calendars_lock:
+        calendar = _calendars.get(holidays_path)
+        if calendar is not None and calendar.covers(first_year, last_year):
+            return calendar
+        if calendar is not None:
+            first_year = min(first_year, calendar.first_year)
+            last_year = max(last_year, calendar.last_year)
+        calendar = load_calendar_cache(cache_path, holidays_path, first_year, last_year)
+        if calendar is None:
+            calendar = build_trading_calendar(holidays_path, first_year, last_year)
+            if cache_path:
+                save_calendar_cache(cache_path, holidays_path, calendar)
+        _calendars[holidays_path] = calendar
+        return calendar